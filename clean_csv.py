@@ -1,79 +1,236 @@
 #!/usr/bin/env python3
+import argparse
+import csv
+import heapq
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+
 import pandas as pd
 
-def clean_csv():
-    # Read the CSV file
-    df = pd.read_csv('food_pref.csv')
-    
-    print(f"📊 Original CSV: {len(df)} rows")
-    print(f"📋 Columns: {list(df.columns)}")
-    
-    # Remove the timestamp column
-    if 'Timestamp' in df.columns:
-        df = df.drop('Timestamp', axis=1)
-        print("🗑️ Removed Timestamp column")
-    
-    # Clean up whitespace in all string columns
-    string_columns = ['Enter Your Name', 'Enter Your College Mail ID', 'Enter Your USN', 'Class', 'What kind of food do you prefer']
-    for col in string_columns:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.strip()
-    
-    # Remove duplicates based on email and USN (students should have unique email and USN)
-    initial_count = len(df)
-    df = df.drop_duplicates(subset=['Enter Your College Mail ID', 'Enter Your USN'], keep='first')
-    removed_duplicates = initial_count - len(df)
-    
-    if removed_duplicates > 0:
-        print(f"🗑️ Removed {removed_duplicates} duplicate entries")
-    
-    # Sort by class and then by name
-    df = df.sort_values(['Class', 'Enter Your Name'])
-    
-    # Save cleaned CSV with a unique filename to avoid conflicts
-    import os
-    import time
-    
-    # Use a timestamped filename to avoid conflicts
-    timestamp = str(int(time.time()))
-    cleaned_filename = f'food_pref_cleaned_{timestamp}.csv'
-    
-    # If the standard filename exists and is a file, try to remove it
-    standard_filename = 'food_pref_cleaned.csv'
-    if os.path.exists(standard_filename) and os.path.isfile(standard_filename):
-        try:
-            os.remove(standard_filename)
-        except:
-            pass  # If we can't remove it, just use the timestamped name
-    
-    # Save the cleaned CSV
-    df.to_csv(cleaned_filename, index=False)
-    
-    # Try to create a symlink or copy to the standard name
-    if not os.path.exists(standard_filename):
-        try:
-            import shutil
-            shutil.copy2(cleaned_filename, standard_filename)
-        except:
-            # If copy fails, just use the timestamped file
-            standard_filename = cleaned_filename
-    
-    print(f"✅ Cleaned CSV saved as: {standard_filename}")
-    print(f"📊 Final count: {len(df)} students")
-    
+import profiling
+
+# Optional: a faster CSV parser for very large exports
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pv
+except ImportError:
+    pa = pv = None
+
+INPUT_FILE = 'food_pref.csv'
+OUTPUT_FILE = 'food_pref_cleaned.csv'
+
+NAME_COLUMN = 'Enter Your Name'
+EMAIL_COLUMN = 'Enter Your College Mail ID'
+USN_COLUMN = 'Enter Your USN'
+CLASS_COLUMN = 'Class'
+FOOD_COLUMN = 'What kind of food do you prefer'
+
+STRING_COLUMNS = [NAME_COLUMN, EMAIL_COLUMN, USN_COLUMN, CLASS_COLUMN, FOOD_COLUMN]
+DEDUPE_COLUMNS = [EMAIL_COLUMN, USN_COLUMN]
+SORT_COLUMNS = [CLASS_COLUMN, NAME_COLUMN]
+DROP_COLUMNS = ['Timestamp']
+
+CHUNK_ROWS = 50_000
+# Above this many rows, sorted runs are spilled to disk and merged
+MAX_ROWS_IN_MEMORY = 500_000
+
+
+def food_category(value):
+    """Collapse a free-text preference into Veg / Non-Veg / Other"""
+    lowered = value.lower()
+    if 'non' in lowered:
+        return 'Non-Veg'
+    if 'veg' in lowered:
+        return 'Veg'
+    return 'Other'
+
+
+def read_header(input_file):
+    with open(input_file, newline='', encoding='utf-8') as f:
+        return next(csv.reader(f))
+
+
+def read_chunks_pandas(input_file, columns, chunk_rows):
+    return pd.read_csv(input_file, usecols=columns, dtype=str, keep_default_na=False,
+                       chunksize=chunk_rows)
+
+
+def read_chunks_pyarrow(input_file, columns, chunk_rows):
+    reader = pv.open_csv(
+        input_file,
+        # Roughly chunk_rows rows per batch for a typical Google Forms row
+        read_options=pv.ReadOptions(block_size=max(chunk_rows * 256, 1 << 20)),
+        convert_options=pv.ConvertOptions(
+            include_columns=columns,
+            column_types={column: pa.string() for column in columns},
+            strings_can_be_null=False,
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def peak_memory_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def write_sorted_run(frame, directory):
+    fd, path = tempfile.mkstemp(suffix='.csv', prefix='.clean-run-', dir=directory)
+    with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+        frame.to_csv(f, index=False, header=False)
+    return path
+
+
+def merge_runs(run_paths, columns, out):
+    """K-way merge of sorted runs; ties keep input order like a stable sort"""
+    key_indexes = [columns.index(column) for column in SORT_COLUMNS]
+    files = [open(path, newline='', encoding='utf-8') for path in run_paths]
+    try:
+        writer = csv.writer(out, lineterminator='\n')
+        rows = heapq.merge(*(csv.reader(f) for f in files),
+                           key=lambda row: tuple(row[i] for i in key_indexes))
+        for row in rows:
+            writer.writerow(row)
+    finally:
+        for f in files:
+            f.close()
+
+
+def clean_csv(input_file=INPUT_FILE, output_file=OUTPUT_FILE, engine='pandas',
+              chunk_rows=CHUNK_ROWS, max_rows_in_memory=MAX_ROWS_IN_MEMORY):
+    started = time.perf_counter()
+
+    header = read_header(input_file)
+    print(f"📋 Columns: {header}")
+
+    missing = [column for column in DEDUPE_COLUMNS + SORT_COLUMNS if column not in header]
+    if missing:
+        print(f"❌ Missing required columns: {missing}")
+        return False
+
+    columns = [column for column in header if column not in DROP_COLUMNS]
+    for column in DROP_COLUMNS:
+        if column in header:
+            print(f"🗑️ Removed {column} column")
+
+    if engine == 'pyarrow' and pv is None:
+        print("⚠️ pyarrow is not installed, falling back to the pandas engine")
+        engine = 'pandas'
+    if engine == 'pyarrow':
+        chunks = read_chunks_pyarrow(input_file, columns, chunk_rows)
+    else:
+        chunks = read_chunks_pandas(input_file, columns, chunk_rows)
+
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    seen = set()
+    food_counts = Counter()
+    buffered = []
+    buffered_rows = 0
+    run_paths = []
+    total_rows = 0
+    kept_rows = 0
+
+    try:
+        for chunk in chunks:
+            total_rows += len(chunk)
+
+            for column in STRING_COLUMNS:
+                if column in chunk.columns:
+                    chunk[column] = chunk[column].str.strip()
+
+            if FOOD_COLUMN in chunk.columns:
+                chunk[FOOD_COLUMN] = chunk[FOOD_COLUMN].astype('category')
+
+            # Students should have a unique email and USN; the key set spans all chunks
+            keys = chunk[EMAIL_COLUMN] + '\x1f' + chunk[USN_COLUMN]
+            fresh = ~keys.duplicated() & ~keys.isin(seen)
+            seen.update(keys[fresh])
+            chunk = chunk[fresh]
+            kept_rows += len(chunk)
+
+            if FOOD_COLUMN in chunk.columns:
+                food_counts.update(chunk[FOOD_COLUMN].value_counts().to_dict())
+
+            buffered.append(chunk)
+            buffered_rows += len(chunk)
+            if buffered_rows >= max_rows_in_memory:
+                run = pd.concat(buffered).sort_values(SORT_COLUMNS, kind='stable')
+                run_paths.append(write_sorted_run(run, output_dir))
+                buffered, buffered_rows = [], 0
+
+        print(f"📊 Original CSV: {total_rows} rows")
+        removed_duplicates = total_rows - kept_rows
+        if removed_duplicates > 0:
+            print(f"🗑️ Removed {removed_duplicates} duplicate entries")
+
+        remaining = (pd.concat(buffered).sort_values(SORT_COLUMNS, kind='stable')
+                     if buffered else pd.DataFrame(columns=columns))
+
+        # One write to a temporary file, then an atomic rename into place
+        fd, tmp_path = tempfile.mkstemp(suffix='.csv', prefix='.food_pref_cleaned-', dir=output_dir)
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as out:
+            if run_paths:
+                print(f"💾 Merging {len(run_paths) + 1} sorted runs from disk")
+                csv.writer(out, lineterminator='\n').writerow(columns)
+                if len(remaining):
+                    run_paths.append(write_sorted_run(remaining, output_dir))
+                merge_runs(run_paths, columns, out)
+            else:
+                remaining.to_csv(out, index=False)
+    finally:
+        for path in run_paths:
+            os.remove(path)
+
+    try:
+        os.replace(tmp_path, output_file)
+    except OSError:
+        # e.g. the target is a read-only bind mount; keep the output next to it
+        fallback = f"{os.path.splitext(output_file)[0]}_{int(time.time())}.csv"
+        os.replace(tmp_path, fallback)
+        output_file = fallback
+
+    print(f"✅ Cleaned CSV saved as: {output_file}")
+    print(f"📊 Final count: {kept_rows} students")
+
     # Show sample of cleaned data
     print(f"\n📋 Sample of cleaned data:")
-    print(df.head().to_string(index=False))
-    
-    # Show statistics
-    veg_count = len(df[df['What kind of food do you prefer'].str.contains('Veg', case=False, na=False) & 
-                     ~df['What kind of food do you prefer'].str.contains('Non', case=False, na=False)])
-    non_veg_count = len(df[df['What kind of food do you prefer'].str.contains('Non', case=False, na=False)])
-    
+    print(pd.read_csv(output_file, dtype=str, keep_default_na=False, nrows=5).to_string(index=False))
+
+    # Each distinct preference is classified once, not once per row
+    categories = Counter()
+    for value, count in food_counts.items():
+        categories[food_category(value)] += count
+
     print(f"\n📈 Food preferences:")
-    print(f"🥗 Vegetarian: {veg_count}")
-    print(f"🍖 Non-Vegetarian: {non_veg_count}")
-    print(f"📊 Total: {len(df)}")
+    print(f"🥗 Vegetarian: {categories['Veg']}")
+    print(f"🍖 Non-Vegetarian: {categories['Non-Veg']}")
+    print(f"📊 Total: {kept_rows}")
+
+    elapsed = time.perf_counter() - started
+    print(f"\n⏱️ Cleaned {total_rows} rows in {elapsed:.2f}s with the {engine} engine "
+          f"(peak memory {peak_memory_mb():.1f} MB)")
+    return True
+
 
 if __name__ == "__main__":
-    clean_csv()
+    profiling.configure_from_argv()
+    parser = argparse.ArgumentParser(description="Clean a Google Forms export for QR code generation")
+    parser.add_argument('input', nargs='?', default=INPUT_FILE, help=f"CSV export (default {INPUT_FILE})")
+    parser.add_argument('--output', default=OUTPUT_FILE, help=f"cleaned CSV (default {OUTPUT_FILE})")
+    parser.add_argument('--engine', choices=['pandas', 'pyarrow'], default='pandas',
+                        help="CSV parser; pyarrow is faster on large exports if installed")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="rows read per chunk")
+    parser.add_argument('--max-rows-in-memory', type=int, default=MAX_ROWS_IN_MEMORY,
+                        help="rows held before sorted runs are spilled to disk")
+    args = parser.parse_args()
+
+    with profiling.stage('clean'):
+        ok = clean_csv(args.input, args.output, args.engine, args.chunk_rows, args.max_rows_in_memory)
+    if not ok:
+        sys.exit(1)
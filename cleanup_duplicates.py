@@ -1,110 +1,195 @@
 #!/usr/bin/env python3
+import argparse
 import os
 import sqlite3
 import json
-from collections import defaultdict
+import time
 
-def cleanup_duplicates():
-    print("🧹 Cleaning up duplicate QR codes and database entries...")
-    
-    # 1. Clean up QR code files (keep only newer ones)
-    qr_dir = 'qr_codes_jpeg'
-    if os.path.exists(qr_dir):
-        files = os.listdir(qr_dir)
-        jpg_files = [f for f in files if f.endswith('.jpg')]
-        
-        # Group files by name pattern (without the unique token part)
-        file_groups = defaultdict(list)
-        for filename in jpg_files:
-            # Extract name pattern (everything before the last underscore and token)
-            parts = filename.split('_')
-            if len(parts) >= 3:
-                # Take all parts except the last one (which is the token)
-                base_name = '_'.join(parts[:-1])
-                file_groups[base_name].append(filename)
-        
-        duplicates_removed = 0
-        for base_name, files_list in file_groups.items():
-            if len(files_list) > 1:
-                # Sort by modification time, keep the newest
-                files_with_time = [(f, os.path.getmtime(os.path.join(qr_dir, f))) for f in files_list]
-                files_with_time.sort(key=lambda x: x[1], reverse=True)
-                
-                # Remove older files
-                for filename, _ in files_with_time[1:]:
-                    file_path = os.path.join(qr_dir, filename)
-                    os.remove(file_path)
-                    duplicates_removed += 1
-                    print(f"  🗑️ Removed duplicate: {filename}")
-        
-        print(f"✅ Removed {duplicates_removed} duplicate QR code files")
-    
-    # 2. Clean up database duplicates
-    db_path = 'database/food_tokens.db'
-    if os.path.exists(db_path):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Find duplicates by name and email
+import profiling
+import qr_store
+
+DB_PATH = 'database/food_tokens.db'
+TOKENS_FILE = os.path.join('qr_codes_jpeg', 'tokens_list.json')
+
+# Each user maps to the lowest id sharing its normalized (name, email, USN)
+DUPLICATE_MAP_SQL = '''
+    CREATE TEMP TABLE duplicate_users AS
+    SELECT id, keep_id
+    FROM (
+        SELECT id,
+               FIRST_VALUE(id) OVER (
+                   PARTITION BY lower(trim(name)),
+                                lower(trim(COALESCE(email, ''))),
+                                upper(trim(COALESCE(usn, '')))
+                   ORDER BY id
+               ) AS keep_id
+        FROM users
+    )
+    WHERE id != keep_id
+'''
+
+
+def dedupe_database(conn, dry_run):
+    """Merge duplicate users in one transaction; returns (removed_users, orphans_removed)"""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('DROP TABLE IF EXISTS temp.duplicate_users')
+        cursor.execute(DUPLICATE_MAP_SQL)
+
+        for name, keep_id, count in cursor.execute('''
+            SELECT u.name, d.keep_id, COUNT(*)
+            FROM duplicate_users d JOIN users u ON u.id = d.keep_id
+            GROUP BY d.keep_id
+        '''):
+            print(f"  🗑️ {count} duplicate entries for: {name} (keeping id {keep_id})")
+
+        # A duplicate that was already scanned means the student has eaten
+        cursor.execute('''
+            UPDATE users
+            SET is_scanned = 1,
+                scanned_at = (
+                    SELECT MIN(u.scanned_at) FROM users u
+                    JOIN duplicate_users d ON d.id = u.id
+                    WHERE d.keep_id = users.id AND u.is_scanned = 1
+                )
+            WHERE (is_scanned = 0 OR is_scanned IS NULL)
+              AND id IN (
+                  SELECT d.keep_id FROM duplicate_users d
+                  JOIN users u ON u.id = d.id WHERE u.is_scanned = 1
+              )
+        ''')
+
+        # Scans recorded against a duplicate move to the row that is kept
         cursor.execute('''
-            SELECT name, email, MIN(id) as keep_id, COUNT(*) as count
-            FROM users 
-            GROUP BY name, email 
-            HAVING count > 1
+            UPDATE scan_history
+            SET user_id = (SELECT keep_id FROM duplicate_users WHERE id = scan_history.user_id)
+            WHERE user_id IN (SELECT id FROM duplicate_users)
         ''')
-        
-        duplicates = cursor.fetchall()
-        total_removed = 0
-        
-        for name, email, keep_id, count in duplicates:
-            # Delete all entries except the one with minimum ID
+
+        has_entitlements = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entitlements'").fetchone()
+        if has_entitlements:
+            # Meal entitlements move too; the earliest redemption of a slot wins
             cursor.execute('''
-                DELETE FROM users 
-                WHERE name = ? AND email = ? AND id != ?
-            ''', (name, email, keep_id))
-            
-            removed = cursor.rowcount
-            total_removed += removed
-            print(f"  🗑️ Removed {removed} duplicate entries for: {name}")
-        
-        conn.commit()
-        
-        # Get final counts
-        cursor.execute('SELECT COUNT(*) FROM users')
-        final_count = cursor.fetchone()[0]
-        
-        print(f"✅ Removed {total_removed} duplicate database entries")
-        print(f"📊 Final user count: {final_count}")
-        
+                INSERT INTO entitlements (user_id, event_id, meal_slot, redeemed_at, counter)
+                SELECT d.keep_id, x.event_id, x.meal_slot, x.redeemed_at, x.counter
+                FROM entitlements x JOIN duplicate_users d ON d.id = x.user_id
+                WHERE true
+                ON CONFLICT (user_id, event_id, meal_slot) DO UPDATE SET
+                    redeemed_at = excluded.redeemed_at,
+                    counter = excluded.counter
+                WHERE excluded.redeemed_at IS NOT NULL
+                  AND (entitlements.redeemed_at IS NULL OR excluded.redeemed_at < entitlements.redeemed_at)
+            ''')
+
+        cursor.execute('DELETE FROM users WHERE id IN (SELECT id FROM duplicate_users)')
+        removed_users = cursor.rowcount
+
+        cursor.execute('''
+            DELETE FROM scan_history
+            WHERE user_id IS NULL OR user_id NOT IN (SELECT id FROM users)
+        ''')
+        orphans_removed = cursor.rowcount
+
+        if has_entitlements:
+            cursor.execute('DELETE FROM entitlements WHERE user_id NOT IN (SELECT id FROM users)')
+
+        # The removed users' cards are left to qr_store's garbage collection
+        cursor.execute('DELETE FROM qr_artifacts WHERE user_id NOT IN (SELECT id FROM users)')
+
+        cursor.execute('DROP TABLE temp.duplicate_users')
+        conn.execute('ROLLBACK' if dry_run else 'COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    return removed_users, orphans_removed
+
+
+def cleanup_duplicates(dry_run=False):
+    print("🧹 Cleaning up duplicate QR codes and database entries...")
+    if dry_run:
+        print("🔍 Dry run: nothing will be changed")
+    timings = {}
+    live_tokens = None
+
+    # 1. Clean up database duplicates
+    if os.path.exists(DB_PATH):
+        started = time.perf_counter()
+        conn = sqlite3.connect(DB_PATH, isolation_level=None)
+        qr_store.ensure_schema(conn)
+
+        removed_users, orphans_removed = dedupe_database(conn, dry_run)
+
+        if dry_run:
+            # Live set as it would be after the merge
+            conn.execute(DUPLICATE_MAP_SQL)
+            live_tokens = {token for (token,) in conn.execute(
+                'SELECT token FROM users WHERE id NOT IN (SELECT id FROM duplicate_users)')}
+        else:
+            live_tokens = {token for (token,) in conn.execute('SELECT token FROM users')}
+        timings['database'] = time.perf_counter() - started
+
+        print(f"✅ {'Would remove' if dry_run else 'Removed'} {removed_users} duplicate database entries")
+        print(f"✅ {'Would remove' if dry_run else 'Removed'} {orphans_removed} orphaned scan_history rows")
+        print(f"📊 Final user count: {len(live_tokens)}")
+
+        # 2. Remove the cards nothing references any more. Identical cards are already
+        # stored once, and recent renders are kept for the grace period
+        started = time.perf_counter()
+        files, removed, freed = qr_store.collect_garbage(conn, dry_run=dry_run)
+        timings['files'] = time.perf_counter() - started
         conn.close()
-    
+        note = ' (duplicates not merged yet, so their cards are still counted as live)' if dry_run else ''
+        print(f"✅ {'Would remove' if dry_run else 'Removed'} {removed} of {files} stored QR files "
+              f"({freed / 1024 / 1024:.1f} MB){note}")
+
     # 3. Update tokens_list.json
-    tokens_file = os.path.join(qr_dir, 'tokens_list.json')
+    tokens_file = TOKENS_FILE
     if os.path.exists(tokens_file):
+        started = time.perf_counter()
         with open(tokens_file, 'r') as f:
             tokens_data = json.load(f)
-        
-        # Remove duplicates based on name and email
+
+        # Keep entries whose token is still live; without a database fall back to name and email
         seen = set()
         unique_tokens = []
-        
+
         for token_info in tokens_data:
-            key = (token_info['name'], token_info['email'])
+            if live_tokens is not None:
+                key = token_info.get('token')
+                if key not in live_tokens:
+                    continue
+            else:
+                key = (token_info['name'], token_info['email'])
             if key not in seen:
                 seen.add(key)
                 unique_tokens.append(token_info)
-        
-        # Save cleaned tokens list
-        with open(tokens_file, 'w') as f:
-            json.dump(unique_tokens, f, indent=2)
-        
+
+        if not dry_run:
+            with open(tokens_file, 'w') as f:
+                json.dump(unique_tokens, f, indent=2)
+        timings['tokens_list'] = time.perf_counter() - started
+
         removed_tokens = len(tokens_data) - len(unique_tokens)
-        print(f"✅ Cleaned tokens_list.json: removed {removed_tokens} duplicate entries")
-    
-    print(f"\n🎉 Cleanup completed!")
-    print(f"   - Unique QR codes ready for distribution")
-    print(f"   - Database cleaned of duplicates")
-    print(f"   - Each student now has exactly one QR code")
+        print(f"✅ {'Would clean' if dry_run else 'Cleaned'} tokens_list.json: {removed_tokens} stale or duplicate entries")
+
+    print(f"\n⏱️ Timing:")
+    for phase, seconds in timings.items():
+        print(f"   {phase}: {seconds * 1000:.1f} ms")
+
+    print(f"\n🎉 Cleanup {'dry run ' if dry_run else ''}completed!")
+    if not dry_run:
+        print(f"   - Unique QR codes ready for distribution")
+        print(f"   - Database cleaned of duplicates")
+        print(f"   - Each student now has exactly one QR code")
+
 
 if __name__ == "__main__":
-    cleanup_duplicates()
+    profiling.configure_from_argv()
+    parser = argparse.ArgumentParser(description="Remove duplicate users, orphaned scans and stale QR code files")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be removed without changing anything")
+    dry_run = parser.parse_args().dry_run
+    with profiling.stage('cleanup'):
+        cleanup_duplicates(dry_run)
@@ -0,0 +1,86 @@
+const cluster = require('cluster');
+
+// Supervise `workerCount` server.js workers sharing one port. Workers that die
+// are replaced; on SIGINT/SIGTERM every worker is asked to shut down gracefully.
+function runPrimary(workerCount, shutdownTimeoutMs) {
+    let shuttingDown = false;
+
+    // Exactly one worker compacts the scan rollups. Worker ids are never reused, so
+    // when the compactor exits the role moves to the oldest worker that is ready.
+    const compactionReady = new Set();
+    let compactor = null;
+    const assignCompactor = () => {
+        if (compactor || shuttingDown) {
+            return;
+        }
+        const candidates = [...compactionReady].filter(w => w.isConnected()).sort((a, b) => a.id - b.id);
+        compactor = candidates[0] || null;
+        if (compactor) {
+            compactor.send({ type: 'rollup-compactor' });
+        }
+    };
+
+    const fork = () => {
+        const worker = cluster.fork();
+
+        worker.on('message', (message) => {
+            if (message && message.type === 'job-update') {
+                // Relay job updates so every worker can answer /api/jobs/:id
+                for (const other of Object.values(cluster.workers)) {
+                    if (other !== worker && other.isConnected()) {
+                        other.send(message);
+                    }
+                }
+            } else if (message && message.type === 'rollup-ready') {
+                compactionReady.add(worker);
+                assignCompactor();
+            }
+        });
+    };
+
+    console.log(`Food Token Scanner primary ${process.pid} starting ${workerCount} workers`);
+    for (let i = 0; i < workerCount; i++) {
+        fork();
+    }
+
+    cluster.on('exit', (worker, code, signal) => {
+        compactionReady.delete(worker);
+        if (compactor === worker) {
+            compactor = null;
+            assignCompactor();
+        }
+        if (shuttingDown) {
+            if (Object.keys(cluster.workers).length === 0) {
+                console.log('All workers stopped');
+                process.exit(0);
+            }
+            return;
+        }
+        console.error(`Worker ${worker.process.pid} exited (${signal || code}), starting a replacement`);
+        fork();
+    });
+
+    const shutdown = (signal) => {
+        if (shuttingDown) {
+            return;
+        }
+        shuttingDown = true;
+        console.log(`${signal} received, stopping workers...`);
+
+        for (const worker of Object.values(cluster.workers)) {
+            worker.process.kill('SIGTERM');
+        }
+
+        setTimeout(() => {
+            console.error('Workers did not stop in time, forcing shutdown');
+            process.exit(1);
+        }, shutdownTimeoutMs + 1000).unref();
+    };
+
+    process.on('SIGINT', () => shutdown('SIGINT'));
+    process.on('SIGTERM', () => shutdown('SIGTERM'));
+}
+
+module.exports = {
+    runPrimary
+};
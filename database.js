@@ -1,61 +1,213 @@
 const sqlite3 = require('sqlite3').verbose();
 const path = require('path');
 
+// Columns that callers may request through getUsersPage() projections.
+const USER_COLUMNS = [
+    'id', 'name', 'email', 'phone', 'food_preference', 'token', 'qr_code_path',
+    'is_scanned', 'scanned_at', 'created_at', 'class_name', 'usn'
+];
+
+// Folds scan_history rows past the high-water mark into per-minute counts.
+// scan_report.py runs the same statements.
+const ROLLUP_SQL = `
+    INSERT INTO scan_rollups (minute, counter, food_preference, scans)
+    SELECT substr(h.scanned_at, 1, 16),
+           COALESCE(h.scanner_info, ''),
+           COALESCE(lower(trim(u.food_preference)), 'unknown'),
+           COUNT(*)
+    FROM scan_history h
+    LEFT JOIN users u ON u.id = h.user_id
+    WHERE h.id > (SELECT COALESCE(MAX(last_rowid), 0) FROM rollup_state WHERE name = 'scan_history')
+    GROUP BY 1, 2, 3
+    ON CONFLICT (minute, counter, food_preference) DO UPDATE SET scans = scans + excluded.scans
+`;
+
+const ROLLUP_STATE_SQL = `
+    INSERT INTO rollup_state (name, last_rowid)
+    SELECT 'scan_history', COALESCE(MAX(id), 0) FROM scan_history WHERE 1
+    ON CONFLICT (name) DO UPDATE SET last_rowid = MAX(last_rowid, excluded.last_rowid)
+`;
+
+const INSERT_HISTORY_SQL =
+    'INSERT INTO scan_history (user_id, scanner_info, scanned_at) VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))';
+
+// Scan history inserts arriving within this many milliseconds are committed in one
+// transaction, so a burst of scans pays for one WAL fsync instead of one each.
+// 0 commits every insert on its own.
+const parsedHistoryBatchMs = parseInt(process.env.SCAN_HISTORY_BATCH_MS, 10);
+const HISTORY_BATCH_MS = Number.isNaN(parsedHistoryBatchMs) ? 2 : parsedHistoryBatchMs;
+const HISTORY_BATCH_MAX = 256;
+
+// Meal slot used when an event is created or scanned without naming one
+const DEFAULT_MEAL_SLOT = 'meal';
+
+function runStatement(stmt, params) {
+    return new Promise((resolve, reject) => {
+        stmt.run(params, function(err) {
+            if (err) {
+                reject(err);
+            } else {
+                resolve(this);
+            }
+        });
+    });
+}
+
 class Database {
     constructor() {
-        this.dbPath = path.join(__dirname, 'database', 'food_tokens.db');
+        this.dbPath = process.env.DB_PATH || path.join(__dirname, 'database', 'food_tokens.db');
         this.db = new sqlite3.Database(this.dbPath);
+        // Cluster workers write to the same file; wait for the lock instead of failing with SQLITE_BUSY
+        this.db.configure('busyTimeout', 5000);
+        this.writeQueue = Promise.resolve();
+        this.upsertStatements = null;
+        this.historyBatchMs = HISTORY_BATCH_MS;
+        this.historyInsert = null;
+        this.pendingHistory = [];
+        this.historyTimer = null;
         this.init();
     }
 
     init() {
-        this.db.run(`
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT,
-                phone TEXT,
-                food_preference TEXT NOT NULL CHECK(food_preference IN ('veg', 'non-veg')),
-                token TEXT UNIQUE NOT NULL,
-                qr_code_path TEXT,
-                is_scanned BOOLEAN DEFAULT 0,
-                scanned_at DATETIME,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                class_name TEXT
-            )
-        `);
+        this.db.serialize(() => {
+            // WAL lets readers in other processes keep going while one of them writes
+            this.db.run('PRAGMA journal_mode = WAL');
+
+            this.db.run(`
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    email TEXT,
+                    phone TEXT,
+                    food_preference TEXT NOT NULL CHECK(food_preference IN ('veg', 'non-veg')),
+                    token TEXT UNIQUE NOT NULL,
+                    qr_code_path TEXT,
+                    is_scanned BOOLEAN DEFAULT 0,
+                    scanned_at DATETIME,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    class_name TEXT
+                )
+            `);
         
-        this.db.run(`
-            ALTER TABLE users ADD COLUMN class_name TEXT
-        `, (err) => {
-            if (err && !err.message.includes('duplicate column name')) {
-                console.error('Error adding class_name column:', err);
-            }
-        });
+            this.db.run(`
+                ALTER TABLE users ADD COLUMN class_name TEXT
+            `, (err) => {
+                if (err && !err.message.includes('duplicate column name')) {
+                    console.error('Error adding class_name column:', err);
+                }
+            });
 
-        this.db.run(`
-            ALTER TABLE users ADD COLUMN usn TEXT
-        `, (err) => {
-            if (err && !err.message.includes('duplicate column name')) {
-                console.error('Error adding usn column:', err);
-            }
-        });
+            this.db.run(`
+                ALTER TABLE users ADD COLUMN usn TEXT
+            `, (err) => {
+                if (err && !err.message.includes('duplicate column name')) {
+                    console.error('Error adding usn column:', err);
+                }
+            });
+
+            // Counter-scoped Idempotency-Key of the scan that redeemed the token,
+            // written by the redeeming UPDATE so any worker or replica can replay it
+            this.db.run(`
+                ALTER TABLE users ADD COLUMN scan_request TEXT
+            `, (err) => {
+                if (err && !err.message.includes('duplicate column name')) {
+                    console.error('Error adding scan_request column:', err);
+                }
+            });
 
-        this.db.run(`
-            CREATE TABLE IF NOT EXISTS scan_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                scanned_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                scanner_info TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        `);
+            this.db.run(`
+                CREATE TABLE IF NOT EXISTS scan_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    scanned_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    scanner_info TEXT,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            `);
+
+            // Per-minute scan counts by counter and food preference, kept current by
+            // compactScanRollups() so analytics never scan the full history
+            this.db.run(`
+                CREATE TABLE IF NOT EXISTS scan_rollups (
+                    minute TEXT NOT NULL,
+                    counter TEXT NOT NULL,
+                    food_preference TEXT NOT NULL,
+                    scans INTEGER NOT NULL,
+                    PRIMARY KEY (minute, counter, food_preference)
+                ) WITHOUT ROWID
+            `);
+
+            this.db.run(`
+                CREATE TABLE IF NOT EXISTS rollup_state (
+                    name TEXT PRIMARY KEY,
+                    last_rowid INTEGER NOT NULL
+                )
+            `);
+
+            // One long-lived token per student; each event grants meal slots that are
+            // redeemed independently, so a new event needs no new cards
+            this.db.run(`
+                CREATE TABLE IF NOT EXISTS events (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            `);
+
+            this.db.run(`
+                CREATE TABLE IF NOT EXISTS entitlements (
+                    user_id INTEGER NOT NULL,
+                    event_id TEXT NOT NULL,
+                    meal_slot TEXT NOT NULL,
+                    redeemed_at DATETIME,
+                    counter TEXT,
+                    PRIMARY KEY (user_id, event_id, meal_slot)
+                ) WITHOUT ROWID
+            `);
+            this.db.run('CREATE INDEX IF NOT EXISTS idx_entitlements_event ON entitlements (event_id, meal_slot)');
+            this.db.run('ALTER TABLE entitlements ADD COLUMN scan_request TEXT', (err) => {
+                if (err && !err.message.includes('duplicate column name')) {
+                    console.error('Error adding scan_request column:', err);
+                }
+            });
+
+            // Which artifact in the content-addressed QR store each user's images are;
+            // `python qr_store.py gc` removes stored files that nothing references
+            this.db.run(`
+                CREATE TABLE IF NOT EXISTS qr_artifacts (
+                    user_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    artifact_key TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, kind)
+                ) WITHOUT ROWID
+            `);
+            this.db.run('CREATE INDEX IF NOT EXISTS idx_qr_artifacts_key ON qr_artifacts (artifact_key)');
+
+            // Duplicate decodes a counter never sent (debounced) or sent and got the
+            // original result back for (replayed)
+            this.db.run(`
+                CREATE TABLE IF NOT EXISTS counter_duplicates (
+                    counter TEXT PRIMARY KEY,
+                    debounced INTEGER NOT NULL DEFAULT 0,
+                    replayed INTEGER NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+            `);
+
+            // Keyset pagination walks this index backwards for the admin user list
+            this.db.run('CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at, id)');
+            this.db.run('CREATE INDEX IF NOT EXISTS idx_users_class_name ON users (class_name)');
+
+            // Lookup keys for USN scans and bulk import upserts
+            this.db.run('CREATE INDEX IF NOT EXISTS idx_users_email ON users (email COLLATE NOCASE)');
+            this.db.run('CREATE INDEX IF NOT EXISTS idx_users_usn ON users (usn COLLATE NOCASE)');
+        });
 
         console.log('Database initialized successfully');
     }
 
     addUser(userData) {
-        return new Promise((resolve, reject) => {
+        return this.queueWrite(() => new Promise((resolve, reject) => {
             const { name, email, phone, food_preference, token, qr_code_path, class_name, usn } = userData;
             const stmt = this.db.prepare(`
                 INSERT INTO users (name, email, phone, food_preference, token, qr_code_path, class_name, usn)
@@ -70,6 +222,109 @@ class Database {
                 }
             });
             stmt.finalize();
+        }));
+    }
+
+    exec(sql) {
+        return new Promise((resolve, reject) => {
+            this.db.exec(sql, (err) => {
+                if (err) {
+                    reject(err);
+                } else {
+                    resolve();
+                }
+            });
+        });
+    }
+
+    run(sql, params = []) {
+        return new Promise((resolve, reject) => {
+            this.db.run(sql, params, function(err) {
+                if (err) {
+                    reject(err);
+                } else {
+                    resolve(this);
+                }
+            });
+        });
+    }
+
+    // Every write waits its turn on the one shared connection. A write issued while
+    // a transaction is open would otherwise run inside it, and a ROLLBACK would
+    // undo a scan the client had already been told succeeded.
+    queueWrite(work) {
+        const result = this.writeQueue.then(work);
+        this.writeQueue = result.catch(() => {});
+        return result;
+    }
+
+    // Autocommit write; resolves to the statement (changes, lastID)
+    write(sql, params = []) {
+        return this.queueWrite(() => this.run(sql, params));
+    }
+
+    // work() must use run()/exec() directly: queued writes would wait for this transaction
+    inTransaction(work) {
+        return this.queueWrite(async () => {
+            await this.exec('BEGIN IMMEDIATE');
+            try {
+                const value = await work();
+                await this.exec('COMMIT');
+                return value;
+            } catch (err) {
+                await this.exec('ROLLBACK').catch(() => {});
+                throw err;
+            }
+        });
+    }
+
+    // Insert or update a chunk of users in one transaction. Existing users are
+    // matched by email or USN so re-uploading a roster keeps their tokens.
+    upsertUsers(users) {
+        if (!this.upsertStatements) {
+            this.upsertStatements = {
+                update: this.db.prepare(`
+                    UPDATE users SET
+                        name = ?,
+                        phone = COALESCE(NULLIF(?, ''), phone),
+                        food_preference = ?,
+                        class_name = COALESCE(NULLIF(?, ''), class_name),
+                        email = COALESCE(NULLIF(?, ''), email),
+                        usn = COALESCE(NULLIF(?, ''), usn)
+                    WHERE (? <> '' AND email = ? COLLATE NOCASE)
+                       OR (? <> '' AND usn = ? COLLATE NOCASE)
+                `),
+                insert: this.db.prepare(`
+                    INSERT INTO users (name, email, phone, food_preference, token, qr_code_path, class_name, usn)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                `)
+            };
+        }
+        const { update, insert } = this.upsertStatements;
+
+        return this.inTransaction(async () => {
+            const counts = { inserted: 0, updated: 0 };
+
+            for (const user of users) {
+                const email = user.email || '';
+                const usn = user.usn || '';
+                const updated = await runStatement(update, [
+                    user.name, user.phone || '', user.food_preference, user.class_name || '', email, usn,
+                    email, email, usn, usn
+                ]);
+
+                if (updated.changes > 0) {
+                    counts.updated++;
+                } else {
+                    await runStatement(insert, [
+                        user.name, email, user.phone || '', user.food_preference,
+                        user.token, user.qr_code_path, user.class_name || null, usn || null
+                    ]);
+                    counts.inserted++;
+                }
+            }
+
+            return counts;
         });
     }
 
@@ -105,32 +360,224 @@ class Database {
         });
     }
 
-    markAsScanned(token) {
+    // Conditional update: resolves to 0 when another request redeemed the token first
+    markAsScanned(token, scanRequest = null) {
+        return this.write(
+            `UPDATE users SET is_scanned = 1, scanned_at = CURRENT_TIMESTAMP, scan_request = ?
+             WHERE token = ? AND (is_scanned = 0 OR is_scanned IS NULL)`,
+            [scanRequest, token]
+        ).then(result => result.changes);
+    }
+
+    // Earliest scan wins: a redemption with an older timestamp replaces a newer one
+    redeemToken(token, scannedAt) {
+        return this.write(
+            `UPDATE users SET is_scanned = 1, scanned_at = ?
+             WHERE token = ? AND (is_scanned = 0 OR is_scanned IS NULL OR scanned_at IS NULL OR scanned_at > ?)`,
+            [scannedAt, token, scannedAt]
+        ).then(result => result.changes);
+    }
+
+    // Resolves to the new row id once the insert is committed, which for a batched
+    // insert is when the whole group commits
+    addScanHistory(userId, scannerInfo = '', scannedAt = null) {
+        const params = [userId, scannerInfo, scannedAt];
+        if (this.historyBatchMs <= 0) {
+            return this.write(INSERT_HISTORY_SQL, params).then(result => result.lastID);
+        }
+
         return new Promise((resolve, reject) => {
-            this.db.run(
-                'UPDATE users SET is_scanned = 1, scanned_at = CURRENT_TIMESTAMP WHERE token = ?',
-                [token],
-                function(err) {
+            this.pendingHistory.push({ params, resolve, reject });
+            if (this.pendingHistory.length >= HISTORY_BATCH_MAX) {
+                this.flushScanHistory();
+            } else if (!this.historyTimer) {
+                this.historyTimer = setTimeout(() => this.flushScanHistory(), this.historyBatchMs);
+            }
+        });
+    }
+
+    // Commits every queued history insert in one transaction. Inserts queued while
+    // it waits for an earlier transaction go into the next group.
+    flushScanHistory() {
+        clearTimeout(this.historyTimer);
+        this.historyTimer = null;
+        const batch = this.pendingHistory;
+        this.pendingHistory = [];
+        if (batch.length === 0) {
+            return Promise.resolve(0);
+        }
+
+        if (!this.historyInsert) {
+            this.historyInsert = this.db.prepare(INSERT_HISTORY_SQL);
+        }
+        return this.inTransaction(async () => {
+            const ids = [];
+            for (const { params } of batch) {
+                ids.push((await runStatement(this.historyInsert, params)).lastID);
+            }
+            return ids;
+        }).then(
+            ids => {
+                batch.forEach((entry, i) => entry.resolve(ids[i]));
+                return ids.length;
+            },
+            err => {
+                batch.forEach(entry => entry.reject(err));
+                return 0;
+            }
+        );
+    }
+
+    // Creates the event (or renames it) and grants each slot to every student, or
+    // one class. Idempotent, so calling it again grants students added since.
+    createEvent(event) {
+        const { id, name, slots = [DEFAULT_MEAL_SLOT], className } = event;
+
+        return this.inTransaction(async () => {
+            await this.run(`
+                INSERT INTO events (id, name) VALUES (?, ?)
+                ON CONFLICT (id) DO UPDATE SET name = excluded.name
+            `, [id, name || id]);
+
+            let granted = 0;
+            for (const slot of slots) {
+                const result = await this.run(`
+                    INSERT INTO entitlements (user_id, event_id, meal_slot)
+                    SELECT id, ?, ? FROM users ${className ? 'WHERE class_name = ?' : 'WHERE true'}
+                    ON CONFLICT (user_id, event_id, meal_slot) DO NOTHING
+                `, className ? [id, slot, className] : [id, slot]);
+                granted += result.changes;
+            }
+            return { event_id: id, slots, granted };
+        });
+    }
+
+    // references: [{ user_id, kind, key }], one transaction for the whole batch
+    recordQRArtifacts(references) {
+        return this.inTransaction(async () => {
+            for (const { user_id: userId, kind, key } of references) {
+                await this.run(`
+                    INSERT INTO qr_artifacts (user_id, kind, artifact_key) VALUES (?, ?, ?)
+                    ON CONFLICT (user_id, kind) DO UPDATE SET
+                        artifact_key = excluded.artifact_key,
+                        created_at = CURRENT_TIMESTAMP
+                    WHERE artifact_key <> excluded.artifact_key
+                `, [userId, kind, key]);
+            }
+            return references.length;
+        });
+    }
+
+    getEvents() {
+        return new Promise((resolve, reject) => {
+            this.db.all(`
+                SELECT e.id AS event_id, e.name, e.created_at, x.meal_slot,
+                       COUNT(x.user_id) AS entitled, COUNT(x.redeemed_at) AS redeemed
+                FROM events e
+                LEFT JOIN entitlements x ON x.event_id = e.id
+                GROUP BY e.id, x.meal_slot
+                ORDER BY e.created_at, e.id, x.meal_slot
+            `, (err, rows) => {
+                if (err) {
+                    reject(err);
+                } else {
+                    resolve(rows);
+                }
+            });
+        });
+    }
+
+    getEntitlement(userId, eventId, mealSlot) {
+        return new Promise((resolve, reject) => {
+            this.db.get(
+                'SELECT redeemed_at, counter, scan_request FROM entitlements WHERE user_id = ? AND event_id = ? AND meal_slot = ?',
+                [userId, eventId, mealSlot],
+                (err, row) => {
                     if (err) {
                         reject(err);
                     } else {
-                        resolve(this.changes);
+                        resolve(row);
                     }
                 }
             );
         });
     }
 
-    addScanHistory(userId, scannerInfo = '') {
+    // Same contract as markAsScanned() / redeemToken() for one meal slot: resolves
+    // to 0 when the student is not entitled or the slot was already redeemed.
+    // With scannedAt (offline sync) the earliest redemption wins.
+    redeemEntitlement(userId, eventId, mealSlot, counter = '', scannedAt = null, scanRequest = null) {
+        return this.write(
+            `UPDATE entitlements SET redeemed_at = COALESCE(?, CURRENT_TIMESTAMP), counter = ?,
+                 scan_request = COALESCE(?, scan_request)
+             WHERE user_id = ? AND event_id = ? AND meal_slot = ?
+               AND (redeemed_at IS NULL OR redeemed_at > ?)`,
+            [scannedAt, counter, scanRequest, userId, eventId, mealSlot, scannedAt]
+        ).then(result => result.changes);
+    }
+
+    countDuplicateScans(counter, counts = {}) {
+        const { debounced = 0, replayed = 0 } = counts;
+        return this.write(`
+            INSERT INTO counter_duplicates (counter, debounced, replayed) VALUES (?, ?, ?)
+            ON CONFLICT (counter) DO UPDATE SET
+                debounced = debounced + excluded.debounced,
+                replayed = replayed + excluded.replayed
+        `, [counter, debounced, replayed]).then(result => result.changes);
+    }
+
+    getDuplicateScanCounts() {
         return new Promise((resolve, reject) => {
-            this.db.run(
-                'INSERT INTO scan_history (user_id, scanner_info) VALUES (?, ?)',
-                [userId, scannerInfo],
-                function(err) {
+            this.db.all(
+                'SELECT counter, debounced, replayed FROM counter_duplicates ORDER BY debounced + replayed DESC, counter',
+                (err, rows) => {
                     if (err) {
                         reject(err);
                     } else {
-                        resolve(this.lastID);
+                        resolve(rows);
+                    }
+                }
+            );
+        });
+    }
+
+    getScanHistoryForUser(userId) {
+        return new Promise((resolve, reject) => {
+            this.db.all(
+                'SELECT id, scanner_info, scanned_at FROM scan_history WHERE user_id = ? ORDER BY scanned_at, id',
+                [userId],
+                (err, rows) => {
+                    if (err) {
+                        reject(err);
+                    } else {
+                        resolve(rows);
+                    }
+                }
+            );
+        });
+    }
+
+    // For an event, only students entitled to the slot are listed and is_scanned
+    // reflects that slot
+    getRosterSnapshot(options = {}) {
+        const { eventId, mealSlot } = options;
+        const sql = eventId
+            ? `SELECT u.token, u.usn, u.name, u.food_preference, u.class_name,
+                      CASE WHEN x.redeemed_at IS NULL THEN 0 ELSE 1 END AS is_scanned
+               FROM entitlements x JOIN users u ON u.id = x.user_id
+               WHERE x.event_id = ? AND x.meal_slot = ?
+               ORDER BY u.id`
+            : 'SELECT token, usn, name, food_preference, class_name, is_scanned FROM users ORDER BY id';
+
+        return new Promise((resolve, reject) => {
+            this.db.all(
+                sql,
+                eventId ? [eventId, mealSlot || DEFAULT_MEAL_SLOT] : [],
+                (err, rows) => {
+                    if (err) {
+                        reject(err);
+                    } else {
+                        resolve(rows);
                     }
                 }
             );
@@ -149,7 +596,127 @@ class Database {
         });
     }
 
-    getScanStats() {
+    getUsersPage(options = {}) {
+        const { columns, className, foodPreference, scanned, search, after, limit = 100 } = options;
+
+        // id and created_at are always selected so the caller can build the next cursor
+        const selected = (columns || USER_COLUMNS).filter(col => USER_COLUMNS.includes(col));
+        for (const col of ['created_at', 'id']) {
+            if (!selected.includes(col)) {
+                selected.unshift(col);
+            }
+        }
+
+        const where = [];
+        const params = [];
+
+        if (className) {
+            where.push('class_name = ?');
+            params.push(className);
+        }
+        if (foodPreference) {
+            where.push('food_preference = ?');
+            params.push(foodPreference);
+        }
+        if (scanned !== undefined) {
+            where.push(scanned ? 'is_scanned = 1' : '(is_scanned = 0 OR is_scanned IS NULL)');
+        }
+        if (search) {
+            const prefix = search.replace(/[\\%_]/g, '\\$&') + '%';
+            where.push("(name LIKE ? ESCAPE '\\' OR usn LIKE ? ESCAPE '\\')");
+            params.push(prefix, prefix);
+        }
+        if (after) {
+            where.push('(created_at < ? OR (created_at = ? AND id < ?))');
+            params.push(after.created_at, after.created_at, after.id);
+        }
+
+        const sql = `
+            SELECT ${selected.join(', ')}
+            FROM users
+            ${where.length ? 'WHERE ' + where.join(' AND ') : ''}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        `;
+        params.push(limit);
+
+        return new Promise((resolve, reject) => {
+            this.db.all(sql, params, (err, rows) => {
+                if (err) {
+                    reject(err);
+                } else {
+                    resolve(rows);
+                }
+            });
+        });
+    }
+
+    // Incremental: only scan_history rows added since the last run are read.
+    // Resolves to the id of the last row now included in the rollups.
+    compactScanRollups() {
+        return this.inTransaction(async () => {
+            await this.exec(ROLLUP_SQL);
+            await this.exec(ROLLUP_STATE_SQL);
+            return new Promise((resolve, reject) => {
+                this.db.get(
+                    "SELECT last_rowid FROM rollup_state WHERE name = 'scan_history'",
+                    (err, row) => {
+                        if (err) {
+                            reject(err);
+                        } else {
+                            resolve(row ? row.last_rowid : 0);
+                        }
+                    }
+                );
+            });
+        });
+    }
+
+    getScanRollups(options = {}) {
+        const { counter, from, to } = options;
+        const where = [];
+        const params = [];
+
+        if (counter) {
+            where.push('counter = ?');
+            params.push(counter);
+        }
+        if (from) {
+            where.push('minute >= ?');
+            params.push(from);
+        }
+        if (to) {
+            where.push('minute <= ?');
+            params.push(to);
+        }
+
+        return new Promise((resolve, reject) => {
+            this.db.all(`
+                SELECT minute, counter, food_preference, scans
+                FROM scan_rollups
+                ${where.length ? 'WHERE ' + where.join(' AND ') : ''}
+                ORDER BY minute, counter, food_preference
+            `, params, (err, rows) => {
+                if (err) {
+                    reject(err);
+                } else {
+                    resolve(rows);
+                }
+            });
+        });
+    }
+
+    // Without an event: the users.is_scanned flag. With one: entitlements for that
+    // event (and slot, if given), in the same shape
+    getScanStats(options = {}) {
+        const { eventId, mealSlot } = options;
+        const source = eventId
+            ? `(SELECT u.food_preference, x.redeemed_at IS NOT NULL AS is_scanned
+                FROM entitlements x JOIN users u ON u.id = x.user_id
+                WHERE x.event_id = ? ${mealSlot ? 'AND x.meal_slot = ?' : ''})`
+            : 'users';
+        const params = eventId ? [eventId, mealSlot].filter(Boolean) : [];
+
         return new Promise((resolve, reject) => {
             this.db.get(`
                 SELECT 
@@ -159,8 +726,8 @@ class Database {
                     SUM(CASE WHEN food_preference = 'non-veg' THEN 1 ELSE 0 END) as nonveg_count,
                     SUM(CASE WHEN food_preference = 'veg' AND is_scanned = 1 THEN 1 ELSE 0 END) as veg_scanned,
                     SUM(CASE WHEN food_preference = 'non-veg' AND is_scanned = 1 THEN 1 ELSE 0 END) as nonveg_scanned
-                FROM users
-            `, (err, row) => {
+                FROM ${source}
+            `, params, (err, row) => {
                 if (err) {
                     reject(err);
                 } else {
@@ -171,23 +738,29 @@ class Database {
     }
 
     clearAllData() {
-        return new Promise((resolve, reject) => {
-            this.db.serialize(() => {
-                this.db.run('DELETE FROM scan_history');
-                this.db.run('DELETE FROM users', (err) => {
-                    if (err) {
-                        reject(err);
-                    } else {
-                        resolve('All data cleared');
-                    }
-                });
-            });
+        return this.inTransaction(async () => {
+            for (const table of [
+                'scan_history', 'entitlements', 'events', 'qr_artifacts',
+                'counter_duplicates', 'scan_rollups', 'rollup_state', 'users'
+            ]) {
+                await this.run(`DELETE FROM ${table}`);
+            }
+            return 'All data cleared';
         });
     }
 
     close() {
+        if (this.upsertStatements) {
+            this.upsertStatements.update.finalize();
+            this.upsertStatements.insert.finalize();
+        }
+        if (this.historyInsert) {
+            this.historyInsert.finalize();
+        }
         this.db.close();
     }
 }
 
 module.exports = Database;
+module.exports.USER_COLUMNS = USER_COLUMNS;
+module.exports.DEFAULT_MEAL_SLOT = DEFAULT_MEAL_SLOT;
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Delta Import for Late Registrations
+Compares a fresh form export with the students already in the database and
+works out, in one set-based pass, who is new, whose details changed and who
+is no longer in the export. Only that delta is written: new students get a
+token and card, changed students keep their token and get a fresh card, and
+only those students are emailed. Students missing from the export are
+reported; --remove deletes the ones that have not eaten yet.
+
+Usage: python delta_import.py food_pref.csv [--dry-run] [--no-email] [--yes]
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+import profiling
+import qr_store
+from generate_qr_with_db import normalize_food_preference, setup_database, store_card
+from merge_shards import write_tokens_list
+from qr_paths import QR_DIR
+from token_signing import new_token
+
+DB_PATH = 'database/food_tokens.db'
+
+# Form export columns (same headers as clean_csv.py)
+NAME_COLUMN = 'Enter Your Name'
+EMAIL_COLUMN = 'Enter Your College Mail ID'
+USN_COLUMN = 'Enter Your USN'
+CLASS_COLUMN = 'Class'
+FOOD_COLUMN = 'What kind of food do you prefer'
+
+INCOMING_SQL = '''
+    CREATE TEMP TABLE incoming (
+        row INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        usn TEXT NOT NULL,
+        class_name TEXT NOT NULL,
+        food_answer TEXT NOT NULL,
+        food_preference TEXT NOT NULL,
+        user_id INTEGER
+    )
+'''
+
+# A student who submitted the form twice is imported from the last submission
+LATEST_SUBMISSION_SQL = '''
+    DELETE FROM incoming
+    WHERE EXISTS (
+        SELECT 1 FROM incoming later
+        WHERE later.row > incoming.row
+          AND ((incoming.usn <> '' AND later.usn = incoming.usn)
+               OR (incoming.usn = '' AND later.email = incoming.email))
+    )
+'''
+
+# USN identifies a student; the email is the fallback for rows without one
+MATCH_SQL = '''
+    UPDATE incoming SET user_id = COALESCE(
+        (SELECT id FROM users WHERE incoming.usn <> '' AND users.usn = incoming.usn COLLATE NOCASE),
+        (SELECT id FROM users WHERE incoming.email <> '' AND users.email = incoming.email COLLATE NOCASE)
+    )
+'''
+
+NEW_SQL = '''
+    SELECT row, name, email, usn, class_name, food_answer, food_preference
+    FROM incoming WHERE user_id IS NULL ORDER BY row
+'''
+
+CHANGED_SQL = '''
+    SELECT i.user_id, i.name, i.email, i.usn, i.class_name, i.food_answer, i.food_preference,
+           u.token, u.qr_code_path
+    FROM incoming i JOIN users u ON u.id = i.user_id
+    WHERE u.name IS NOT i.name
+       OR COALESCE(u.email, '') <> i.email COLLATE NOCASE
+       OR COALESCE(u.class_name, '') <> i.class_name
+       OR u.food_preference IS NOT i.food_preference
+    ORDER BY i.row
+'''
+
+# is_scanned covers the single per-student flag and any redeemed event meal slot
+REMOVED_SQL = '''
+    SELECT id, name, usn, email, {scanned} AS is_scanned, qr_code_path FROM users
+    WHERE id NOT IN (SELECT user_id FROM incoming WHERE user_id IS NOT NULL)
+    ORDER BY id
+'''
+REMOVED_SCANNED = 'COALESCE(is_scanned, 0)'
+REMOVED_SCANNED_WITH_ENTITLEMENTS = '''(COALESCE(is_scanned, 0) OR EXISTS (
+        SELECT 1 FROM entitlements x WHERE x.user_id = users.id AND x.redeemed_at IS NOT NULL))'''
+
+
+def read_export(csv_path):
+    """Rows of the form export, trimmed; the raw and the cleaned export both work"""
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        missing = {NAME_COLUMN, EMAIL_COLUMN, USN_COLUMN, CLASS_COLUMN, FOOD_COLUMN} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"{csv_path} is missing columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            name = (row[NAME_COLUMN] or '').strip()
+            if not name:
+                continue
+            food_answer = (row[FOOD_COLUMN] or '').strip()
+            yield (name,
+                   (row[EMAIL_COLUMN] or '').strip(),
+                   (row[USN_COLUMN] or '').strip().upper(),
+                   (row[CLASS_COLUMN] or '').strip(),
+                   food_answer,
+                   normalize_food_preference(food_answer))
+
+
+def compute_delta(conn, rows):
+    """Load the export into a temp table and match it against users; returns (new, changed, removed)"""
+    # Node creates these when it opens the database; a fresh Python-built one may not have them
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_usn ON users(usn COLLATE NOCASE)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email COLLATE NOCASE)')
+
+    conn.execute('DROP TABLE IF EXISTS temp.incoming')
+    conn.execute(INCOMING_SQL)
+    conn.executemany('''
+        INSERT INTO incoming (name, email, usn, class_name, food_answer, food_preference)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.execute('CREATE INDEX temp.idx_incoming_usn ON incoming(usn)')
+    conn.execute('CREATE INDEX temp.idx_incoming_email ON incoming(email)')
+    conn.execute(LATEST_SUBMISSION_SQL)
+    conn.execute(MATCH_SQL)
+
+    new = conn.execute(NEW_SQL).fetchall()
+    changed = conn.execute(CHANGED_SQL).fetchall()
+    has_entitlements = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entitlements'").fetchone()
+    removed = conn.execute(REMOVED_SQL.format(
+        scanned=REMOVED_SCANNED_WITH_ENTITLEMENTS if has_entitlements else REMOVED_SCANNED)).fetchall()
+    return new, changed, removed
+
+
+def apply_delta(conn, new, changed, removable, event_id=None):
+    """Write the delta in one transaction; returns (students to render, skipped new rows)"""
+    cursor = conn.cursor()
+    to_render = []
+    skipped = []
+
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        new_ids = []
+        for _, name, email, usn, class_name, food_answer, food_preference in new:
+            try:
+                token = new_token(usn or None)
+            except ValueError as e:
+                skipped.append((name, email, str(e)))
+                continue
+            cursor.execute('''
+                INSERT INTO users (name, email, food_preference, token, class_name, usn)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (name, email, food_preference, token, class_name, usn))
+            new_ids.append(cursor.lastrowid)
+            to_render.append((cursor.lastrowid, name, email, usn, class_name, food_answer, token))
+
+        # Changed students keep their token, so a card already printed still scans
+        for user_id, name, email, usn, class_name, food_answer, food_preference, token, _ in changed:
+            cursor.execute('''
+                UPDATE users SET name = ?, email = ?, class_name = ?, food_preference = ?
+                WHERE id = ?
+            ''', (name, email, class_name, food_preference, user_id))
+            to_render.append((user_id, name, email, usn, class_name, food_answer, token))
+
+        has_entitlements = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entitlements'").fetchone()
+
+        if removable:
+            ids = [(user_id,) for user_id, *_ in removable]
+            if has_entitlements:
+                cursor.executemany('DELETE FROM entitlements WHERE user_id = ?', ids)
+            cursor.executemany('DELETE FROM qr_artifacts WHERE user_id = ?', ids)
+            cursor.executemany('DELETE FROM scan_history WHERE user_id = ?', ids)
+            cursor.executemany('DELETE FROM users WHERE id = ?', ids)
+
+        if event_id and new_ids:
+            # Late registrations get the same meal slots as everyone else at the event
+            cursor.executemany('''
+                INSERT OR IGNORE INTO entitlements (user_id, event_id, meal_slot)
+                SELECT ?, ?, meal_slot FROM entitlements WHERE event_id = ? GROUP BY meal_slot
+            ''', [(user_id, event_id, event_id) for user_id in new_ids])
+
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return to_render, skipped
+
+
+def render_card(job):
+    """Worker: store one card; returns (user_id, path, error)"""
+    user_id, name, email, usn, class_name, food_answer, token = job
+    try:
+        return user_id, store_card(token, name, email, food_answer, class_name), None
+    except Exception as e:
+        return user_id, None, str(e)
+
+
+def render_cards(conn, students, workers=None):
+    """Store the delta's cards on every core and point the users at them;
+    returns ({user_id: path}, {user_id: error})"""
+    if not students:
+        return {}, {}
+    paths = {}
+    failed = {}
+    with Pool(min(workers or os.cpu_count() or 1, len(students))) as pool:
+        for user_id, path, error in pool.imap_unordered(render_card, students, chunksize=4):
+            if error:
+                failed[user_id] = error
+            else:
+                paths[user_id] = path
+
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany('UPDATE users SET qr_code_path = ? WHERE id = ?',
+                     [(path, user_id) for user_id, path in paths.items()])
+    qr_store.record_references(conn, [(user_id, 'card', qr_store.key_of(path)) for user_id, path in paths.items()])
+    conn.execute('COMMIT')
+    return paths, failed
+
+
+def mail_delta(students, assume_yes=False):
+    """Email only the delta's (student, card path) pairs; returns (sent, failed) or None when skipped"""
+    if not students:
+        return None
+    if not assume_yes:
+        response = input(f"📧 Send QR code emails to {len(students)} new or changed students? (y/N): ").lower()
+        if response != 'y':
+            print("⏭️ Emails not sent")
+            return None
+
+    from send_qr_emails import EmailSender
+    from deploy_email_distribution import send_emails_by_batch
+    try:
+        email_sender = EmailSender()
+    except ValueError as e:
+        print(f"❌ {e}")
+        return None
+
+    batch = [(user_id, name, email, usn, class_name, food_answer, qr_code_path)
+             for (user_id, name, email, usn, class_name, food_answer, _), qr_code_path in students
+             if email]
+    sent, failed, _, _ = send_emails_by_batch(email_sender, batch)
+    return sent, failed
+
+
+def delta_import(csv_path, db_path=DB_PATH, qr_dir=QR_DIR, dry_run=False, remove=False,
+                 event_id=None, send=True, assume_yes=False, workers=None):
+    timings = {}
+    started = time.perf_counter()
+    conn = setup_database(db_path)
+    conn.isolation_level = None
+
+    if event_id:
+        has_events = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events'").fetchone()
+        if not has_events or not conn.execute('SELECT 1 FROM events WHERE id = ?', (event_id,)).fetchone():
+            conn.close()
+            raise ValueError(f"Event not found: {event_id} (create it with POST /api/events first)")
+
+    with profiling.step('delta.compute'):
+        new, changed, removed = compute_delta(conn, read_export(csv_path))
+    incoming = conn.execute('SELECT COUNT(*) FROM incoming').fetchone()[0]
+    timings['compute'] = time.perf_counter() - started
+
+    print(f"📊 {incoming} students in {csv_path}")
+    print(f"   🆕 New: {len(new)}")
+    for _, name, email, usn, class_name, *_ in new[:20]:
+        print(f"      + {name} ({usn or email}, {class_name})")
+    print(f"   ✏️ Changed: {len(changed)}")
+    for _, name, email, usn, class_name, *_ in changed[:20]:
+        print(f"      ~ {name} ({usn or email}, {class_name})")
+    print(f"   ➖ Not in export: {len(removed)}")
+    for _, name, usn, email, is_scanned, _ in removed[:20]:
+        print(f"      - {name} ({usn or email}){' — already scanned' if is_scanned else ''}")
+
+    # A student who has already eaten keeps their row, so the redemption is not lost
+    removable = [student for student in removed if not student[4]] if remove else []
+    if remove and len(removable) < len(removed):
+        print(f"⚠️ Keeping {len(removed) - len(removable)} students who are not in the export but already "
+              f"scanned or redeemed a meal")
+
+    if dry_run:
+        conn.close()
+        print("\n🔍 Dry run: nothing was changed")
+        return {'new': len(new), 'changed': len(changed), 'removed': len(removed)}
+
+    started = time.perf_counter()
+    with profiling.step('delta.apply'):
+        to_render, skipped = apply_delta(conn, new, changed, removable, event_id)
+    timings['apply'] = time.perf_counter() - started
+    for name, email, error in skipped:
+        print(f"⚠️ Skipped {name} ({email}): {error}")
+
+    started = time.perf_counter()
+    with profiling.step('delta.render'):
+        card_paths, render_failed = render_cards(conn, to_render, workers)
+    timings['render'] = time.perf_counter() - started
+    for user_id, error in render_failed.items():
+        print(f"❌ Card for user {user_id} not rendered: {error}")
+
+    tokens_path, total = write_tokens_list(conn, qr_dir)
+    conn.close()
+
+    mail_result = None
+    if send:
+        started = time.perf_counter()
+        mail_result = mail_delta([(s, card_paths[s[0]]) for s in to_render if s[0] in card_paths], assume_yes)
+        timings['email'] = time.perf_counter() - started
+
+    summary = {
+        'timestamp': datetime.now().isoformat(),
+        'export': csv_path,
+        'students_in_export': incoming,
+        'new': len(to_render) - len(changed),
+        'changed': len(changed),
+        'not_in_export': len(removed),
+        'removed': len(removable),
+        'skipped': len(skipped),
+        'cards_rendered': len(card_paths),
+        'cards_failed': len(render_failed),
+        'emails_sent': mail_result[0] if mail_result else 0,
+        'emails_failed': mail_result[1] if mail_result else 0,
+        'event': event_id,
+        'seconds': {phase: round(seconds, 3) for phase, seconds in timings.items()},
+    }
+    report_path = f"delta_import_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n📊 DELTA IMPORT SUMMARY")
+    print("=" * 60)
+    print(f"🆕 Added: {summary['new']}")
+    print(f"✏️ Updated: {summary['changed']}")
+    print(f"➖ Removed: {summary['removed']} of {summary['not_in_export']} not in the export")
+    if removable:
+        print(f"   💡 Their cards are reclaimed by: python qr_store.py gc")
+    print(f"🎫 Cards rendered: {summary['cards_rendered']} ({summary['cards_failed']} failed)")
+    if send:
+        print(f"📧 Emails sent: {summary['emails_sent']} ({summary['emails_failed']} failed)")
+    print(f"📋 Rebuilt {tokens_path} with {total} students")
+    print(f"⏱️ " + ', '.join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in timings.items()))
+    print(f"📄 Report saved to: {report_path}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import only new and changed students from a fresh form export")
+    parser.add_argument('csv_path', metavar='EXPORT_CSV', help="form export (raw or cleaned)")
+    parser.add_argument('--db', default=DB_PATH, help=f"database file (default {DB_PATH})")
+    parser.add_argument('--qr-dir', default=QR_DIR, help=f"where tokens_list.json is rebuilt (default {QR_DIR}/)")
+    parser.add_argument('--dry-run', action='store_true', help="report the delta without changing anything")
+    parser.add_argument('--remove', action='store_true',
+                        help="delete students missing from the export who have not been scanned")
+    parser.add_argument('--event', help="grant new students the meal slots of this event")
+    parser.add_argument('--no-email', action='store_true', help="do not email the new and changed students")
+    parser.add_argument('--yes', action='store_true', help="send emails without asking")
+    parser.add_argument('--workers', type=int, default=None, help="card rendering processes (default: all cores)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv_path):
+        print(f"❌ Export not found: {args.csv_path}")
+        sys.exit(1)
+
+    try:
+        delta_import(args.csv_path, args.db, args.qr_dir, args.dry_run, args.remove,
+                     args.event, not args.no_email, args.yes, args.workers)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.configure_from_argv()
+    with profiling.stage('delta-import'):
+        main()
@@ -10,11 +10,14 @@ from dotenv import load_dotenv
 from send_qr_emails import EmailSender
 import sqlite3
 import glob
+import profiling
+from qr_render import card_for_user
+from snapshot_db import snapshot_connection
 
 def get_all_students():
-    """Get all students from the database"""
+    """Get all students from a snapshot of the database, so a long run never holds up scanning"""
     try:
-        conn = sqlite3.connect('database/food_tokens.db')
+        conn = snapshot_connection('database/food_tokens.db')
         cursor = conn.cursor()
         cursor.execute('''
             SELECT id, name, email, usn, class_name, food_preference, qr_code_path 
@@ -32,14 +35,15 @@ def validate_qr_files(students):
     """Check which QR code files exist and find alternatives for missing ones"""
     valid_students = []
     missing_files = []
+    conn = sqlite3.connect('database/food_tokens.db')
     
     for student in students:
         student_id, name, email, usn, class_name, food_preference, qr_code_path = student
         
-        if os.path.exists(qr_code_path):
+        if qr_code_path and os.path.exists(qr_code_path):
             valid_students.append(student)
         else:
-            # Try to find alternative QR code files for this student
+            # Legacy flat layout only; sharded cards are always at qr_code_path
             safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip()
             
             # Try different patterns
@@ -62,8 +66,19 @@ def validate_qr_files(students):
                 valid_students.append(updated_student)
                 print(f"📁 Found alternative QR for {name}: {found_file}")
             else:
-                missing_files.append((name, email, qr_code_path))
-    
+                # No pre-generated card: render it from the database row
+                try:
+                    card_path = card_for_user(conn, student_id)
+                except Exception as e:
+                    card_path = None
+                    print(f"❌ Could not render QR for {name}: {e}")
+                if not card_path:
+                    missing_files.append((name, email, qr_code_path))
+                    continue
+                valid_students.append((student_id, name, email, usn, class_name, food_preference, card_path))
+                print(f"🎨 Rendered QR for {name}: {card_path}")
+    
+    conn.close()
     return valid_students, missing_files
 
 def send_emails_by_batch(email_sender, students, batch_size=50):
@@ -96,9 +111,10 @@ def send_emails_by_batch(email_sender, students, batch_size=50):
             print(f"  📧 [{i+j:3d}/{total_students}] {name} ({class_name}) -> {email}")
             
             try:
-                success = email_sender.send_email_with_qr(
-                    email, name, class_name, usn, food_preference, qr_code_path
-                )
+                with profiling.step('email.send'):
+                    success = email_sender.send_email_with_qr(
+                        email, name, class_name, usn, food_preference, qr_code_path
+                    )
                 
                 if success:
                     sent_count += 1
@@ -314,4 +330,6 @@ def main():
     print(f"   4. Monitor admin dashboard: http://localhost:3000/admin")
 
 if __name__ == "__main__":
-    main()
+    profiling.configure_from_argv()
+    with profiling.stage('distribute'):
+        main()
@@ -95,7 +95,7 @@ backup_data() {
     docker cp food-token-scanner:/app/database "backups/$BACKUP_NAME/"
     
     # Backup QR codes
-    docker cp food-token-scanner:/app/qr-codes "backups/$BACKUP_NAME/"
+    docker cp food-token-scanner:/app/qr_store "backups/$BACKUP_NAME/"
     
     # Create archive
     tar -czf "backups/$BACKUP_NAME.tar.gz" -C backups "$BACKUP_NAME"
@@ -133,7 +133,7 @@ restore_data() {
     sleep 5  # Wait for container to start
     
     docker cp "$TEMP_DIR/$BACKUP_DIR/database" food-token-scanner:/app/
-    docker cp "$TEMP_DIR/$BACKUP_DIR/qr-codes" food-token-scanner:/app/
+    docker cp "$TEMP_DIR/$BACKUP_DIR/qr_store" food-token-scanner:/app/
     
     # Cleanup
     rm -rf "$TEMP_DIR"
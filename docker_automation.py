@@ -2,28 +2,121 @@
 """
 Complete Docker Automation Script
 Handles: CSV cleaning, QR generation, email sending - all in one go
+
+Stages run in-process as a small dependency graph. Each stage records a
+fingerprint of its inputs, so a re-run skips everything that is already up
+to date, and stages that do not depend on each other run concurrently.
 """
+import argparse
+import hashlib
+import json
 import os
+import sqlite3
 import sys
-import subprocess
+import threading
 import time
-from datetime import datetime
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import profiling
+from qr_paths import qr_relative_path
+from qr_store import STORE_DIR
+
+STATE_PATH = 'database/pipeline-state.json'
+QR_DIR = 'qr_codes_jpeg'
+DB_PATH = 'database/food_tokens.db'
+BUNDLE_PATH = 'cache/qr-cards.zip'
+
+
+class Stage:
+    def __init__(self, name, description, run, deps=(), inputs=(), outputs=(),
+                 cacheable=True, interactive=False):
+        self.name = name
+        self.description = description
+        self.run = run
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        # Interactive stages prompt on stdin, so nothing else runs beside them
+        self.cacheable = cacheable
+        self.interactive = interactive
+
+
+class StageOutput:
+    """stdout wrapper that prefixes each line with the stage printing it.
+
+    Lines are written whole, so concurrent stages never interleave mid-line.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def emit(self, text):
+        name = getattr(self.local, 'stage', None)
+        with self.lock:
+            self.stream.write(f"[{name}] {text}" if name else text)
+            self.stream.flush()
+
+    def write(self, text):
+        pending = getattr(self.local, 'pending', '') + text
+        lines = pending.splitlines(keepends=True)
+        self.local.pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+        for line in lines:
+            self.emit(line)
+        return len(text)
 
-def run_command(command, description):
-    """Run a command and handle errors"""
-    print(f"\n🔄 {description}...")
-    print(f"Command: {command}")
-    
+    def flush(self):
+        # input() flushes its prompt before reading
+        pending = getattr(self.local, 'pending', '')
+        if pending:
+            self.local.pending = ''
+            self.emit(pending)
+        self.stream.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+
+def file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def path_signature(path):
+    """Content hash of a file; name, size and mtime of every file in a directory"""
+    if os.path.isdir(path):
+        parts = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                parts.append(f"{os.path.join(root, name)}:{stat.st_size}:{stat.st_mtime_ns}")
+        return '\n'.join(parts)
+    if os.path.exists(path):
+        return f"{path}:{file_digest(path)}"
+    return f"{path}:missing"
+
+
+def load_state():
     try:
-        result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
-        print(f"✅ {description} completed successfully!")
-        if result.stdout:
-            print(result.stdout)
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ {description} failed!")
-        print(f"Error: {e.stderr}")
-        return False
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    tmp_path = f"{STATE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, STATE_PATH)
+
 
 def check_file_exists(filepath, description):
     """Check if required file exists"""
@@ -34,96 +127,280 @@ def check_file_exists(filepath, description):
         print(f"❌ {description} not found: {filepath}")
         return False
 
+
+class Pipeline:
+    def __init__(self, stages, force=False, max_workers=4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.force = force
+        self.max_workers = max_workers
+        self.state = load_state()
+        self.state_lock = threading.Lock()
+        self.fingerprints = {}
+        self.output = StageOutput(sys.stdout)
+
+    def fingerprint(self, stage):
+        hasher = hashlib.sha256(stage.name.encode())
+        for dep in stage.deps:
+            hasher.update(self.fingerprints[dep].encode())
+        for path in stage.inputs:
+            hasher.update(path_signature(path).encode())
+        return hasher.hexdigest()
+
+    def up_to_date(self, stage, fingerprint):
+        return (stage.cacheable and not self.force
+                and self.state.get(stage.name) == fingerprint
+                and all(os.path.exists(path) for path in stage.outputs))
+
+    def execute(self, stage):
+        """Run one stage; returns 'done', 'skipped' or 'failed'"""
+        fingerprint = self.fingerprint(stage)
+        if self.up_to_date(stage, fingerprint):
+            print(f"⏭️  {stage.description}: up to date")
+            self.fingerprints[stage.name] = fingerprint
+            return 'skipped'
+
+        self.output.local.stage = stage.name
+        print(f"🔄 {stage.description}...")
+        started = time.perf_counter()
+        try:
+            with profiling.stage(stage.name):
+                ok = stage.run() is not False
+        except (Exception, SystemExit) as e:
+            print(f"❌ {e}")
+            ok = False
+        finally:
+            elapsed = time.perf_counter() - started
+
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if ok and missing:
+            print(f"❌ Expected output not produced: {', '.join(missing)}")
+            ok = False
+        print(f"{'✅' if ok else '❌'} {stage.description} {'completed' if ok else 'failed'} in {elapsed:.1f}s")
+        self.output.flush()
+        self.output.local.stage = None
+
+        if not ok:
+            return 'failed'
+
+        self.fingerprints[stage.name] = fingerprint
+        if stage.cacheable:
+            with self.state_lock:
+                self.state[stage.name] = fingerprint
+                save_state(self.state)
+        return 'done'
+
+    def run(self, targets):
+        """Run targets and everything they depend on; returns {stage: status}"""
+        needed = set()
+
+        def collect(name):
+            if name not in needed:
+                needed.add(name)
+                for dep in self.stages[name].deps:
+                    collect(dep)
+
+        for target in targets:
+            collect(target)
+
+        results = {}
+        running = {}
+        previous_stdout = sys.stdout
+        sys.stdout = self.output
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                while len(results) < len(needed):
+                    blocked = {name for name in needed - results.keys() - running.keys()
+                               if any(results.get(dep) == 'failed' for dep in self.stages[name].deps)}
+                    for name in blocked:
+                        print(f"⏭️  {self.stages[name].description}: skipped, a dependency failed")
+                        results[name] = 'failed'
+
+                    ready = [name for name in needed - results.keys() - running.keys()
+                             if all(results.get(dep) in ('done', 'skipped') for dep in self.stages[name].deps)]
+
+                    interactive = [name for name in ready if self.stages[name].interactive]
+                    if interactive and not running:
+                        results[interactive[0]] = self.execute(self.stages[interactive[0]])
+                        continue
+
+                    for name in ready:
+                        if not self.stages[name].interactive:
+                            running[name] = pool.submit(self.execute, self.stages[name])
+
+                    if not running:
+                        if not ready and not blocked:
+                            raise RuntimeError("Pipeline has a dependency cycle")
+                        continue
+
+                    finished, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+                    for name, future in list(running.items()):
+                        if future in finished:
+                            results[name] = future.result()
+                            del running[name]
+        finally:
+            sys.stdout = previous_stdout
+
+        return results
+
+
+# Stage bodies import lazily so pandas and friends load once, in this process
+
+def clean_stage():
+    from clean_csv import clean_csv
+    return clean_csv()
+
+
+def generate_stage():
+    import generate_qr_with_db
+    # False when generation was cancelled, so the stage is not cached as done
+    return generate_qr_with_db.main()
+
+
+def validate_stage():
+    from deploy_email_distribution import get_all_students, validate_qr_files
+    students = get_all_students()
+    valid_students, missing_files = validate_qr_files(students)
+    print(f"✅ {len(valid_students)}/{len(students)} students have a QR code file")
+    for name, email, qr_code_path in missing_files:
+        print(f"   - Missing: {name} ({email}) {qr_code_path}")
+    return bool(students) and not missing_files
+
+
+def verify_stage():
+    from verify_cards import verify_cards
+    failures = verify_cards(DB_PATH)
+    # Without OpenCV the check is skipped rather than blocking distribution
+    return failures is None or not failures
+
+
+def bundle_stage():
+    """Store-mode zip of every card, for printing or handing to the organisers"""
+    os.makedirs(os.path.dirname(BUNDLE_PATH), exist_ok=True)
+    tmp_path = f"{BUNDLE_PATH}.{os.getpid()}.tmp"
+    count = 0
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        cards = conn.execute('SELECT token, qr_code_path FROM users ORDER BY id').fetchall()
+    finally:
+        conn.close()
+    # Cards are named by token in the bundle, not by their key in the QR store.
+    # JPEGs are already compressed, so deflating them again only burns CPU
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        for token, path in cards:
+            if path and os.path.exists(path):
+                bundle.write(path, qr_relative_path(token, os.path.splitext(path)[1]))
+                count += 1
+    os.replace(tmp_path, BUNDLE_PATH)
+    print(f"📦 Bundled {count} QR cards into {BUNDLE_PATH}")
+
+
+def email_test_stage():
+    email_test = input("Do you want to send a test email first? (y/n): ").strip().lower()
+    if email_test != 'y':
+        return True
+
+    from test_shrinidhi_email import test_shrinidhi_email
+    if not test_shrinidhi_email():
+        print("⚠️ Email test failed. Check your .env configuration.")
+        continue_anyway = input("Continue with mass email anyway? (y/n): ").strip().lower()
+        if continue_anyway != 'y':
+            print("❌ Stopping due to email test failure.")
+            return False
+    return True
+
+
+def distribute_stage():
+    import deploy_email_distribution
+    # Asks for its own 'YES' confirmation before sending anything
+    deploy_email_distribution.main()
+
+
+def build_stages(has_original_csv):
+    clean_inputs = ['food_pref.csv', 'clean_csv.py'] if has_original_csv else ['food_pref_cleaned.csv']
+    return [
+        Stage('clean', "CSV cleaning and duplicate removal",
+              clean_stage if has_original_csv else (lambda: True),
+              inputs=clean_inputs, outputs=['food_pref_cleaned.csv']),
+        # Regenerating issues new tokens, so this only reruns when the roster changes
+        Stage('generate', "QR code generation and database setup", generate_stage,
+              deps=['clean'], inputs=['food_pref_cleaned.csv', 'generate_qr_with_db.py'],
+              outputs=[DB_PATH, os.path.join(QR_DIR, 'tokens_list.json')], interactive=True),
+        Stage('validate', "QR code file validation", validate_stage,
+              deps=['generate'], inputs=[STORE_DIR]),
+        Stage('verify', "QR card decode check", verify_stage,
+              deps=['generate'], inputs=[STORE_DIR]),
+        Stage('bundle', "QR card bundle", bundle_stage,
+              deps=['generate'], inputs=[STORE_DIR], outputs=[BUNDLE_PATH]),
+        Stage('email-test', "Email configuration testing", email_test_stage,
+              deps=['validate', 'verify'], cacheable=False, interactive=True),
+        Stage('distribute', "Mass email distribution", distribute_stage,
+              deps=['email-test', 'bundle'], cacheable=False, interactive=True),
+    ]
+
+
 def main():
+    profiling.configure_from_argv()
+    parser = argparse.ArgumentParser(description="Run the food token pipeline in one process")
+    parser.add_argument('targets', nargs='*', default=['distribute'],
+                        help="stages to run along with their dependencies "
+                             "(clean, generate, validate, verify, bundle, email-test, distribute)")
+    parser.add_argument('--force', action='store_true', help="rerun stages even when their inputs are unchanged")
+    args = parser.parse_args()
+
     print("🚀 COMPLETE DOCKER AUTOMATION")
     print("=" * 50)
     print("This script will handle everything:")
     print("1. CSV cleaning and duplicate removal")
     print("2. QR code generation")
-    print("3. Email configuration testing")
-    print("4. Mass email distribution")
+    print("3. QR validation and card bundle (in parallel)")
+    print("4. Email configuration testing")
+    print("5. Mass email distribution")
     print()
-    
+
     # Check prerequisites
     print("📋 Checking prerequisites...")
-    
+
     # Check if we have CSV data
     has_original_csv = check_file_exists("food_pref.csv", "Original CSV file")
     has_cleaned_csv = check_file_exists("food_pref_cleaned.csv", "Cleaned CSV file")
-    
+
     if not has_original_csv and not has_cleaned_csv:
         print("❌ No CSV data found! Please upload food_pref.csv first.")
         return
-    
+
     # Check environment configuration
     if not check_file_exists(".env", "Environment configuration"):
         print("❌ Please create .env file with email credentials first.")
         return
-    
-    print("\n🎯 Starting complete automation process...")
-    
-    # Step 1: Clean CSV (if original exists and cleaned doesn't)
-    if has_original_csv and not has_cleaned_csv:
-        if not run_command("python3 clean_csv.py", "CSV cleaning and duplicate removal"):
-            print("❌ CSV cleaning failed. Cannot continue.")
-            return
-    else:
-        print("✅ Using existing cleaned CSV file")
-    
-    # Step 2: Generate QR codes and populate database
-    if not run_command("python3 generate_qr_with_db.py", "QR code generation and database setup"):
-        print("❌ QR code generation failed. Cannot continue.")
+
+    stages = build_stages(has_original_csv)
+    unknown = [target for target in args.targets if target not in {stage.name for stage in stages}]
+    if unknown:
+        print(f"❌ Unknown stage(s): {', '.join(unknown)}")
         return
-    
-    # Step 3: Test email configuration
-    print("\n📧 Testing email configuration...")
-    email_test = input("Do you want to send a test email first? (y/n): ").strip().lower()
-    
-    if email_test == 'y':
-        if not run_command("python3 test_shrinidhi_email.py", "Email configuration testing"):
-            print("⚠️ Email test failed. Check your .env configuration.")
-            continue_anyway = input("Continue with mass email anyway? (y/n): ").strip().lower()
-            if continue_anyway != 'y':
-                print("❌ Stopping due to email test failure.")
-                return
-    
-    # Step 4: Mass email distribution
-    print("\n📮 Ready for mass email distribution...")
-    
-    # Show summary
-    try:
-        result = subprocess.run("python3 -c \"import sqlite3; conn = sqlite3.connect('database/food_tokens.db'); cursor = conn.cursor(); cursor.execute('SELECT COUNT(*) FROM users'); count = cursor.fetchone()[0]; conn.close(); print(f'Total students: {count}')\"", 
-                              shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"📊 {result.stdout.strip()}")
-    except:
-        print("📊 Student count check failed")
-    
-    # Final confirmation
-    send_emails = input("\n🚨 Send emails to ALL students? (type 'YES' to confirm): ").strip()
-    
-    if send_emails == 'YES':
-        if not run_command("python3 deploy_email_distribution.py", "Mass email distribution"):
-            print("❌ Email distribution failed.")
-            return
-    else:
-        print("📧 Email distribution skipped.")
-        print("💡 You can run it later with: docker-compose exec food-token-scanner python3 deploy_email_distribution.py")
-    
+
+    print("\n🎯 Starting complete automation process...")
+    started = time.perf_counter()
+    results = Pipeline(stages, force=args.force).run(args.targets)
+
     # Final status
-    print("\n🎉 AUTOMATION COMPLETED!")
+    failed = [name for name, status in results.items() if status == 'failed']
+    print(f"\n{'❌ AUTOMATION STOPPED' if failed else '🎉 AUTOMATION COMPLETED'} "
+          f"in {time.perf_counter() - started:.1f}s")
     print("=" * 30)
-    print("✅ CSV cleaned and duplicates removed")
-    print("✅ QR codes generated")
-    print("✅ Database populated")
-    if send_emails == 'YES':
-        print("✅ Emails sent to all students")
-    print("✅ System ready for production!")
-    
+    for stage in stages:
+        if stage.name in results:
+            icon = {'done': '✅', 'skipped': '⏭️ ', 'failed': '❌'}[results[stage.name]]
+            print(f"{icon} {stage.description}: {results[stage.name]}")
+
+    if failed:
+        return
+
     print("\n🌐 Access your application:")
     print("Scanner: http://localhost:3000/scanner")
     print("Admin: http://localhost:3000/admin")
-    
+
     print("\n🔧 Management commands:")
     print("View logs: docker-compose logs -f")
     print("Restart: docker-compose restart")
@@ -5,6 +5,7 @@ from PIL import Image, ImageDraw, ImageFont
 import uuid
 import os
 import json
+import qr_store
 
 def create_qr_with_text(data, filename, student_name, food_preference, class_name):
     qr = qrcode.QRCode(
@@ -74,7 +75,7 @@ def main():
         rows = list(reader)
     
     print(f"✅ Found {len(rows)} students")
-    print(f"📁 Creating QR codes in directory: {output_dir}")
+    print(f"📁 Creating QR codes in directory: {qr_store.STORE_DIR}")
     
     tokens_data = []
     
@@ -95,12 +96,10 @@ def main():
             "type": "food-token"
         }
         
-        sanitized_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip()
-        sanitized_name = sanitized_name.replace(' ', '_')
-        
-        filename = f"{output_dir}/{sanitized_name}_{class_name.replace(' ', '_')}_{token[:8]}.jpg"
-        
-        create_qr_with_text(json.dumps(qr_data), filename, name, food_pref, class_name)
+        payload = json.dumps(qr_data)
+        filename = qr_store.put(
+            qr_store.artifact_key('jpeg-card', payload), '.jpg',
+            lambda path: create_qr_with_text(payload, path, name, food_pref, class_name))
         
         tokens_data.append({
             'name': name,
@@ -118,7 +117,7 @@ def main():
         json.dump(tokens_data, f, indent=2)
     
     print(f"✅ Successfully generated {len(rows)} QR codes!")
-    print(f"📁 Files saved in: {output_dir}/")
+    print(f"📁 Files saved in: {qr_store.STORE_DIR}/")
     print(f"📋 Token list saved as: {output_dir}/tokens_list.json")
     
     veg_count = sum(1 for row in rows if 'veg' in row['What kind of food do you prefer'].lower() and 'non' not in row['What kind of food do you prefer'].lower())
@@ -1,14 +1,44 @@
 #!/usr/bin/env python3
+import argparse
 import csv
+import hashlib
 import qrcode
 from PIL import Image, ImageDraw, ImageFont
-import uuid
 import os
 import json
 import sqlite3
+import sys
 from datetime import datetime
+import qr_store
+import token_signing
+from token_signing import new_token
+import profiling
 
-def create_qr_with_text(data, filename, student_name, food_preference, class_name):
+def qr_payload(token, name, email, food_preference, class_name):
+    return json.dumps({
+        "token": token,
+        "name": name,
+        "email": email,
+        "food_preference": food_preference,
+        "class": class_name,
+        "type": "food-token"
+    })
+
+# Bump when create_qr_with_text draws a different card, so earlier renders are not reused
+CARD_VERSION = 1
+
+def card_key(token, name, email, food_preference, class_name):
+    """Store key of a card: a hash of everything drawn on it"""
+    return qr_store.artifact_key('card', CARD_VERSION, qr_payload(token, name, email, food_preference, class_name))
+
+def store_card(token, name, email, food_preference, class_name, store_dir=qr_store.STORE_DIR):
+    """Render the card into the QR store unless an identical one is there; returns its path"""
+    data = qr_payload(token, name, email, food_preference, class_name)
+    return qr_store.put(card_key(token, name, email, food_preference, class_name), '.jpg',
+                        lambda path: create_qr_with_text(data, path, name, food_preference, class_name),
+                        store_dir)
+
+def make_qr(data):
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -17,20 +47,34 @@ def create_qr_with_text(data, filename, student_name, food_preference, class_nam
     )
     qr.add_data(data)
     qr.make(fit=True)
-    
-    qr_img = qr.make_image(fill_color="black", back_color="white")
+    return qr
+
+def create_qr_with_text(data, filename, student_name, food_preference, class_name):
+    with profiling.step('qr.make'):
+        qr = make_qr(data)
     
     img_width = 600
     img_height = 700
     
-    final_img = Image.new('RGB', (img_width, img_height), 'white')
-    
-    qr_img = qr_img.resize((400, 400))
+    with profiling.step('qr.rasterize'):
+        qr_img = qr.make_image(fill_color="black", back_color="white")
+        
+        final_img = Image.new('RGB', (img_width, img_height), 'white')
+        
+        qr_img = qr_img.resize((400, 400))
+        
+        qr_x = (img_width - 400) // 2
+        qr_y = 50
+        final_img.paste(qr_img, (qr_x, qr_y))
     
-    qr_x = (img_width - 400) // 2
-    qr_y = 50
-    final_img.paste(qr_img, (qr_x, qr_y))
+    with profiling.step('text.draw'):
+        draw_card_text(final_img, student_name, food_preference, class_name)
     
+    with profiling.step('jpeg.encode'):
+        final_img.save(filename, 'JPEG', quality=95)
+
+def draw_card_text(final_img, student_name, food_preference, class_name):
+    img_width = final_img.width
     draw = ImageDraw.Draw(final_img)
     
     try:
@@ -59,8 +103,6 @@ def create_qr_with_text(data, filename, student_name, food_preference, class_nam
     text_y += 25
     
     draw.text((img_width//2, text_y), "Scan at food counter", font=font_small, fill='gray', anchor='mm')
-    
-    final_img.save(filename, 'JPEG', quality=95)
 
 def extract_usn_from_email(email):
     """Extract USN from email address"""
@@ -82,9 +124,8 @@ def extract_usn_from_email(email):
     
     return None
 
-def setup_database():
-    db_path = 'database/food_tokens.db'
-    os.makedirs('database', exist_ok=True)
+def setup_database(db_path='database/food_tokens.db'):
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
     
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -116,6 +157,8 @@ def setup_database():
         )
     ''')
     
+    qr_store.ensure_schema(conn)
+    
     conn.commit()
     print("✅ Database tables created/verified")
     return conn
@@ -123,22 +166,49 @@ def setup_database():
 def clear_existing_data(conn):
     cursor = conn.cursor()
     cursor.execute('DELETE FROM scan_history')
+    # Meal entitlements belong to the students being removed
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entitlements'").fetchone():
+        cursor.execute('DELETE FROM entitlements')
     cursor.execute('DELETE FROM users')
     conn.commit()
     print("🗑️ Cleared existing data from database")
 
+def shard_of(usn, shard_count):
+    """Stable shard for a student, the same on every machine"""
+    return int(hashlib.sha1(usn.encode()).hexdigest()[:8], 16) % shard_count
+
+def parse_shard(value):
+    """'2/4' -> (2, 4); shards are numbered from 1"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected K/N, got {value!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {index} is not between 1 and {count}")
+    return index, count
+
+def normalize_food_preference(value):
+    """Form answer -> 'veg' / 'non-veg' as stored in users.food_preference"""
+    food_pref = value.lower()
+    if 'veg' in food_pref and 'non' not in food_pref:
+        return 'veg'
+    return 'non-veg'
+
 def insert_user_to_db(conn, user_data):
     cursor = conn.cursor()
     
-    food_pref = user_data['food_preference'].lower()
-    if 'veg' in food_pref and 'non' not in food_pref:
-        normalized_food_pref = 'veg'
-    else:
-        normalized_food_pref = 'non-veg'
+    normalized_food_pref = normalize_food_preference(user_data['food_preference'])
     
+    # Derived tokens are stable, so a rerun updates the student's row in place
     cursor.execute('''
         INSERT INTO users (name, email, food_preference, token, qr_code_path, class_name, usn)
         VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(token) DO UPDATE SET
+            name = excluded.name,
+            email = excluded.email,
+            food_preference = excluded.food_preference,
+            qr_code_path = excluded.qr_code_path,
+            class_name = excluded.class_name
     ''', (
         user_data['name'],
         user_data['email'],
@@ -150,9 +220,15 @@ def insert_user_to_db(conn, user_data):
     ))
     
     conn.commit()
-    return cursor.lastrowid
+    return cursor.execute('SELECT id FROM users WHERE token = ?', (user_data['token'],)).fetchone()[0]
+
+def main(shard=None, db_path='database/food_tokens.db'):
+    """Returns True once the cards and users table are written, False if nothing was generated"""
+    deterministic = token_signing.EVENT_ID is not None
+    if shard and not deterministic:
+        print("❌ --shard needs derived tokens: set TOKEN_EVENT (and TOKEN_KEYS) on every machine")
+        return False
 
-def main():
     # Find the cleaned CSV file
     csv_file = 'food_pref_cleaned.csv'
     
@@ -166,24 +242,14 @@ def main():
             print(f"📁 Using CSV file: {csv_file}")
         else:
             print("❌ No cleaned CSV file found! Please run clean_csv.py first.")
-            return
+            return False
     
     output_dir = 'qr_codes_jpeg'
     
-    # Check if QR codes already exist
-    if os.path.exists(output_dir) and os.listdir(output_dir):
-        existing_files = [f for f in os.listdir(output_dir) if f.endswith('.jpg')]
-        if existing_files:
-            print(f"⚠️  Found {len(existing_files)} existing QR code files in {output_dir}/")
-            response = input("🗑️ Delete existing QR codes and regenerate? (y/N): ").lower()
-            if response != 'y':
-                print("❌ Operation cancelled. Existing QR codes preserved.")
-                return
-            else:
-                # Clear existing QR codes
-                for file in existing_files:
-                    os.remove(os.path.join(output_dir, file))
-                print("🗑️ Cleared existing QR codes")
+    if deterministic:
+        print(f"🔁 Deriving tokens for event {token_signing.EVENT_ID}; existing cards and rows are updated in place")
+    if shard:
+        print(f"🧩 Generating shard {shard[0]} of {shard[1]}")
     
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -195,16 +261,16 @@ def main():
         rows = list(reader)
     
     print(f"✅ Found {len(rows)} students")
-    print(f"📁 Creating QR codes in directory: {output_dir}")
+    print(f"📁 Creating QR codes in directory: {qr_store.STORE_DIR}")
     
-    conn = setup_database()
+    conn = setup_database(db_path)
     
     # Check if database already has data
     cursor = conn.cursor()
     cursor.execute('SELECT COUNT(*) FROM users')
     existing_users = cursor.fetchone()[0]
     
-    if existing_users > 0:
+    if existing_users > 0 and not deterministic:
         print(f"⚠️  Found {existing_users} existing users in database")
         response = input("🗑️ Clear existing database data? (y/N): ").lower()
         if response == 'y':
@@ -212,10 +278,12 @@ def main():
         else:
             print("❌ Operation cancelled. Existing database data preserved.")
             conn.close()
-            return
+            return False
     
     tokens_data = []
     processed_students = set()  # Track processed students to avoid duplicates
+    other_shards = 0
+    missing_usn = 0
     
     for i, row in enumerate(rows):
         name = row['Enter Your Name'].strip()
@@ -236,24 +304,19 @@ def main():
         # Use USN directly from CSV (no need to extract from email)
         # usn is already set above
         
-        token = str(uuid.uuid4())
-        
-        qr_data = {
-            "token": token,
-            "name": name,
-            "email": email,
-            "food_preference": food_pref,
-            "class": class_name,
-            "type": "food-token"
-        }
+        if deterministic and not usn:
+            print(f"⚠️  Skipping {name} ({email}): no USN to derive a token from")
+            missing_usn += 1
+            continue
         
-        sanitized_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip()
-        sanitized_name = sanitized_name.replace(' ', '_')
+        if shard and shard_of(usn, shard[1]) != shard[0] - 1:
+            other_shards += 1
+            continue
         
-        filename = f"{output_dir}/{sanitized_name}_{class_name.replace(' ', '_')}_{token[:8]}.jpg"
-        qr_code_path = f"qr_codes_jpeg/{sanitized_name}_{class_name.replace(' ', '_')}_{token[:8]}.jpg"
+        token = new_token(usn)
         
-        create_qr_with_text(json.dumps(qr_data), filename, name, food_pref, class_name)
+        # Cards go to the content-addressed store; an unchanged card is not drawn again
+        qr_code_path = store_card(token, name, email, food_pref, class_name)
         
         user_data = {
             'name': name,
@@ -266,6 +329,8 @@ def main():
         }
         
         user_id = insert_user_to_db(conn, user_data)
+        qr_store.record_references(conn, [(user_id, 'card', qr_store.key_of(qr_code_path))])
+        conn.commit()
         
         tokens_data.append({
             'id': user_id,
@@ -274,28 +339,34 @@ def main():
             'class': class_name,
             'food_preference': food_pref,
             'token': token,
-            'filename': filename,
+            'filename': qr_code_path,
             'qr_code_path': qr_code_path
         })
         
         if len(tokens_data) % 50 == 0:
             print(f"⏳ Generated {len(tokens_data)}/{len(rows)} QR codes and saved to database...")
     
-    with open(f'{output_dir}/tokens_list.json', 'w') as f:
+    # Each shard writes its own list so shard outputs can be copied together
+    tokens_file = f'{output_dir}/tokens_list-shard-{shard[0]}-of-{shard[1]}.json' if shard else f'{output_dir}/tokens_list.json'
+    with open(tokens_file, 'w') as f:
         json.dump(tokens_data, f, indent=2)
     
     conn.close()
     
     unique_students = len(tokens_data)
     total_rows = len(rows)
-    duplicates_skipped = total_rows - unique_students
+    duplicates_skipped = total_rows - unique_students - other_shards - missing_usn
     
     print(f"✅ Successfully generated {unique_students} QR codes!")
     if duplicates_skipped > 0:
         print(f"⚠️  Skipped {duplicates_skipped} duplicate entries from CSV")
-    print(f"📁 Files saved in: {output_dir}/")
-    print(f"📋 Token list saved as: {output_dir}/tokens_list.json")
-    print(f"💾 All data saved to database: database/food_tokens.db")
+    if other_shards > 0:
+        print(f"🧩 Left {other_shards} students to the other shards")
+    if missing_usn > 0:
+        print(f"⚠️  Skipped {missing_usn} students without a USN")
+    print(f"📁 Cards saved in: {qr_store.STORE_DIR}/")
+    print(f"📋 Token list saved as: {tokens_file}")
+    print(f"💾 All data saved to database: {db_path}")
     print(f"\n📈 SUMMARY:")
     
     veg_count = sum(1 for token in tokens_data if 'veg' in token['food_preference'].lower() and 'non' not in token['food_preference'].lower())
@@ -308,6 +379,16 @@ def main():
     print(f"   - Start server: npm start")
     print(f"   - Scanner: http://localhost:3000/scanner")
     print(f"   - Admin: http://localhost:3000/admin")
+    return True
 
 if __name__ == "__main__":
-    main()
+    profiling.configure_from_argv()
+    parser = argparse.ArgumentParser(description="Generate QR food token cards and the users table")
+    parser.add_argument('--shard', type=parse_shard, metavar='K/N',
+                        help="only generate the K-th of N slices of the roster (needs TOKEN_EVENT)")
+    parser.add_argument('--db', default='database/food_tokens.db', help="database file (default database/food_tokens.db)")
+    args = parser.parse_args()
+    with profiling.stage('generate'):
+        ok = main(args.shard, args.db)
+    if not ok:
+        sys.exit(1)
@@ -2,13 +2,14 @@
 import csv
 import qrcode
 from PIL import Image, ImageDraw, ImageFont
-import uuid
 import os
 import json
 import sqlite3
 from datetime import datetime
 import time
 from send_qr_emails import EmailSender
+import qr_store
+from token_signing import new_token
 
 def create_qr_with_text(data, filename, student_name, food_preference, class_name):
     qr = qrcode.QRCode(
@@ -83,6 +84,7 @@ def create_database():
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    qr_store.ensure_schema(conn)
     
     conn.commit()
     return conn
@@ -190,7 +192,7 @@ def main():
                 print(f"⚠️  Incomplete data for row {i}: {row}")
                 continue
             
-            token = str(uuid.uuid4())
+            token = new_token(usn)
             
             qr_data = {
                 'id': token,
@@ -203,13 +205,10 @@ def main():
                 'generated_at': datetime.now().isoformat()
             }
             
-            safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip()
-            safe_class = class_name.replace(' ', '_')
-            
-            filename = f"{safe_name}_{safe_class}_{token[:8]}.jpg"
-            qr_code_path = os.path.join(output_dir, filename)
-            
-            create_qr_with_text(json.dumps(qr_data), qr_code_path, name, food_pref, class_name)
+            payload = json.dumps(qr_data)
+            qr_code_path = qr_store.put(
+                qr_store.artifact_key('email-card', payload), '.jpg',
+                lambda path: create_qr_with_text(payload, path, name, food_pref, class_name))
             
             user_data = {
                 'name': name,
@@ -224,6 +223,8 @@ def main():
             user_id = insert_user_to_db(conn, user_data)
             
             if user_id:
+                qr_store.record_references(conn, [(user_id, 'card', qr_store.key_of(qr_code_path))])
+                conn.commit()
                 tokens_data.append({
                     'id': user_id,
                     'name': name,
@@ -231,7 +232,7 @@ def main():
                     'class': class_name,
                     'food_preference': food_pref,
                     'token': token,
-                    'filename': filename,
+                    'filename': os.path.basename(qr_code_path),
                     'qr_code_path': qr_code_path,
                     'usn': usn
                 })
@@ -275,7 +276,7 @@ def main():
         print(f"❌ Emails failed: {emails_failed}")
         print(f"📊 Email success rate: {(emails_sent/(emails_sent+emails_failed)*100):.1f}%" if (emails_sent+emails_failed) > 0 else "No emails attempted")
     
-    print(f"\n📁 Files saved in: {output_dir}/")
+    print(f"\n📁 Files saved in: {qr_store.STORE_DIR}/")
     print(f"📋 Token list: {output_dir}/tokens_list.json")
     print(f"💾 Database: database/food_tokens.db")
     
@@ -0,0 +1,61 @@
+const crypto = require('crypto');
+const zlib = require('zlib');
+
+// Bodies smaller than this are sent as-is; compressing them costs more than it saves
+const COMPRESSION_THRESHOLD = 1024;
+
+function contentETag(body) {
+    return `"${crypto.createHash('sha1').update(body).digest('base64url')}"`;
+}
+
+function negotiateEncoding(req) {
+    const encoding = req.acceptsEncodings(['br', 'gzip', 'identity']);
+    return encoding === 'br' || encoding === 'gzip' ? encoding : null;
+}
+
+function compress(body, encoding, callback) {
+    if (encoding === 'br') {
+        // Quality 11 (the default) is meant for static assets and is far too slow per request
+        zlib.brotliCompress(body, {
+            params: {
+                [zlib.constants.BROTLI_PARAM_QUALITY]: 4,
+                [zlib.constants.BROTLI_PARAM_SIZE_HINT]: body.length
+            }
+        }, callback);
+    } else {
+        zlib.gzip(body, { level: 6 }, callback);
+    }
+}
+
+// Send a JSON payload with a content-based ETag (304 on If-None-Match) and
+// gzip/brotli compression negotiated from Accept-Encoding.
+function sendJSON(req, res, payload) {
+    const body = Buffer.from(JSON.stringify(payload));
+
+    res.set('ETag', contentETag(body));
+    res.vary('Accept-Encoding');
+    res.type('application/json');
+
+    if (req.fresh) {
+        return res.status(304).end();
+    }
+
+    const encoding = body.length >= COMPRESSION_THRESHOLD ? negotiateEncoding(req) : null;
+    if (!encoding) {
+        return res.send(body);
+    }
+
+    compress(body, encoding, (err, compressed) => {
+        if (err) {
+            console.error('Error compressing response:', err);
+            return res.send(body);
+        }
+        res.set('Content-Encoding', encoding);
+        res.send(compressed);
+    });
+}
+
+module.exports = {
+    contentETag,
+    sendJSON
+};
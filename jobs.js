@@ -0,0 +1,96 @@
+const cluster = require('cluster');
+const { v4: uuidv4 } = require('uuid');
+
+// Finished jobs stay pollable for an hour, then they are dropped
+const JOB_TTL_MS = 60 * 60 * 1000;
+
+const jobs = new Map();
+
+// In cluster mode every worker keeps a mirror of all jobs, so a progress poll
+// can be answered by whichever worker receives it. The primary relays updates.
+function publish(job) {
+    if (cluster.isWorker) {
+        process.send({ type: 'job-update', job });
+    }
+}
+
+if (cluster.isWorker) {
+    process.on('message', (message) => {
+        if (message && message.type === 'job-update') {
+            jobs.set(message.job.id, message.job);
+        }
+    });
+}
+
+function pruneJobs() {
+    const cutoff = Date.now() - JOB_TTL_MS;
+    for (const [id, job] of jobs) {
+        if (job.finished_at && Date.parse(job.finished_at) < cutoff) {
+            jobs.delete(id);
+        }
+    }
+}
+
+// Clients may pass their own id so they can start polling before the request returns
+function createJob(type, requestedId) {
+    pruneJobs();
+
+    const id = /^[A-Za-z0-9_-]{8,64}$/.test(requestedId || '') && !jobs.has(requestedId)
+        ? requestedId
+        : uuidv4();
+
+    const job = {
+        id,
+        type,
+        status: 'running',
+        progress: {},
+        result: null,
+        error: null,
+        started_at: new Date().toISOString(),
+        finished_at: null
+    };
+    jobs.set(id, job);
+    publish(job);
+    return job;
+}
+
+function updateJob(job, progress) {
+    job.progress = progress;
+    publish(job);
+}
+
+function finishJob(job, result) {
+    job.status = 'completed';
+    job.result = result;
+    job.finished_at = new Date().toISOString();
+    publish(job);
+}
+
+function failJob(job, error) {
+    job.status = 'failed';
+    job.error = error.message || String(error);
+    job.finished_at = new Date().toISOString();
+    publish(job);
+}
+
+function getJob(id) {
+    return jobs.get(id) || null;
+}
+
+function findRunningJob(type) {
+    for (const job of jobs.values()) {
+        if (job.type === type && job.status === 'running') {
+            return job;
+        }
+    }
+    return null;
+}
+
+module.exports = {
+    createJob,
+    updateJob,
+    finishJob,
+    failJob,
+    getJob,
+    findRunningJob
+};
@@ -14,8 +14,14 @@ echo "✅ Service deleted"
 kubectl delete -f k8s/deployment.yaml
 echo "✅ Deployment deleted"
 
+kubectl delete -f k8s/ledger.yaml
+echo "✅ Scan ledger deleted"
+
 kubectl delete -f k8s/pvc.yaml
-echo "✅ PersistentVolumeClaims deleted"
+echo "✅ PersistentVolumeClaim deleted"
+
+kubectl delete secret food-token-ledger-secret -n food-token-scanner
+echo "✅ Ledger secret deleted"
 
 kubectl delete -f k8s/configmap.yaml
 echo "✅ ConfigMap deleted"
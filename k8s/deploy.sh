@@ -9,7 +9,17 @@ kubectl apply -f k8s/configmap.yaml
 echo "✅ ConfigMap created"
 
 kubectl apply -f k8s/pvc.yaml
-echo "✅ PersistentVolumeClaims created"
+echo "✅ PersistentVolumeClaim created"
+
+# The ledger and the replicas share this bearer token; it is generated once and kept across deploys
+if ! kubectl get secret food-token-ledger-secret -n food-token-scanner >/dev/null 2>&1; then
+    kubectl create secret generic food-token-ledger-secret -n food-token-scanner \
+        --from-literal=LEDGER_SECRET="$(openssl rand -hex 32)"
+fi
+echo "✅ Ledger secret created"
+
+kubectl apply -f k8s/ledger.yaml
+echo "✅ Scan ledger created"
 
 kubectl apply -f k8s/deployment.yaml
 echo "✅ Deployment created"
@@ -0,0 +1,65 @@
+// Single-writer scan ledger. Owns the SQLite database and serves the Database
+// methods to server.js replicas started with LEDGER_URL pointing here.
+const express = require('express');
+const Database = require('./database');
+const { LEDGER_METHODS } = require('./remote-database');
+
+const app = express();
+const PORT = process.env.LEDGER_PORT || 4000;
+const SECRET = process.env.LEDGER_SECRET;
+// Without a secret the ledger only listens on loopback: anyone who can reach it
+// could otherwise call clearAllData or redeemToken
+const HOST = process.env.LEDGER_HOST || (SECRET ? '0.0.0.0' : '127.0.0.1');
+const LOOPBACK_HOSTS = ['127.0.0.1', '::1', 'localhost'];
+
+if (!SECRET && !LOOPBACK_HOSTS.includes(HOST)) {
+    console.error(`❌ Refusing to listen on ${HOST} without LEDGER_SECRET; set it on the ledger and every replica`);
+    process.exit(1);
+}
+
+const db = new Database();
+
+app.use(express.json({ limit: '10mb' }));
+
+app.get('/health', (req, res) => {
+    res.json({ status: 'ok' });
+});
+
+app.post('/rpc/:method', async (req, res) => {
+    const { method } = req.params;
+
+    if (SECRET && req.get('Authorization') !== `Bearer ${SECRET}`) {
+        return res.status(401).json({ error: 'Unauthorized' });
+    }
+    if (!LEDGER_METHODS.includes(method)) {
+        return res.status(404).json({ error: `Unknown ledger method: ${method}` });
+    }
+
+    try {
+        const args = Array.isArray(req.body.args) ? req.body.args : [];
+        const result = await db[method](...args);
+        res.json({ result });
+    } catch (error) {
+        console.error(`Ledger call ${method} failed:`, error);
+        res.status(500).json({ error: error.message });
+    }
+});
+
+const ROLLUP_INTERVAL_MS = parseInt(process.env.ROLLUP_INTERVAL_MS, 10) || 60000;
+setInterval(() => {
+    db.compactScanRollups().catch(error => console.error('Error compacting scan rollups:', error));
+}, ROLLUP_INTERVAL_MS).unref();
+
+const server = app.listen(PORT, HOST, () => {
+    console.log(`Scan ledger running on ${HOST}:${PORT} (database: ${db.dbPath})`);
+});
+
+for (const signal of ['SIGINT', 'SIGTERM']) {
+    process.on(signal, () => {
+        console.log('Shutting down ledger...');
+        server.close(() => {
+            db.close();
+            process.exit(0);
+        });
+    });
+}
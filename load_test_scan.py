@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Scan API Load Test
+Seeds a throwaway database with a synthetic roster, starts the Node server
+against it and simulates several food counters scanning at the same time.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from generate_qr_with_db import setup_database
+
+# Share of each request type in the simulated traffic
+REQUEST_MIX = [
+    ('qr_json', 0.60),   # camera scan of a card
+    ('token', 0.10),     # raw token typed or pasted
+    ('usn', 0.15),       # manual USN entry
+    ('invalid', 0.05),   # unknown code
+    ('repeat', 0.10),    # card that was already used
+]
+
+# Status each request type should get from /api/scan
+EXPECTED_STATUS = {
+    'qr_json': 200,
+    'token': 200,
+    'usn': 200,
+    'invalid': 404,
+    'repeat': 409,
+}
+
+CLASSES = ['CSE A', 'CSE B', 'ISE A', 'ECE A', 'AIML A', 'DS A']
+
+
+def seed_roster(db_path, size, rng):
+    """Create a fresh database at db_path with `size` synthetic students"""
+    conn = setup_database(db_path)
+    students = []
+    for i in range(size):
+        token = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        students.append({
+            'name': f"Student {i:05d}",
+            'email': f"student{i:05d}@sahyadri.edu.in",
+            'usn': f"4SF22LT{i:05d}",
+            'class': rng.choice(CLASSES),
+            'food_preference': rng.choice(['veg', 'non-veg']),
+            'token': token,
+        })
+
+    with conn:
+        conn.executemany('''
+            INSERT INTO users (name, email, food_preference, token, qr_code_path, class_name, usn)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (s['name'], s['email'], s['food_preference'], s['token'], '', s['class'], s['usn'])
+            for s in students
+        ])
+    conn.close()
+    return students
+
+
+def start_server(db_path, port, workers=1, history_batch_ms=None):
+    """Start server.js against the throwaway database and wait until it answers"""
+    env = dict(os.environ, DB_PATH=db_path, PORT=str(port), CLUSTER_WORKERS=str(workers))
+    if history_batch_ms is not None:
+        env['SCAN_HISTORY_BATCH_MS'] = str(history_batch_ms)
+    # The server logs every rejected scan; a file never fills up and blocks it the way an unread pipe would
+    log_path = db_path + '.server.log'
+    with open(log_path, 'wb') as log:
+        server = subprocess.Popen(
+            ['node', 'server.js'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=log,
+        )
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            with open(log_path, 'rb') as log:
+                raise RuntimeError(f"Server exited: {log.read().decode(errors='replace')}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/stats')
+            conn.getresponse().read()
+            conn.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.terminate()
+    raise RuntimeError("Server did not start within 30 seconds")
+
+
+def rush_rate(t, duration, peak_rate):
+    """Arrival rate at time t: quick build-up to a peak at 30% of the run, then a long tail"""
+    x = t / duration / 0.3
+    return peak_rate * x * math.exp(1 - x)
+
+
+def arrival_times(duration, peak_rate, rng):
+    """Non-homogeneous Poisson arrivals following rush_rate (thinning method)"""
+    times = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(peak_rate)
+        if t >= duration:
+            return times
+        if rng.random() <= rush_rate(t, duration, peak_rate) / peak_rate:
+            times.append(t)
+
+
+class Roster:
+    """Students shared by all counters: who is still unscanned and who already ate"""
+
+    def __init__(self, students, rng):
+        self.lock = threading.Lock()
+        self.unscanned = list(students)
+        rng.shuffle(self.unscanned)
+        self.scanned = []
+
+    def take_unscanned(self):
+        with self.lock:
+            if not self.unscanned:
+                return None
+            student = self.unscanned.pop()
+            self.scanned.append(student)
+            return student
+
+    def any_scanned(self, rng):
+        with self.lock:
+            return rng.choice(self.scanned) if self.scanned else None
+
+
+def build_payload(kind, roster, rng):
+    """Return (kind, qrData); falls back to another kind when the roster runs dry"""
+    if kind == 'repeat':
+        student = roster.any_scanned(rng)
+        if student:
+            return kind, json.dumps({"token": student['token'], "name": student['name'], "type": "food-token"})
+        kind = 'qr_json'
+
+    if kind == 'invalid':
+        return kind, str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    student = roster.take_unscanned()
+    if student is None:
+        return 'invalid', str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    if kind == 'token':
+        return kind, student['token']
+    if kind == 'usn':
+        return kind, student['usn']
+    return 'qr_json', json.dumps({
+        "token": student['token'],
+        "name": student['name'],
+        "email": student['email'],
+        "food_preference": student['food_preference'],
+        "class": student['class'],
+        "type": "food-token",
+    })
+
+
+class Counter(threading.Thread):
+    """One food counter: a single keep-alive connection serving its own queue of arrivals"""
+
+    def __init__(self, counter_id, url, roster, arrivals, start_at, seed, deadline=None):
+        super().__init__(daemon=True)
+        self.counter_id = counter_id
+        self.url = url
+        self.roster = roster
+        self.arrivals = arrivals
+        self.start_at = start_at
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.results = []
+        self.conn = None
+
+    def connect(self):
+        if self.conn:
+            self.conn.close()
+        self.conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=30)
+
+    def post_scan(self, qr_data):
+        body = json.dumps({'qrData': qr_data, 'counter_id': f"loadtest-{self.counter_id}"}).encode()
+        try:
+            self.conn.request('POST', '/api/scan', body=body,
+                              headers={'Content-Type': 'application/json'})
+            response = self.conn.getresponse()
+            response.read()
+            return response.status
+        except (http.client.HTTPException, OSError):
+            # A scan is not idempotent: retrying would redeem twice and hide the failure,
+            # so it is reported as one and the next scan gets a fresh connection
+            self.connect()
+            raise
+
+    def schedule(self):
+        """Arrival offsets; without an arrival list the counter runs flat out until the deadline"""
+        if self.arrivals is not None:
+            yield from self.arrivals
+            return
+        # Closed loop: the next student steps up as soon as the previous scan returns
+        while time.perf_counter() < self.deadline:
+            yield max(0.0, time.perf_counter() - self.start_at)
+
+    def run(self):
+        self.connect()
+        kinds = [kind for kind, _ in REQUEST_MIX]
+        weights = [weight for _, weight in REQUEST_MIX]
+
+        for arrival in self.schedule():
+            delay = self.start_at + arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Time the student spent waiting because the counter was still busy
+            queue_wait = max(0.0, time.perf_counter() - self.start_at - arrival)
+
+            kind, qr_data = build_payload(self.rng.choices(kinds, weights)[0], self.roster, self.rng)
+            started = time.perf_counter()
+            try:
+                status = self.post_scan(qr_data)
+            except (http.client.HTTPException, OSError):
+                status = None
+            latency = time.perf_counter() - started
+
+            self.results.append({
+                'kind': kind,
+                'status': status,
+                'ok': status == EXPECTED_STATUS[kind],
+                'latency': latency,
+                'queue_wait': queue_wait,
+            })
+
+        self.conn.close()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def print_report(counters, wall_time):
+    results = [r for counter in counters for r in counter.results]
+    by_kind = defaultdict(list)
+    for result in results:
+        by_kind[result['kind']].append(result)
+
+    print(f"\n📊 LOAD TEST RESULTS")
+    print("=" * 78)
+    print(f"Requests: {len(results)} in {wall_time:.1f}s "
+          f"({len(results) / wall_time:.1f} req/s across {len(counters)} counters)")
+    print()
+    print(f"{'Type':<10}{'Count':>8}{'Errors':>8}{'Err %':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    print("-" * 78)
+
+    for kind, _ in REQUEST_MIX + [('all', None)]:
+        rows = results if kind == 'all' else by_kind.get(kind, [])
+        if not rows:
+            continue
+        latencies = sorted(r['latency'] * 1000 for r in rows)
+        errors = sum(1 for r in rows if not r['ok'])
+        print(f"{kind:<10}{len(rows):>8}{errors:>8}{errors / len(rows) * 100:>7.1f}%"
+              f"{percentile(latencies, 50):>10.1f}{percentile(latencies, 95):>10.1f}"
+              f"{percentile(latencies, 99):>10.1f}{latencies[-1]:>10.1f}")
+
+    waits = sorted(r['queue_wait'] * 1000 for r in results)
+    statuses = defaultdict(int)
+    for result in results:
+        statuses[result['status'] or 'transport error'] += 1
+
+    print()
+    print(f"⏳ Queue wait at counters: p50 {percentile(waits, 50):.1f} ms, "
+          f"p95 {percentile(waits, 95):.1f} ms, p99 {percentile(waits, 99):.1f} ms")
+    print(f"📨 Status codes: {dict(sorted(statuses.items(), key=lambda item: str(item[0])))}")
+    print(f"🍽️ Per counter: " + ", ".join(f"#{c.counter_id}: {len(c.results)}" for c in counters))
+
+
+def run_once(args, url, students, rng):
+    """Run the counters against url once; returns (counters, wall_time)"""
+    roster = Roster(students, rng)
+    start_at = time.perf_counter() + 0.5
+
+    if args.closed_loop:
+        deadline = start_at + args.duration
+        counters = [Counter(i + 1, url, roster, None, start_at, args.seed + i + 1, deadline)
+                    for i in range(args.counters)]
+        print(f"🍽️ Running {args.counters} counters flat out for {args.duration:.0f}s")
+    else:
+        counters = [
+            Counter(i + 1, url, roster, arrival_times(args.duration, args.peak_rate, rng),
+                    start_at, args.seed + i + 1)
+            for i in range(args.counters)
+        ]
+        total = sum(len(c.arrivals) for c in counters)
+        print(f"🍽️ Simulating {args.counters} counters, {total} arrivals over {args.duration:.0f}s")
+
+    for counter in counters:
+        counter.start()
+    for counter in counters:
+        counter.join()
+
+    return counters, time.perf_counter() - start_at
+
+
+def print_comparison(runs):
+    """Throughput against latency for each (workers, history batch window) run"""
+    print(f"\n⚙️ SERVER SETTINGS COMPARISON")
+    print("=" * 72)
+    print(f"{'Workers':>8}{'Batch ms':>10}{'Req/s':>10}{'Scans/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'Errors':>10}")
+    print("-" * 72)
+    for workers, batch_ms, counters, wall_time in runs:
+        results = [r for counter in counters for r in counter.results]
+        latencies = sorted(r['latency'] * 1000 for r in results)
+        redeemed = sum(1 for r in results if r['status'] == 200)
+        errors = sum(1 for r in results if not r['ok'])
+        batch_label = 'default' if batch_ms is None else batch_ms
+        print(f"{workers:>8}{batch_label:>10}{len(results) / wall_time:>10.1f}{redeemed / wall_time:>10.1f}"
+              f"{percentile(latencies, 50):>10.1f}{percentile(latencies, 99):>10.1f}{errors:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent food counters against /api/scan")
+    parser.add_argument('--counters', type=int, default=10, help="number of concurrent counters")
+    parser.add_argument('--students', type=int, default=2000, help="synthetic roster size")
+    parser.add_argument('--duration', type=float, default=60, help="length of the rush in seconds")
+    parser.add_argument('--peak-rate', type=float, default=2.0,
+                        help="arrivals per second at each counter at the peak of the rush")
+    parser.add_argument('--closed-loop', action='store_true',
+                        help="ignore the arrival curve and scan back-to-back to measure maximum throughput")
+    parser.add_argument('--workers', default='1',
+                        help="comma-separated CLUSTER_WORKERS values to compare, e.g. 1,2,4")
+    parser.add_argument('--history-batch-ms',
+                        help="comma-separated SCAN_HISTORY_BATCH_MS values to compare, e.g. 0,2,5,10 "
+                             "(group-commit window for scan history inserts)")
+    parser.add_argument('--port', type=int, default=3900, help="port for the test server")
+    parser.add_argument('--url', help="target an already running server (started with DB_PATH=--db; needs --db)")
+    parser.add_argument('--db', help="path for the throwaway database (must not exist)")
+    parser.add_argument('--seed', type=int, default=42, help="random seed for roster and traffic")
+    args = parser.parse_args()
+
+    worker_counts = [int(w) for w in args.workers.split(',')]
+    batch_windows = [int(ms) for ms in args.history_batch_ms.split(',')] if args.history_batch_ms else [None]
+    settings = [(workers, batch_ms) for workers in worker_counts for batch_ms in batch_windows]
+    if args.url and len(settings) > 1:
+        print("❌ --workers and --history-batch-ms can only compare servers started by this script (drop --url)")
+        sys.exit(1)
+    if args.url and not args.db:
+        # Otherwise the roster is seeded into a database the server never reads
+        print("❌ --url needs --db: the database file the server was started with (DB_PATH)")
+        sys.exit(1)
+    if args.db and len(settings) > 1:
+        print(f"❌ --db can only be used for a single run")
+        sys.exit(1)
+    if args.db and os.path.exists(args.db):
+        # A server started with DB_PATH=--db has already created the file; only an empty roster is allowed
+        conn = sqlite3.connect(args.db)
+        try:
+            has_users = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'users'").fetchone() and \
+                conn.execute('SELECT 1 FROM users LIMIT 1').fetchone()
+        finally:
+            conn.close()
+        if not args.url or has_users:
+            print(f"❌ --db must be a new file, or the empty database of the server given by --url")
+            sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix='food-token-loadtest-')
+    runs = []
+    try:
+        for workers, batch_ms in settings:
+            # Every run starts from the same fresh roster
+            rng = random.Random(args.seed)
+            db_path = args.db or os.path.join(workdir, f"food_tokens_{workers}_{batch_ms}.db")
+            print(f"\n🌱 Seeding {args.students} synthetic students into {db_path}")
+            students = seed_roster(db_path, args.students, rng)
+
+            server = None
+            try:
+                if args.url:
+                    url = urlparse(args.url)
+                else:
+                    window = '' if batch_ms is None else f", {batch_ms} ms history batch window"
+                    print(f"🚀 Starting server on port {args.port} with {workers} worker(s){window}")
+                    server = start_server(db_path, args.port, workers, batch_ms)
+                    url = urlparse(f"http://127.0.0.1:{args.port}")
+
+                counters, wall_time = run_once(args, url, students, rng)
+                print_report(counters, wall_time)
+                runs.append((workers, batch_ms, counters, wall_time))
+            finally:
+                if server:
+                    server.terminate()
+                    server.wait(timeout=15)
+
+        if len(runs) > 1:
+            print_comparison(runs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Merge Sharded Generator Runs
+Combines the databases written by `generate_qr_with_db.py --shard K/N` on
+separate machines into one database and rebuilds tokens_list.json from it.
+Tokens are derived from the USN and event (TOKEN_EVENT), so the same student
+always has the same token and merging is idempotent: rows already present
+are left alone. Copy each shard's qr_store/ tree alongside; cards are stored
+under a hash of their contents, so the trees never collide.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from generate_qr_with_db import setup_database
+from qr_paths import QR_DIR
+
+DB_PATH = 'database/food_tokens.db'
+
+MERGE_SQL = '''
+    INSERT INTO users (name, email, phone, food_preference, token, qr_code_path,
+                       is_scanned, scanned_at, created_at, class_name, usn)
+    SELECT name, email, phone, food_preference, token, qr_code_path,
+           is_scanned, scanned_at, created_at, class_name, usn
+    FROM shard.users WHERE true
+    ON CONFLICT(token) DO NOTHING
+'''
+
+# The same USN under two tokens means the shards used a different TOKEN_EVENT or key
+CONFLICT_SQL = '''
+    SELECT s.usn, s.token, u.token FROM shard.users s
+    JOIN main.users u ON u.usn = s.usn COLLATE NOCASE AND u.token <> s.token
+    WHERE s.usn IS NOT NULL AND s.usn <> ''
+'''
+
+
+def merge_shard(conn, shard_path):
+    """Returns (inserted, conflicts) for one shard database"""
+    conn.execute('ATTACH DATABASE ? AS shard', (shard_path,))
+    try:
+        conflicts = conn.execute(CONFLICT_SQL).fetchall()
+        if conflicts:
+            return 0, conflicts
+        conn.execute('BEGIN IMMEDIATE')
+        inserted = conn.execute(MERGE_SQL).rowcount
+        conn.execute('COMMIT')
+        return inserted, []
+    finally:
+        conn.execute('DETACH DATABASE shard')
+
+
+def write_tokens_list(conn, output_dir=QR_DIR):
+    rows = conn.execute('''
+        SELECT id, name, email, class_name, food_preference, token, qr_code_path
+        FROM users ORDER BY id
+    ''').fetchall()
+    tokens_data = [{
+        'id': user_id,
+        'name': name,
+        'email': email,
+        'class': class_name,
+        'food_preference': food_preference,
+        'token': token,
+        'filename': qr_code_path,
+        'qr_code_path': qr_code_path
+    } for user_id, name, email, class_name, food_preference, token, qr_code_path in rows]
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, 'tokens_list.json')
+    with open(path, 'w') as f:
+        json.dump(tokens_data, f, indent=2)
+    return path, len(tokens_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge shard databases from generate_qr_with_db.py --shard")
+    parser.add_argument('shards', nargs='+', metavar='SHARD_DB', help="databases written by each shard")
+    parser.add_argument('--db', default=DB_PATH, help=f"database to merge into (default {DB_PATH})")
+    args = parser.parse_args()
+
+    missing = [path for path in args.shards if not os.path.exists(path)]
+    if missing:
+        print(f"❌ Shard database not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    conn = setup_database(args.db)
+    conn.isolation_level = None
+
+    failed = False
+    for shard_path in args.shards:
+        if os.path.abspath(shard_path) == os.path.abspath(args.db):
+            print(f"⏭️ Skipping {shard_path}: it is the target database")
+            continue
+        inserted, conflicts = merge_shard(conn, shard_path)
+        if conflicts:
+            failed = True
+            print(f"❌ {shard_path}: {len(conflicts)} students already have a different token, not merged")
+            for usn, shard_token, existing_token in conflicts[:5]:
+                print(f"   {usn}: {shard_token} vs {existing_token}")
+            print("💡 Every shard must run with the same TOKEN_EVENT and TOKEN_KEYS")
+            continue
+        print(f"✅ {shard_path}: {inserted} new students")
+
+    path, count = write_tokens_list(conn)
+    conn.close()
+    print(f"📋 Rebuilt {path} with {count} students")
+    print(f"💾 Merged database: {args.db}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
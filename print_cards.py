@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Print-ready QR Card Sheets
+Imposes the food token cards from the database onto A4 pages (3 x 4 by
+default) and writes multi-page PDFs, one per class or one combined file.
+Cards are rebuilt from the QR matrices with the same layout as
+generate_qr_with_db.py, so no JPEG has to be decoded. Pages are rendered in
+parallel worker processes and streamed to disk one at a time, so memory does
+not grow with the roster.
+"""
+import argparse
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from itertools import groupby
+from multiprocessing import Pool
+
+from PIL import Image, ImageDraw, ImageFont
+
+import profiling
+from generate_qr_with_db import draw_card_text, make_qr, qr_payload
+
+DB_PATH = 'database/food_tokens.db'
+OUTPUT_DIR = 'print_sheets'
+
+# Card layout in pixels, same as create_qr_with_text()
+CARD_WIDTH = 600
+CARD_HEIGHT = 700
+QR_SIZE = 400
+QR_TOP = 50
+
+# A4 portrait in millimetres and PDF points
+PAGE_MM = (210, 297)
+PAGE_PT = (595.28, 841.89)
+MARGIN_MM = 10
+GUTTER_MM = 4
+FOOTER_MM = 6
+
+
+def page_layout(cols, rows):
+    """Pixel geometry for a page that fits cols x rows cards at their native 600x700 size"""
+    cell_w = (PAGE_MM[0] - 2 * MARGIN_MM - (cols - 1) * GUTTER_MM) / cols
+    cell_h = (PAGE_MM[1] - 2 * MARGIN_MM - FOOTER_MM - (rows - 1) * GUTTER_MM) / rows
+    card_mm = min(cell_w, cell_h * CARD_WIDTH / CARD_HEIGHT)
+    if card_mm < 30:
+        raise ValueError(f"{cols} x {rows} cards per page would print cards narrower than 30 mm")
+
+    px_per_mm = CARD_WIDTH / card_mm
+    page_w = round(PAGE_MM[0] * px_per_mm)
+    page_h = round(PAGE_MM[1] * px_per_mm)
+    gutter = round(GUTTER_MM * px_per_mm)
+    grid_w = cols * CARD_WIDTH + (cols - 1) * gutter
+    grid_h = rows * CARD_HEIGHT + (rows - 1) * gutter
+    left = (page_w - grid_w) // 2
+    top = (page_h - round(FOOTER_MM * px_per_mm) - grid_h) // 2
+    return {
+        'cols': cols,
+        'rows': rows,
+        'page_size': (page_w, page_h),
+        'dpi': round(px_per_mm * 25.4),
+        'slots': [(left + c * (CARD_WIDTH + gutter), top + r * (CARD_HEIGHT + gutter))
+                  for r in range(rows) for c in range(cols)],
+        'footer_y': page_h - round((MARGIN_MM + FOOTER_MM / 2) * px_per_mm),
+    }
+
+
+def render_card(payload, name, food_preference, class_name):
+    matrix = make_qr(payload).get_matrix()
+    modules = len(matrix)
+    box = QR_SIZE // modules
+    qr_img = Image.frombytes('L', (modules, modules),
+                             bytes(0 if cell else 255 for row in matrix for cell in row))
+    qr_img = qr_img.resize((modules * box, modules * box), Image.NEAREST)
+
+    card = Image.new('RGB', (CARD_WIDTH, CARD_HEIGHT), 'white')
+    offset = (QR_SIZE - modules * box) // 2
+    card.paste(qr_img, ((CARD_WIDTH - QR_SIZE) // 2 + offset, QR_TOP + offset))
+    draw_card_text(card, name, food_preference, class_name)
+    return card
+
+
+def render_page(job):
+    """Worker: render one page and return it as Flate-compressed RGB rows"""
+    layout, footer, cards = job
+    page = Image.new('RGB', layout['page_size'], 'white')
+    draw = ImageDraw.Draw(page)
+    for (x, y), card in zip(layout['slots'], cards):
+        page.paste(render_card(*card), (x, y))
+        # Light cut guide around each card
+        draw.rectangle((x - 1, y - 1, x + CARD_WIDTH, y + CARD_HEIGHT), outline=(200, 200, 200))
+
+    try:
+        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 20)
+    except OSError:
+        font = ImageFont.load_default()
+    draw.text((layout['page_size'][0] // 2, layout['footer_y']), footer, font=font, fill='gray', anchor='mm')
+    return zlib.compress(page.tobytes(), 6)
+
+
+class PdfSheetWriter:
+    """Minimal streaming PDF writer: one full-page image per page, written as it arrives"""
+
+    def __init__(self, path, page_size):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.page_size = page_size
+        self.file = open(self.temp_path, 'wb')
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3  # 1 = catalog, 2 = page tree, both written on close
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _object(self, obj_id, header, stream=None):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(f"{obj_id} 0 obj\n{header}\n".encode())
+        if stream is not None:
+            self.file.write(b'stream\n')
+            self.file.write(stream)
+            self.file.write(b'\nendstream\n')
+        self.file.write(b'endobj\n')
+
+    def _allocate(self, count):
+        ids = range(self.next_id, self.next_id + count)
+        self.next_id += count
+        return ids
+
+    def add_page(self, compressed_rgb):
+        image_id, content_id, page_id = self._allocate(3)
+        width, height = self.page_size
+        self._object(image_id,
+                     f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                     f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode "
+                     f"/Length {len(compressed_rgb)} >>",
+                     compressed_rgb)
+        content = f"q {PAGE_PT[0]} 0 0 {PAGE_PT[1]} 0 0 cm /Im0 Do Q".encode()
+        self._object(content_id, f"<< /Length {len(content)} >>", content)
+        self._object(page_id,
+                     f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_PT[0]} {PAGE_PT[1]}] "
+                     f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>")
+        self.page_ids.append(page_id)
+
+    def close(self):
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self._object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self.file.tell()
+        self.file.write(f"xref\n0 {self.next_id}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, self.next_id):
+            self.file.write(f"{self.offsets[obj_id]:010d} 00000 n \n".encode())
+        self.file.write(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\n"
+                        f"startxref\n{xref_offset}\n%%EOF\n".encode())
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+
+def load_students(db_path, classes=None):
+    sql = '''
+        SELECT COALESCE(NULLIF(trim(class_name), ''), 'Unassigned') AS class_name,
+               name, email, food_preference, token
+        FROM users
+    '''
+    params = []
+    if classes:
+        sql += f" WHERE class_name IN ({', '.join('?' for _ in classes)})"
+        params = list(classes)
+    sql += ' ORDER BY class_name, name COLLATE NOCASE, id'
+
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def plan_pages(students, layout, combined):
+    """Yield (output_name, job) per page; every class starts on a fresh page"""
+    per_page = layout['cols'] * layout['rows']
+    for class_name, group in groupby(students, key=lambda student: student[0]):
+        group = list(group)
+        pages = math.ceil(len(group) / per_page)
+        output_name = 'all_classes' if combined else re.sub(r'[^A-Za-z0-9_-]+', '_', class_name)
+        for number in range(pages):
+            chunk = group[number * per_page:(number + 1) * per_page]
+            cards = [(qr_payload(token, name, email, food_preference, class_name),
+                      name, food_preference, class_name)
+                     for class_name, name, email, food_preference, token in chunk]
+            footer = f"{class_name} - page {number + 1} of {pages} - {len(group)} cards"
+            yield output_name, (layout, footer, cards)
+
+
+def print_sheets(db_path=DB_PATH, output_dir=OUTPUT_DIR, classes=None, combined=False,
+                 cols=3, rows=4, workers=None):
+    """Write the PDFs; returns {path: page_count}"""
+    layout = page_layout(cols, rows)
+    students = load_students(db_path, classes)
+    if not students:
+        print("📭 No students found to print")
+        return {}
+
+    os.makedirs(output_dir, exist_ok=True)
+    planned = list(plan_pages(students, layout, combined))
+    print(f"🖨️ {len(students)} cards on {len(planned)} pages "
+          f"({cols} x {rows} per A4 page, {layout['dpi']} dpi)")
+
+    written = {}
+    writer = None
+    with Pool(workers) as pool:
+        pages = pool.imap(render_page, (job for _, job in planned))
+        for (output_name, _), compressed in zip(planned, pages):
+            path = os.path.join(output_dir, f"{output_name}.pdf")
+            if writer is None or writer.path != path:
+                if writer is not None:
+                    writer.close()
+                    print(f"✅ {writer.path}: {len(writer.page_ids)} pages")
+                writer = PdfSheetWriter(path, layout['page_size'])
+            writer.add_page(compressed)
+            written[path] = len(writer.page_ids)
+    writer.close()
+    print(f"✅ {writer.path}: {len(writer.page_ids)} pages")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Impose QR food token cards onto printable A4 PDF sheets")
+    parser.add_argument('--db', default=DB_PATH, help=f"database file (default {DB_PATH})")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help=f"where PDFs are written (default {OUTPUT_DIR}/)")
+    parser.add_argument('--class', dest='classes', action='append', help="only this class (repeatable)")
+    parser.add_argument('--combined', action='store_true', help="one PDF for all classes instead of one per class")
+    parser.add_argument('--cols', type=int, default=3, help="cards across each page (default 3)")
+    parser.add_argument('--rows', type=int, default=4, help="cards down each page (default 4)")
+    parser.add_argument('--workers', type=int, default=None, help="rendering processes (default: all cores)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    try:
+        written = print_sheets(args.db, args.output_dir, args.classes, args.combined,
+                               args.cols, args.rows, args.workers)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if written:
+        print(f"⏱️ Wrote {len(written)} PDF(s), {sum(written.values())} pages in "
+              f"{time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    profiling.configure_from_argv()
+    with profiling.stage('print'):
+        main()
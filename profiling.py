@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling for the Python tools.
+
+Enable with FOOD_TOKEN_PROFILE=cprofile|sample (or 1) or by passing
+--profile / --profile=sample to a script. Each profiling.stage() then writes
+profiles/<script>-<stage>.pstats (cProfile) or .speedscope.json (sampling),
+plus a .tracemalloc snapshot, and a summary table of stages and
+profiling.step() timings is printed at exit.
+
+When disabled, stage() and step() return a shared no-op context manager, so
+instrumented code pays one function call per use.
+"""
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+PROFILE_DIR = os.environ.get('FOOD_TOKEN_PROFILE_DIR', 'profiles')
+SAMPLE_INTERVAL = float(os.environ.get('FOOD_TOKEN_PROFILE_INTERVAL', '0.005'))
+MODES = ('cprofile', 'sample')
+
+MODE = None
+SCRIPT = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+
+
+class _NoOp:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoOp()
+_lock = threading.Lock()
+_profiler_active = False
+# Stages inside tracemalloc; the first one in starts tracing and the last one out stops it
+_tracing_stages = 0
+_tracing_owned = False
+_stages = []
+_steps = defaultdict(lambda: [0, 0.0, 0.0])  # name -> [calls, total, max]
+
+
+def enable(mode='cprofile'):
+    global MODE
+    mode = 'cprofile' if mode in ('1', 'true', 'yes', '') else mode
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode {mode!r}; use one of {', '.join(MODES)}")
+    if MODE is None:
+        atexit.register(report)
+    MODE = mode
+
+
+def configure_from_argv(argv=None):
+    """Consume --profile[=mode] from argv so the script's own parser never sees it"""
+    argv = sys.argv if argv is None else argv
+    for arg in list(argv[1:]):
+        if arg == '--profile' or arg.startswith('--profile='):
+            argv.remove(arg)
+            enable(arg.partition('=')[2] or 'cprofile')
+
+
+def enabled():
+    return MODE is not None
+
+
+class _Sampler:
+    """Wall-clock sampler of one thread's stack, exported in speedscope format"""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.frames = []
+        self.frame_index = {}
+        self.samples = []
+        self.weights = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.ended = time.perf_counter()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_name, code.co_filename, code.co_firstlineno)
+                if key not in self.frame_index:
+                    self.frame_index[key] = len(self.frames)
+                    self.frames.append({'name': key[0], 'file': key[1], 'line': key[2]})
+                stack.append(self.frame_index[key])
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append((now - last) * 1000)
+            last = now
+
+    def dump(self, path, name):
+        with open(path, 'w') as f:
+            json.dump({
+                '$schema': 'https://www.speedscope.app/file-format-schema.json',
+                'shared': {'frames': self.frames},
+                'profiles': [{
+                    'type': 'sampled',
+                    'name': name,
+                    'unit': 'milliseconds',
+                    'startValue': 0,
+                    'endValue': (self.ended - self.started) * 1000,
+                    'samples': self.samples,
+                    'weights': self.weights,
+                }],
+                'name': name,
+                'exporter': 'food-token profiling.py',
+            }, f)
+
+
+def _start_tracing():
+    """Returns True when other stages are already tracing"""
+    global _tracing_stages, _tracing_owned
+    with _lock:
+        if _tracing_stages == 0:
+            _tracing_owned = not tracemalloc.is_tracing()
+            if _tracing_owned:
+                tracemalloc.start()
+        _tracing_stages += 1
+        return _tracing_stages > 1
+
+
+def _stop_tracing():
+    global _tracing_stages
+    with _lock:
+        _tracing_stages -= 1
+        if _tracing_stages == 0 and _tracing_owned:
+            tracemalloc.stop()
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        global _profiler_active
+        self.output = None
+        self.profiler = None
+
+        # Only one profiler may run at a time; nested or concurrent stages are timed only
+        with _lock:
+            if not _profiler_active:
+                _profiler_active = True
+                self.profiler = (cProfile.Profile() if MODE == 'cprofile'
+                                 else _Sampler(threading.get_ident()))
+
+        # Overlapping stages share the tracer, so their peaks are process-wide
+        if not _start_tracing():
+            tracemalloc.reset_peak()
+        self.memory_before = tracemalloc.get_traced_memory()[0]
+
+        self.started = time.perf_counter()
+        if self.profiler is not None:
+            if MODE == 'cprofile':
+                self.profiler.enable()
+            else:
+                self.profiler.start()
+        return self
+
+    def __exit__(self, *exc):
+        global _profiler_active
+        elapsed = time.perf_counter() - self.started
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        _stop_tracing()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"{SCRIPT}-{self.name}")
+        if self.profiler is not None:
+            if MODE == 'cprofile':
+                self.profiler.disable()
+                self.output = f"{base}.pstats"
+                self.profiler.dump_stats(self.output)
+            else:
+                self.profiler.stop()
+                self.output = f"{base}.speedscope.json"
+                self.profiler.dump(self.output, f"{SCRIPT} {self.name}")
+            with _lock:
+                _profiler_active = False
+        snapshot.dump(f"{base}.tracemalloc")
+
+        top = snapshot.statistics('lineno')[:3]
+        with _lock:
+            _stages.append({
+                'name': self.name,
+                'seconds': elapsed,
+                'peak_mb': (peak - self.memory_before) / (1024 * 1024),
+                'retained_mb': (current - self.memory_before) / (1024 * 1024),
+                'output': self.output,
+                'top_allocations': [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} "
+                                    f"{stat.size / 1024:.0f} KiB" for stat in top],
+            })
+        return False
+
+
+class _Step:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        entry = _steps[self.name]
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+        return False
+
+
+def stage(name):
+    """Profile a whole stage: cProfile or sampling, plus tracemalloc peak memory"""
+    if MODE is None:
+        return _NOOP
+    return _Stage(name)
+
+
+def step(name):
+    """Time a small inner step; aggregated as calls / total / mean / max"""
+    if MODE is None:
+        return _NOOP
+    return _Step(name)
+
+
+def report():
+    if not _stages and not _steps:
+        return
+    print(f"\n🔬 PROFILE SUMMARY ({MODE})")
+    print("=" * 78)
+    if _stages:
+        print(f"{'Stage':<22}{'Wall s':>9}{'Peak MB':>10}{'Kept MB':>10}  Output")
+        print("-" * 78)
+        for entry in _stages:
+            print(f"{entry['name'][:21]:<22}{entry['seconds']:>9.2f}{entry['peak_mb']:>10.1f}"
+                  f"{entry['retained_mb']:>10.1f}  {entry['output'] or '(timed only)'}")
+            for allocation in entry['top_allocations']:
+                print(f"{'':<24}↳ {allocation}")
+    if _steps:
+        print(f"\n{'Step':<22}{'Calls':>8}{'Total s':>10}{'Mean ms':>10}{'Max ms':>10}")
+        print("-" * 60)
+        for name, (calls, total, longest) in sorted(_steps.items(), key=lambda item: -item[1][1]):
+            print(f"{name[:21]:<22}{calls:>8}{total:>10.3f}{total / calls * 1000:>10.2f}{longest * 1000:>10.2f}")
+    print(f"\n💡 View .pstats with `python -m pstats` or snakeviz, .speedscope.json at https://www.speedscope.app")
+
+
+if os.environ.get('FOOD_TOKEN_PROFILE', '').lower() not in ('', '0', 'false', 'no'):
+    enable(os.environ['FOOD_TOKEN_PROFILE'].lower())
@@ -0,0 +1,79 @@
+const archiver = require('archiver');
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+
+const CACHE_DIR = path.join(__dirname, 'cache');
+
+// Builds already in flight, so concurrent downloads share one archive
+const pendingBuilds = new Map();
+
+// Entries point into the content-addressed QR store, so their names and paths
+// alone identify the archive's contents without touching the images
+function entriesHash(entries) {
+    const hash = crypto.createHash('sha1');
+    for (const entry of entries) {
+        hash.update(`${entry.name}\0${entry.path}\n`);
+    }
+    return hash.digest('hex').slice(0, 16);
+}
+
+function buildArchive(entries, archivePath) {
+    return new Promise((resolve, reject) => {
+        const tmpPath = `${archivePath}.${process.pid}.tmp`;
+        const output = fs.createWriteStream(tmpPath);
+        // PNG/JPEG data is already compressed, so deflating it again only burns CPU
+        const archive = archiver('zip', { store: true });
+
+        output.on('close', () => {
+            fs.promises.rename(tmpPath, archivePath).then(resolve, reject);
+        });
+        output.on('error', reject);
+        archive.on('error', reject);
+
+        archive.pipe(output);
+        for (const entry of entries) {
+            archive.file(entry.path, { name: entry.name });
+        }
+        archive.finalize();
+    });
+}
+
+async function removeStaleArchives(prefix, keep) {
+    const entries = await fs.promises.readdir(CACHE_DIR);
+    await Promise.all(entries
+        .filter(name => name.startsWith(prefix) && name !== keep && name.endsWith('.zip'))
+        .map(name => fs.promises.unlink(path.join(CACHE_DIR, name)).catch(() => {})));
+}
+
+// Return { path, hash } of a zip of [{ name, path }] entries, building it only
+// when the entries changed. prepare() runs first and must make every path exist.
+async function getCachedArchive(entries, prefix = 'qr-codes', prepare = async () => {}) {
+    const hash = entriesHash(entries);
+    const fileName = `${prefix}-${hash}.zip`;
+    const archivePath = path.join(CACHE_DIR, fileName);
+
+    if (fs.existsSync(archivePath)) {
+        return { path: archivePath, hash };
+    }
+
+    if (!pendingBuilds.has(archivePath)) {
+        const build = (async () => {
+            await fs.promises.mkdir(CACHE_DIR, { recursive: true });
+            const startTime = Date.now();
+            await prepare();
+            await buildArchive(entries, archivePath);
+            console.log(`Built ${fileName} in ${Date.now() - startTime}ms`);
+            await removeStaleArchives(prefix, fileName);
+        })().finally(() => pendingBuilds.delete(archivePath));
+        pendingBuilds.set(archivePath, build);
+    }
+
+    await pendingBuilds.get(archivePath);
+    return { path: archivePath, hash };
+}
+
+module.exports = {
+    entriesHash,
+    getCachedArchive
+};
@@ -0,0 +1,79 @@
+const crypto = require('crypto');
+const os = require('os');
+const QRCode = require('qrcode');
+const { hasArtifact, writeArtifact } = require('./qr-store');
+
+const QR_OPTIONS = {
+    color: {
+        dark: '#000000',
+        light: '#FFFFFF'
+    },
+    width: 300
+};
+
+function qrPayload(user) {
+    return JSON.stringify({
+        token: user.token,
+        name: user.name,
+        type: 'food-token'
+    });
+}
+
+function qrFingerprint(payload) {
+    return crypto.createHash('sha1')
+        .update(payload)
+        .update(JSON.stringify(QR_OPTIONS))
+        .digest('hex');
+}
+
+// Run fn over items with at most `limit` calls in flight
+async function mapWithConcurrency(items, limit, fn) {
+    let next = 0;
+    const workers = Array.from({ length: Math.min(limit, items.length) }, async () => {
+        while (next < items.length) {
+            const index = next++;
+            await fn(items[index], index);
+        }
+    });
+    await Promise.all(workers);
+}
+
+// Render QR codes for users into the QR store. PNGs are stored under the
+// fingerprint of their payload and options, so one that is already there is
+// up to date and skipped. onProgress receives running counts after each user.
+// Resolves to the counts and the { user_id, kind, key } references to record.
+async function generateQRCodes(users, onProgress = () => {}) {
+    const concurrency = parseInt(process.env.QR_CONCURRENCY, 10) || os.cpus().length;
+    const progress = { total: users.length, generated: 0, skipped: 0, failed: 0 };
+    const references = [];
+
+    await mapWithConcurrency(users, concurrency, async (user) => {
+        const payload = qrPayload(user);
+        const fingerprint = qrFingerprint(payload);
+
+        try {
+            if (await hasArtifact(fingerprint)) {
+                progress.skipped++;
+            } else {
+                await writeArtifact(fingerprint, '.png', await QRCode.toBuffer(payload, QR_OPTIONS));
+                progress.generated++;
+            }
+            references.push({ user_id: user.id, kind: 'png', key: fingerprint });
+        } catch (error) {
+            console.error(`Error generating QR code for ${user.name}:`, error);
+            progress.failed++;
+        }
+
+        onProgress({ ...progress });
+    });
+
+    return { progress, references };
+}
+
+module.exports = {
+    QR_OPTIONS,
+    generateQRCodes,
+    mapWithConcurrency,
+    qrFingerprint,
+    qrPayload
+};
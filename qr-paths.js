@@ -0,0 +1,60 @@
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+
+// Cards live at <dir>/ab/cd/<token>.<ext>, where ab and cd are the first two
+// byte pairs of sha1(token). qr_paths.py implements the same layout.
+const SHARD_LEVELS = 2;
+const SHARD_WIDTH = 2;
+
+function qrShard(token) {
+    const digest = crypto.createHash('sha1').update(String(token)).digest('hex');
+    const parts = [];
+    for (let level = 0; level < SHARD_LEVELS; level++) {
+        parts.push(digest.slice(level * SHARD_WIDTH, (level + 1) * SHARD_WIDTH));
+    }
+    return parts;
+}
+
+// Path relative to the card directory, always with forward slashes so the
+// same value can be stored in users.qr_code_path and used in URLs
+function qrRelativePath(token, ext = '.png') {
+    return [...qrShard(token), `${token}${ext}`].join('/');
+}
+
+function qrFilePath(baseDir, token, ext = '.png') {
+    return path.join(baseDir, ...qrShard(token), `${token}${ext}`);
+}
+
+// Every file under dir, as paths relative to it, in sorted order
+async function listQRFiles(dir) {
+    const files = [];
+
+    async function walk(relative) {
+        let entries = [];
+        try {
+            entries = await fs.promises.readdir(path.join(dir, relative), { withFileTypes: true });
+        } catch (e) {
+            // Missing directory lists like an empty one
+        }
+        entries.sort((a, b) => (a.name < b.name ? -1 : a.name > b.name ? 1 : 0));
+        for (const entry of entries) {
+            const child = relative ? `${relative}/${entry.name}` : entry.name;
+            if (entry.isDirectory()) {
+                await walk(child);
+            } else if (entry.isFile()) {
+                files.push(child);
+            }
+        }
+    }
+
+    await walk('');
+    return files;
+}
+
+module.exports = {
+    qrShard,
+    qrRelativePath,
+    qrFilePath,
+    listQRFiles
+};
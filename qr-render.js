@@ -0,0 +1,87 @@
+const QRCode = require('qrcode');
+const { QR_OPTIONS, qrFingerprint, qrPayload } = require('./qr-generator');
+const { readArtifact, writeArtifact } = require('./qr-store');
+
+// Per-process memory budget for rendered PNGs (about 1.5 KB each at width 300)
+const MAX_CACHE_BYTES = (parseInt(process.env.QR_CACHE_MB, 10) || 32) * 1024 * 1024;
+
+// Least recently used eviction over a Map, whose keys iterate in insertion order
+class QRCache {
+    constructor(maxBytes) {
+        this.maxBytes = maxBytes;
+        this.bytes = 0;
+        this.entries = new Map();
+    }
+
+    get(key) {
+        const buffer = this.entries.get(key);
+        if (buffer) {
+            this.entries.delete(key);
+            this.entries.set(key, buffer);
+        }
+        return buffer;
+    }
+
+    set(key, buffer) {
+        if (this.entries.has(key) || buffer.length > this.maxBytes) {
+            return;
+        }
+        this.entries.set(key, buffer);
+        this.bytes += buffer.length;
+        for (const [oldest, evicted] of this.entries) {
+            if (this.bytes <= this.maxBytes) {
+                break;
+            }
+            this.entries.delete(oldest);
+            this.bytes -= evicted.length;
+        }
+    }
+}
+
+const memoryCache = new QRCache(MAX_CACHE_BYTES);
+
+// Renders in flight, so a burst of requests for one card renders it once
+const pendingRenders = new Map();
+
+// PNGs are stored under the fingerprint of their payload and options, so a
+// student whose name changes gets a new file and an old one is never served
+async function loadOrRender(payload, fingerprint) {
+    const stored = await readArtifact(fingerprint);
+    if (stored) {
+        return { buffer: stored, source: 'disk' };
+    }
+
+    const buffer = await QRCode.toBuffer(payload, QR_OPTIONS);
+    try {
+        await writeArtifact(fingerprint, '.png', buffer);
+    } catch (error) {
+        // The store only saves work; the rendered image is still served
+        console.error('Error storing QR code:', error);
+    }
+    return { buffer, source: 'render' };
+}
+
+// Return { fingerprint, buffer, source } for a user's QR code PNG; source is
+// 'memory', 'disk' or 'render' depending on where the image came from
+async function renderQR(user) {
+    const payload = qrPayload(user);
+    const fingerprint = qrFingerprint(payload);
+
+    const cached = memoryCache.get(fingerprint);
+    if (cached) {
+        return { fingerprint, buffer: cached, source: 'memory' };
+    }
+
+    if (!pendingRenders.has(fingerprint)) {
+        pendingRenders.set(fingerprint, loadOrRender(payload, fingerprint)
+            .finally(() => pendingRenders.delete(fingerprint)));
+    }
+    const { buffer, source } = await pendingRenders.get(fingerprint);
+    memoryCache.set(fingerprint, buffer);
+    return { fingerprint, buffer, source };
+}
+
+module.exports = {
+    QRCache,
+    renderQR
+};
@@ -0,0 +1,49 @@
+const fs = require('fs');
+const path = require('path');
+const { qrFilePath } = require('./qr-paths');
+
+// Content-addressed store shared with the Python tools (qr_store.py): every
+// rendered image lives at qr_store/ab/cd/<key>.<ext>, where key hashes the
+// render inputs. Files are never rewritten in place; unreferenced ones are
+// removed by `python qr_store.py gc`.
+const STORE_DIR = path.join(__dirname, 'qr_store');
+
+function artifactPath(key, ext = '.png') {
+    return qrFilePath(STORE_DIR, key, ext);
+}
+
+// Stored bytes for key, or null when it has not been rendered yet
+async function readArtifact(key, ext = '.png') {
+    try {
+        return await fs.promises.readFile(artifactPath(key, ext));
+    } catch (e) {
+        return null;
+    }
+}
+
+async function hasArtifact(key, ext = '.png') {
+    try {
+        await fs.promises.access(artifactPath(key, ext));
+        return true;
+    } catch (e) {
+        return false;
+    }
+}
+
+// Written under a temporary name so a reader never sees half an image
+async function writeArtifact(key, ext, buffer) {
+    const filePath = artifactPath(key, ext);
+    await fs.promises.mkdir(path.dirname(filePath), { recursive: true });
+    const tmpPath = `${filePath}.${process.pid}.tmp`;
+    await fs.promises.writeFile(tmpPath, buffer);
+    await fs.promises.rename(tmpPath, filePath);
+    return filePath;
+}
+
+module.exports = {
+    STORE_DIR,
+    artifactPath,
+    hasArtifact,
+    readArtifact,
+    writeArtifact
+};
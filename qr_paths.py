@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+QR card path layout shared with qr-paths.js.
+
+Cards live at <dir>/ab/cd/<token>.<ext>, where ab and cd are the first two
+byte pairs of sha1(token), so no directory grows past a few hundred entries.
+"""
+import hashlib
+import os
+
+QR_DIR = 'qr_codes_jpeg'
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+def qr_shard(token):
+    digest = hashlib.sha1(str(token).encode()).hexdigest()
+    return [digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH] for level in range(SHARD_LEVELS)]
+
+
+def qr_relative_path(token, ext='.jpg'):
+    """Path relative to the card directory, with forward slashes like qr_code_path"""
+    return '/'.join(qr_shard(token) + [f"{token}{ext}"])
+
+
+def qr_card_path(token, base_dir=QR_DIR, ext='.jpg'):
+    """Path to store in users.qr_code_path, e.g. qr_codes_jpeg/ab/cd/<token>.jpg"""
+    return f"{base_dir}/{qr_relative_path(token, ext)}"
+
+
+def ensure_parent(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+def iter_qr_files(base_dir=QR_DIR, ext='.jpg'):
+    """Yield os.DirEntry for every card under base_dir, sharded or flat"""
+    stack = [base_dir]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                stack.append(entry.path)
+            elif entry.is_file() and entry.name.endswith(ext):
+                yield entry
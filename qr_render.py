@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+On-Demand QR Card Rendering
+Renders a student's card from their database row the first time it is
+needed instead of pre-generating every card. Cards go to the QR store
+(qr_store.py), keyed by a hash of everything drawn on them, so a card is
+rendered once and a student whose details change gets a new card rather
+than a stale one. The same idea as GET /api/qr/:token on the server.
+
+Usage:
+    python qr_render.py TOKEN [TOKEN ...]     # print the card path for each token
+    python qr_render.py --benchmark 200       # cold vs warm latency
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import profiling
+import qr_store
+from generate_qr_with_db import card_key, store_card
+
+DB_PATH = 'database/food_tokens.db'
+
+CARD_COLUMNS = 'id, token, name, email, food_preference, class_name'
+
+
+def render_card(job):
+    """Worker: (user_id, token, name, email, food_preference, class_name, store_dir) -> (user_id, path)"""
+    user_id, token, name, email, food_preference, class_name, store_dir = job
+    return user_id, store_card(token, name, email, food_preference, class_name or '', store_dir)
+
+
+def render_cards(rows, store_dir=qr_store.STORE_DIR, workers=None):
+    """Store the cards of (id, token, name, email, food_preference, class_name) rows on every core;
+    returns {user_id: path}"""
+    if not rows:
+        return {}
+    jobs = [tuple(row) + (store_dir,) for row in rows]
+    with Pool(min(workers or os.cpu_count() or 1, len(jobs))) as pool:
+        return dict(pool.imap_unordered(render_card, jobs, chunksize=8))
+
+
+def card_for_user(conn, user_id, store_dir=qr_store.STORE_DIR):
+    """Card path for a user id, rendered and recorded on first use or after the student's
+    details change; None when there is no such student"""
+    row = conn.execute(f'SELECT {CARD_COLUMNS}, qr_code_path FROM users WHERE id = ?', (user_id,)).fetchone()
+    if not row:
+        return None
+    _, token, name, email, food_preference, class_name, cached = row
+    # The recorded card is only current if it was rendered from the fields the row has now
+    if (cached and os.path.exists(cached)
+            and qr_store.key_of(cached) == card_key(token, name, email, food_preference, class_name or '')):
+        return cached
+
+    user_id, path = render_card(row[:6] + (store_dir,))
+    qr_store.ensure_schema(conn)
+    conn.execute('UPDATE users SET qr_code_path = ? WHERE id = ?', (path, user_id))
+    qr_store.record_references(conn, [(user_id, 'card', qr_store.key_of(path))])
+    conn.commit()
+    return path
+
+
+def card_for_token(conn, token, store_dir=qr_store.STORE_DIR):
+    """Card path for a token, or None when no student has it"""
+    row = conn.execute('SELECT id FROM users WHERE token = ?', (token,)).fetchone()
+    return card_for_user(conn, row[0], store_dir) if row else None
+
+
+def benchmark(conn, count):
+    """Render `count` cards into an empty store, then fetch them again"""
+    rows = conn.execute(f'SELECT {CARD_COLUMNS} FROM users ORDER BY id LIMIT ?', (count,)).fetchall()
+    if not rows:
+        print("❌ No students in the database")
+        return
+
+    store_dir = tempfile.mkdtemp(prefix='qr-render-bench-')
+    try:
+        results = {}
+        for label in ('cold', 'warm'):
+            timings = []
+            for row in rows:
+                started = time.perf_counter()
+                render_card(row + (store_dir,))
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            results[label] = timings
+
+        print(f"\n📊 CARD RENDER LATENCY ({len(rows)} cards)")
+        print("=" * 60)
+        for label, timings in results.items():
+            print(f"   {label}: mean {sum(timings) / len(timings):.2f} ms, "
+                  f"p50 {timings[len(timings) // 2]:.2f} ms, "
+                  f"p95 {timings[int(0.95 * (len(timings) - 1))]:.2f} ms, max {timings[-1]:.2f} ms")
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render QR cards on demand from the database")
+    parser.add_argument('tokens', nargs='*', metavar='TOKEN', help="tokens to print card paths for")
+    parser.add_argument('--db', default=DB_PATH, help=f"database file (default {DB_PATH})")
+    parser.add_argument('--store', default=qr_store.STORE_DIR,
+                        help=f"QR store directory (default {qr_store.STORE_DIR}/)")
+    parser.add_argument('--benchmark', type=int, metavar='N',
+                        help="measure cold and warm latency over the first N students")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.benchmark:
+            benchmark(conn, args.benchmark)
+            return
+        missing = 0
+        for token in args.tokens:
+            path = card_for_token(conn, token, args.store)
+            if path:
+                print(path)
+            else:
+                print(f"❌ Token not found: {token}", file=sys.stderr)
+                missing += 1
+    finally:
+        conn.close()
+    if missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.configure_from_argv()
+    with profiling.stage('render'):
+        main()
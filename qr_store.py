@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed QR Artifact Store
+Every rendered QR image lives at qr_store/ab/cd/<key>.<ext>, where key is a
+hash of everything that went into the render (qr-store.js uses the same
+layout). Identical renders are stored once, a card is found from its inputs
+without searching, and a student whose details change gets a new file
+instead of overwriting one that may already have been sent.
+
+Users reference their artifacts through users.qr_code_path (the JPEG card)
+and the qr_artifacts table (one key per user and kind: 'card' from the
+Python tools, 'png' from the server). `gc` removes files nothing references.
+
+Usage:
+    python qr_store.py stats
+    python qr_store.py migrate [--remove-legacy]   # re-render every card into the store
+    python qr_store.py gc [--dry-run] [--grace-minutes 60]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import profiling
+from qr_paths import ensure_parent, qr_card_path
+
+STORE_DIR = 'qr_store'
+DB_PATH = 'database/food_tokens.db'
+
+# Directories each tool used to write into before the store
+LEGACY_DIRS = ('qrcodes', 'qr-codes', 'qr_codes_jpeg')
+
+REFERENCES_SQL = '''
+    CREATE TABLE IF NOT EXISTS qr_artifacts (
+        user_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        artifact_key TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, kind)
+    ) WITHOUT ROWID
+'''
+
+# Files younger than this are never collected: a render may not have recorded its reference yet
+GC_GRACE_SECONDS = 3600
+
+
+def artifact_key(*inputs):
+    """Hash of a render's inputs (kind, layout version, payload, ...)"""
+    return hashlib.sha1(json.dumps(inputs, separators=(',', ':')).encode()).hexdigest()
+
+
+def artifact_path(key, ext, store_dir=STORE_DIR):
+    return qr_card_path(key, store_dir, ext)
+
+
+def key_of(path):
+    """Artifact key from a store path"""
+    return os.path.basename(path).split('.')[0]
+
+
+def in_store(path, store_dir=STORE_DIR):
+    return bool(path) and os.path.normpath(path).startswith(os.path.normpath(store_dir) + os.sep)
+
+
+def put(key, ext, render, store_dir=STORE_DIR):
+    """Path of the artifact, calling render(path) only when it is not stored yet"""
+    path = artifact_path(key, ext, store_dir)
+    if not os.path.exists(path):
+        ensure_parent(path)
+        # Written under a temporary name so a reader never sees half an image
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        render(tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def ensure_schema(conn):
+    conn.execute(REFERENCES_SQL)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_qr_artifacts_key ON qr_artifacts (artifact_key)')
+
+
+def record_references(conn, references):
+    """Point each (user_id, kind) at an artifact key; the caller commits"""
+    conn.executemany('''
+        INSERT INTO qr_artifacts (user_id, kind, artifact_key) VALUES (?, ?, ?)
+        ON CONFLICT (user_id, kind) DO UPDATE SET
+            artifact_key = excluded.artifact_key,
+            created_at = CURRENT_TIMESTAMP
+    ''', references)
+
+
+def iter_store(store_dir=STORE_DIR):
+    """os.DirEntry for every file in the store"""
+    stack = [store_dir]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                stack.append(entry.path)
+            elif entry.is_file():
+                yield entry
+
+
+def live_keys(conn, store_dir=STORE_DIR):
+    """Keys referenced by a user or by a tokens_list.json"""
+    keys = {key for (key,) in conn.execute('''
+        SELECT a.artifact_key FROM qr_artifacts a JOIN users u ON u.id = a.user_id
+    ''')}
+    keys.update(key_of(path) for (path,) in conn.execute(
+        "SELECT qr_code_path FROM users WHERE qr_code_path IS NOT NULL AND qr_code_path != ''")
+        if in_store(path, store_dir))
+
+    # Cards from generate_qr_jpeg.py have no users row, only a tokens list
+    for legacy_dir in LEGACY_DIRS:
+        tokens_file = os.path.join(legacy_dir, 'tokens_list.json')
+        try:
+            with open(tokens_file) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for entry in entries:
+            path = entry.get('qr_code_path') or entry.get('filename')
+            if in_store(path, store_dir):
+                keys.add(key_of(path))
+    return keys
+
+
+def collect_garbage(conn, store_dir=STORE_DIR, grace_seconds=GC_GRACE_SECONDS, dry_run=False):
+    """Remove unreferenced artifacts older than the grace period; returns (files, removed, bytes)"""
+    if not dry_run:
+        conn.execute('DELETE FROM qr_artifacts WHERE user_id NOT IN (SELECT id FROM users)')
+        conn.commit()
+
+    live = live_keys(conn, store_dir)
+    cutoff = time.time() - grace_seconds
+    files = removed = freed = 0
+    for entry in iter_store(store_dir):
+        files += 1
+        if key_of(entry.path) in live and not entry.name.endswith('.tmp'):
+            continue
+        stat = entry.stat()
+        if stat.st_mtime > cutoff:
+            continue
+        removed += 1
+        freed += stat.st_size
+        if not dry_run:
+            os.remove(entry.path)
+    return files, removed, freed
+
+
+def migrate(conn, store_dir=STORE_DIR, remove_legacy=False):
+    """Render every user's card into the store and point qr_code_path at it"""
+    from merge_shards import write_tokens_list
+    from qr_render import render_cards
+
+    rows = conn.execute('''
+        SELECT id, token, name, email, food_preference, class_name, qr_code_path FROM users
+    ''').fetchall()
+    pending = [row[:6] for row in rows if not (in_store(row[6], store_dir) and os.path.exists(row[6]))]
+    print(f"🎨 Rendering {len(pending)} of {len(rows)} cards into {store_dir}/")
+
+    paths = render_cards(pending, store_dir)
+    conn.executemany('UPDATE users SET qr_code_path = ? WHERE id = ?',
+                     [(path, user_id) for user_id, path in paths.items()])
+    record_references(conn, [(user_id, 'card', key_of(path)) for user_id, path in paths.items()])
+    conn.commit()
+    print(f"✅ {len(paths)} users now point into {store_dir}/")
+    # The old list would otherwise keep the replaced cards alive
+    tokens_path, _ = write_tokens_list(conn)
+    print(f"📋 Rebuilt {tokens_path}")
+
+    if remove_legacy:
+        for legacy_dir in LEGACY_DIRS:
+            if os.path.isdir(legacy_dir):
+                images = [entry.path for entry in iter_store(legacy_dir)
+                          if entry.name.endswith(('.png', '.jpg'))]
+                for path in images:
+                    os.remove(path)
+                print(f"🗑️ Removed {len(images)} images from {legacy_dir}/")
+    return len(paths)
+
+
+def store_stats(store_dir=STORE_DIR):
+    files = size = 0
+    by_ext = {}
+    for entry in iter_store(store_dir):
+        files += 1
+        size += entry.stat().st_size
+        ext = os.path.splitext(entry.name)[1]
+        by_ext[ext] = by_ext.get(ext, 0) + 1
+    return files, size, by_ext
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the content-addressed QR artifact store")
+    parser.add_argument('command', choices=['stats', 'migrate', 'gc'])
+    parser.add_argument('--db', default=DB_PATH, help=f"database file (default {DB_PATH})")
+    parser.add_argument('--store', default=STORE_DIR, help=f"store directory (default {STORE_DIR}/)")
+    parser.add_argument('--dry-run', action='store_true', help="gc: report what would be removed")
+    parser.add_argument('--grace-minutes', type=float, default=GC_GRACE_SECONDS / 60,
+                        help=f"gc: keep unreferenced files younger than this (default {GC_GRACE_SECONDS // 60})")
+    parser.add_argument('--remove-legacy', action='store_true',
+                        help=f"migrate: delete the images in {', '.join(LEGACY_DIRS)} afterwards")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        files, size, by_ext = store_stats(args.store)
+        print(f"📦 {files} artifacts, {size / 1024 / 1024:.1f} MB in {args.store}/")
+        for ext, count in sorted(by_ext.items()):
+            print(f"   {ext or '(none)'}: {count}")
+        return
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(args.db)
+    ensure_schema(conn)
+    try:
+        if args.command == 'migrate':
+            migrate(conn, args.store, args.remove_legacy)
+        else:
+            files, removed, freed = collect_garbage(conn, args.store, args.grace_minutes * 60, args.dry_run)
+            print(f"🧹 {'Would remove' if args.dry_run else 'Removed'} {removed} of {files} artifacts "
+                  f"({freed / 1024 / 1024:.1f} MB)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    profiling.configure_from_argv()
+    with profiling.stage('store'):
+        main()
@@ -0,0 +1,95 @@
+const http = require('http');
+const https = require('https');
+
+// Database methods served by ledger-server.js. Everything that reads or writes
+// users and scan_history goes through the ledger so all replicas see one state.
+const LEDGER_METHODS = [
+    'addUser',
+    'upsertUsers',
+    'getUserByToken',
+    'getUserByUSN',
+    'markAsScanned',
+    'redeemToken',
+    'addScanHistory',
+    'countDuplicateScans',
+    'getDuplicateScanCounts',
+    'getScanHistoryForUser',
+    'createEvent',
+    'getEvents',
+    'getEntitlement',
+    'redeemEntitlement',
+    'recordQRArtifacts',
+    'getRosterSnapshot',
+    'getAllUsers',
+    'getUsersPage',
+    'getScanStats',
+    'compactScanRollups',
+    'getScanRollups',
+    'clearAllData'
+];
+
+const LEDGER_TIMEOUT_MS = 10000;
+
+// Drop-in replacement for Database that forwards every call to the ledger service
+class RemoteDatabase {
+    constructor(ledgerUrl, secret = process.env.LEDGER_SECRET) {
+        this.url = new URL(ledgerUrl);
+        this.secret = secret;
+        this.transport = this.url.protocol === 'https:' ? https : http;
+        this.agent = new this.transport.Agent({ keepAlive: true, maxSockets: 64 });
+        console.log(`Using remote scan ledger at ${this.url.origin}`);
+    }
+
+    call(method, args) {
+        const body = JSON.stringify({ args });
+        const headers = {
+            'Content-Type': 'application/json',
+            'Content-Length': Buffer.byteLength(body)
+        };
+        if (this.secret) {
+            headers.Authorization = `Bearer ${this.secret}`;
+        }
+
+        return new Promise((resolve, reject) => {
+            const req = this.transport.request(new URL(`/rpc/${method}`, this.url), {
+                method: 'POST',
+                agent: this.agent,
+                headers,
+                timeout: LEDGER_TIMEOUT_MS
+            }, (res) => {
+                const chunks = [];
+                res.on('data', chunk => chunks.push(chunk));
+                res.on('end', () => {
+                    let payload;
+                    try {
+                        payload = JSON.parse(Buffer.concat(chunks).toString());
+                    } catch (e) {
+                        return reject(new Error(`Invalid ledger response (HTTP ${res.statusCode})`));
+                    }
+                    if (res.statusCode !== 200) {
+                        reject(new Error(payload.error || `Ledger error (HTTP ${res.statusCode})`));
+                    } else {
+                        resolve(payload.result);
+                    }
+                });
+            });
+
+            req.on('timeout', () => req.destroy(new Error(`Ledger call ${method} timed out`)));
+            req.on('error', reject);
+            req.end(body);
+        });
+    }
+
+    close() {
+        this.agent.destroy();
+    }
+}
+
+for (const method of LEDGER_METHODS) {
+    RemoteDatabase.prototype[method] = function(...args) {
+        return this.call(method, args);
+    };
+}
+
+module.exports = RemoteDatabase;
+module.exports.LEDGER_METHODS = LEDGER_METHODS;
@@ -0,0 +1,82 @@
+// Throughput summaries over scan_rollups rows ({ minute, counter, food_preference, scans }).
+// scan_report.py computes the same figures for the command line.
+
+// A counter working at 90% or more of its own peak for consecutive minutes
+// means students were queueing there
+const BUSY_FRACTION = 0.9;
+const MINUTE_MS = 60 * 1000;
+
+function minuteTime(minute) {
+    return Date.parse(`${minute.replace(' ', 'T')}:00Z`);
+}
+
+function longestBusyStreak(perMinute, peak) {
+    const threshold = peak * BUSY_FRACTION;
+    let longest = null;
+    let current = null;
+
+    for (const [minute, scans] of perMinute) {
+        if (scans < threshold) {
+            current = null;
+            continue;
+        }
+        if (current && minuteTime(minute) - minuteTime(current.end) === MINUTE_MS) {
+            current.end = minute;
+            current.minutes++;
+        } else {
+            current = { start: minute, end: minute, minutes: 1 };
+        }
+        if (!longest || current.minutes > longest.minutes) {
+            longest = { ...current };
+        }
+    }
+    return longest;
+}
+
+function summarizeThroughput(rows) {
+    const counters = new Map();
+    const overall = new Map();
+    const byFood = {};
+
+    for (const row of rows) {
+        if (!counters.has(row.counter)) {
+            counters.set(row.counter, new Map());
+        }
+        const perMinute = counters.get(row.counter);
+        perMinute.set(row.minute, (perMinute.get(row.minute) || 0) + row.scans);
+        overall.set(row.minute, (overall.get(row.minute) || 0) + row.scans);
+        byFood[row.food_preference] = (byFood[row.food_preference] || 0) + row.scans;
+    }
+
+    const summarize = (perMinute) => {
+        const minutes = [...perMinute].sort((a, b) => (a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : 0));
+        let total = 0;
+        let peak = { minute: null, scans: 0 };
+        for (const [minute, scans] of minutes) {
+            total += scans;
+            if (scans > peak.scans) {
+                peak = { minute, scans };
+            }
+        }
+        return {
+            total,
+            active_minutes: minutes.length,
+            average_per_active_minute: minutes.length ? Math.round((total / minutes.length) * 10) / 10 : 0,
+            peak_minute: peak.minute,
+            peak_scans_per_minute: peak.scans,
+            busy_streak: longestBusyStreak(minutes, peak.scans)
+        };
+    };
+
+    return {
+        overall: summarize(overall),
+        by_food_preference: byFood,
+        counters: [...counters]
+            .map(([counter, perMinute]) => ({ counter, ...summarize(perMinute) }))
+            .sort((a, b) => b.total - a.total)
+    };
+}
+
+module.exports = {
+    summarizeThroughput
+};
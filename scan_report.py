@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Scan Throughput Report
+Brings the per-minute scan rollups up to date (only history rows added since
+the last run are read) and prints peak throughput and queue build-up per
+counter. Uses the same tables and SQL as database.js and scan-analytics.js.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+DB_PATH = 'database/food_tokens.db'
+
+# Same as scan-analytics.js: 90% of a counter's own peak for consecutive minutes
+BUSY_FRACTION = 0.9
+
+SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS scan_rollups (
+        minute TEXT NOT NULL,
+        counter TEXT NOT NULL,
+        food_preference TEXT NOT NULL,
+        scans INTEGER NOT NULL,
+        PRIMARY KEY (minute, counter, food_preference)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        last_rowid INTEGER NOT NULL
+    );
+'''
+
+ROLLUP_SQL = '''
+    INSERT INTO scan_rollups (minute, counter, food_preference, scans)
+    SELECT substr(h.scanned_at, 1, 16),
+           COALESCE(h.scanner_info, ''),
+           COALESCE(lower(trim(u.food_preference)), 'unknown'),
+           COUNT(*)
+    FROM scan_history h
+    LEFT JOIN users u ON u.id = h.user_id
+    WHERE h.id > (SELECT COALESCE(MAX(last_rowid), 0) FROM rollup_state WHERE name = 'scan_history')
+    GROUP BY 1, 2, 3
+    ON CONFLICT (minute, counter, food_preference) DO UPDATE SET scans = scans + excluded.scans
+'''
+
+ROLLUP_STATE_SQL = '''
+    INSERT INTO rollup_state (name, last_rowid)
+    SELECT 'scan_history', COALESCE(MAX(id), 0) FROM scan_history WHERE 1
+    ON CONFLICT (name) DO UPDATE SET last_rowid = MAX(last_rowid, excluded.last_rowid)
+'''
+
+
+def compact(conn):
+    """Fold new scan_history rows into scan_rollups; returns (rows_folded, through_id)"""
+    conn.executescript(SCHEMA_SQL)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        previous = conn.execute(
+            "SELECT COALESCE(MAX(last_rowid), 0) FROM rollup_state WHERE name = 'scan_history'").fetchone()[0]
+        folded = conn.execute('SELECT COUNT(*) FROM scan_history WHERE id > ?', (previous,)).fetchone()[0]
+        conn.execute(ROLLUP_SQL)
+        conn.execute(ROLLUP_STATE_SQL)
+        through_id = conn.execute(
+            "SELECT last_rowid FROM rollup_state WHERE name = 'scan_history'").fetchone()[0]
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return folded, through_id
+
+
+def load_rollups(conn, counter=None, start=None, end=None):
+    where, params = [], []
+    if counter:
+        where.append('counter = ?')
+        params.append(counter)
+    if start:
+        where.append('minute >= ?')
+        params.append(start)
+    if end:
+        where.append('minute <= ?')
+        params.append(end)
+    sql = f'''
+        SELECT minute, counter, food_preference, scans FROM scan_rollups
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY minute
+    '''
+    return conn.execute(sql, params).fetchall()
+
+
+def busy_streak(per_minute, peak):
+    """Longest run of consecutive minutes at BUSY_FRACTION of the peak or more"""
+    longest, current = None, None
+    for minute, scans in sorted(per_minute.items()):
+        if scans < peak * BUSY_FRACTION:
+            current = None
+            continue
+        moment = datetime.strptime(minute, '%Y-%m-%d %H:%M')
+        if current and moment - current['end_time'] == timedelta(minutes=1):
+            current['end'], current['end_time'] = minute, moment
+            current['minutes'] += 1
+        else:
+            current = {'start': minute, 'end': minute, 'end_time': moment, 'minutes': 1}
+        if not longest or current['minutes'] > longest['minutes']:
+            longest = dict(current)
+    return longest
+
+
+def summarize(per_minute):
+    total = sum(per_minute.values())
+    peak_minute = max(sorted(per_minute), key=lambda minute: per_minute[minute], default=None)
+    peak = per_minute.get(peak_minute, 0)
+    return {
+        'total': total,
+        'active_minutes': len(per_minute),
+        'average': total / len(per_minute) if per_minute else 0,
+        'peak_minute': peak_minute,
+        'peak': peak,
+        'busy_streak': busy_streak(per_minute, peak),
+    }
+
+
+def print_report(rows, top):
+    counters = defaultdict(lambda: defaultdict(int))
+    overall = defaultdict(int)
+    by_food = defaultdict(int)
+    for minute, counter, food_preference, scans in rows:
+        counters[counter or '(unknown)'][minute] += scans
+        overall[minute] += scans
+        by_food[food_preference] += scans
+
+    if not rows:
+        print("📭 No scans recorded in this range")
+        return
+
+    summary = summarize(overall)
+    print(f"\n📊 SCAN THROUGHPUT")
+    print("=" * 72)
+    print(f"Total scans: {summary['total']} over {summary['active_minutes']} active minutes "
+          f"({min(overall)} to {max(overall)})")
+    print(f"Peak: {summary['peak']}/min at {summary['peak_minute']}")
+    for food_preference, scans in sorted(by_food.items(), key=lambda item: -item[1]):
+        print(f"   {food_preference}: {scans}")
+
+    print(f"\n{'Counter':<24}{'Scans':>8}{'Avg/min':>9}{'Peak/min':>10}  {'Peak at':<17} Busy streak")
+    print("-" * 90)
+    for counter, per_minute in sorted(counters.items(), key=lambda item: -sum(item[1].values())):
+        s = summarize(per_minute)
+        streak = s['busy_streak']
+        streak_text = f"{streak['minutes']} min from {streak['start'][11:]}" if streak else '-'
+        print(f"{counter[:23]:<24}{s['total']:>8}{s['average']:>9.1f}{s['peak']:>10}  "
+              f"{s['peak_minute']:<17} {streak_text}")
+
+    if top:
+        print(f"\n🔥 Busiest {top} minutes (all counters)")
+        busiest = sorted(overall.items(), key=lambda item: (-item[1], item[0]))[:top]
+        width = max(scans for _, scans in busiest)
+        for minute, scans in sorted(busiest):
+            print(f"   {minute}  {scans:>5}  {'█' * max(1, round(40 * scans / width))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-counter scan throughput from the rollup tables")
+    parser.add_argument('--db', default=DB_PATH, help=f"database file (default {DB_PATH})")
+    parser.add_argument('--counter', help="only this counter")
+    parser.add_argument('--from', dest='start', help="first minute, e.g. '2024-03-01 12:00' (UTC)")
+    parser.add_argument('--to', dest='end', help="last minute, e.g. '2024-03-01 14:00' (UTC)")
+    parser.add_argument('--top', type=int, default=10, help="busiest minutes to list (0 to skip)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=5)
+    started = time.perf_counter()
+    folded, through_id = compact(conn)
+    compact_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    rows = load_rollups(conn, args.counter, args.start, args.end)
+    conn.close()
+
+    print(f"🔄 Folded {folded} new scans into rollups in {compact_ms:.1f} ms (through scan #{through_id})")
+    print_report(rows, args.top)
+    print(f"\n⏱️ Report built from {len(rows)} rollup rows in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,12 @@ from email.mime.image import MIMEImage
 from email.mime.base import MIMEBase
 from email import encoders
 from dotenv import load_dotenv
-import sqlite3
 import pandas as pd
 from pathlib import Path
 import time
 
+from snapshot_db import snapshot_connection
+
 # Load environment variables
 load_dotenv()
 
@@ -145,12 +146,12 @@ def send_qr_codes_to_all_students():
     try:
         email_sender = EmailSender()
         
-        # Connect to database
-        conn = sqlite3.connect('database/food_tokens.db')
+        # Read a snapshot of the database so the scanner is never held up
+        conn = snapshot_connection('database/food_tokens.db')
         cursor = conn.cursor()
         
         # Get all users
-        cursor.execute('SELECT name, email, usn, class_name, food_preference FROM users')
+        cursor.execute('SELECT name, email, usn, class_name, food_preference, qr_code_path FROM users')
         users = cursor.fetchall()
         conn.close()
         
@@ -159,9 +160,10 @@ def send_qr_codes_to_all_students():
         sent_count = 0
         failed_count = 0
         
-        for name, email, usn, class_name, food_preference in users:
-            # Find corresponding QR code file
+        for name, email, usn, class_name, food_preference, qr_code_path in users:
+            # Find corresponding QR code file; the stored path is a single stat
             qr_files = [
+                qr_code_path or '',
                 f"qr_codes_jpeg/{name}_{class_name.replace(' ', '_')}_{usn[-8:]}.jpg",
                 f"qr_codes_jpeg/{name}_{class_name.replace(' ', '_')}_*.jpg"
             ]
@@ -1,33 +1,142 @@
+const cluster = require('cluster');
+const crypto = require('crypto');
 const express = require('express');
 const multer = require('multer');
 const csv = require('csv-parser');
-const fs = require('fs');
+const os = require('os');
 const path = require('path');
-const QRCode = require('qrcode');
-const { v4: uuidv4 } = require('uuid');
-const archiver = require('archiver');
 const cors = require('cors');
 const Database = require('./database');
+const { DEFAULT_MEAL_SLOT } = Database;
+const RemoteDatabase = require('./remote-database');
+const { sendJSON } = require('./http-utils');
+const jobs = require('./jobs');
+const { generateQRCodes, qrFingerprint, qrPayload } = require('./qr-generator');
+const { getCachedArchive } = require('./qr-archive');
+const { qrRelativePath } = require('./qr-paths');
+const { artifactPath } = require('./qr-store');
+const { renderQR } = require('./qr-render');
+const { checkToken, isSignedToken, newToken } = require('./token-signing');
+const { summarizeThroughput } = require('./scan-analytics');
+const { runPrimary } = require('./cluster-primary');
 
-const app = express();
 const PORT = process.env.PORT || 3000;
+const SHUTDOWN_TIMEOUT_MS = 10000;
+
+// CLUSTER_WORKERS=auto forks one worker per core; the primary only supervises them
+const CLUSTER_WORKERS = process.env.CLUSTER_WORKERS === 'auto'
+    ? os.cpus().length
+    : parseInt(process.env.CLUSTER_WORKERS, 10) || 1;
+
+if (cluster.isPrimary && CLUSTER_WORKERS > 1) {
+    runPrimary(CLUSTER_WORKERS, SHUTDOWN_TIMEOUT_MS);
+    return;
+}
+
+const app = express();
 
-const db = new Database();
+// With LEDGER_URL set, replicas share one single-writer ledger service instead of a local SQLite file
+const db = process.env.LEDGER_URL ? new RemoteDatabase(process.env.LEDGER_URL) : new Database();
 
 app.use(cors());
 app.use(express.json());
 app.use(express.static('public'));
-app.use('/qr-codes', express.static('qr-codes'));
 
-const storage = multer.diskStorage({
-    destination: (req, file, cb) => {
-        cb(null, 'uploads/');
+// Users are written to the database in chunks of this size, one transaction each
+const IMPORT_CHUNK_SIZE = 500;
+
+function userFromCsvRow(row) {
+    const name = row.name || row.full_name || row.participant_name || row.your_name || row.student_name || row.enter_your_name || '';
+    const email = row.email || row.email_address || row.email_id || row.enter_your_college_mail_id || '';
+    const phone = row.phone || row.mobile || row.contact || row.phone_number || '';
+    const usn = (row.usn || row.enter_your_usn || '').toUpperCase();
+    const class_name = row.class || row.class_name || '';
+    const foodPref = (row.food_preference || row.food_choice || row.preference || row.veg_non_veg || row.what_kind_of_food_do_you_prefer || '').toLowerCase();
+    
+    let food_preference = '';
+    if (foodPref.includes('veg') && !foodPref.includes('non')) {
+        food_preference = 'veg';
+    } else if (foodPref.includes('non') || foodPref.includes('nonveg')) {
+        food_preference = 'non-veg';
+    } else {
+        food_preference = 'veg';
+    }
+
+    if (!name) {
+        return null;
+    }
+
+    let token;
+    try {
+        token = newToken(usn);
+    } catch (error) {
+        // With TOKEN_EVENT set, a row without a USN cannot be given a derived token
+        return null;
+    }
+    return {
+        name,
+        email,
+        phone,
+        usn,
+        class_name,
+        food_preference,
+        token,
+        // Cards are rendered into the QR store on first use (GET /api/qr/:token, qr_render.py)
+        qr_code_path: null
+    };
+}
+
+async function importUsersFromStream(stream, job) {
+    const summary = { rows: 0, inserted: 0, updated: 0, skipped: 0 };
+    let chunk = [];
+
+    const flush = async () => {
+        if (chunk.length === 0) {
+            return;
+        }
+        const counts = await db.upsertUsers(chunk);
+        summary.inserted += counts.inserted;
+        summary.updated += counts.updated;
+        chunk = [];
+        jobs.updateJob(job, { ...summary });
+    };
+
+    // Normalize column names (remove spaces, convert to lowercase)
+    const rows = stream.pipe(csv({
+        mapHeaders: ({ header }) => header.toLowerCase().trim().replace(/\s+/g, '_'),
+        mapValues: ({ value }) => value.trim()
+    }));
+
+    for await (const row of rows) {
+        summary.rows++;
+        const user = userFromCsvRow(row);
+        if (!user) {
+            summary.skipped++;
+            continue;
+        }
+        chunk.push(user);
+        if (chunk.length >= IMPORT_CHUNK_SIZE) {
+            await flush();
+        }
+    }
+    await flush();
+
+    return summary;
+}
+
+// Multer storage engine that imports the CSV while it streams in, instead of
+// writing it to uploads/ and reading it back
+const csvImportStorage = {
+    _handleFile(req, file, cb) {
+        importUsersFromStream(file.stream, req.importJob)
+            .then(summary => cb(null, { summary }))
+            .catch(cb);
     },
-    filename: (req, file, cb) => {
-        cb(null, `${Date.now()}-${file.originalname}`);
+    _removeFile(req, file, cb) {
+        cb(null);
     }
-});
-const upload = multer({ storage: storage });
+};
+const upload = multer({ storage: csvImportStorage });
 
 app.get('/', (req, res) => {
     res.sendFile(path.join(__dirname, 'public', 'index.html'));
@@ -41,126 +150,81 @@ app.get('/scanner', (req, res) => {
     res.sendFile(path.join(__dirname, 'public', 'scanner.html'));
 });
 
-app.post('/api/upload-csv', upload.single('csvFile'), async (req, res) => {
-    try {
+app.post('/api/upload-csv', (req, res, next) => {
+    req.importJob = jobs.createJob('csv-import', req.query.job_id);
+    next();
+}, (req, res) => {
+    const job = req.importJob;
+    const startTime = Date.now();
+
+    upload.single('csvFile')(req, res, (error) => {
+        if (error) {
+            console.error('Error processing CSV:', error);
+            jobs.failJob(job, error);
+            return res.status(500).json({ error: 'Error processing CSV data', job_id: job.id, progress: job.progress });
+        }
+
         if (!req.file) {
+            jobs.failJob(job, new Error('No file uploaded'));
             return res.status(400).json({ error: 'No file uploaded' });
         }
 
-        const results = [];
-        const filePath = req.file.path;
-
-        // Read and parse CSV
-        fs.createReadStream(filePath)
-            .pipe(csv())
-            .on('data', (data) => {
-                // Normalize column names (remove spaces, convert to lowercase)
-                const normalizedData = {};
-                Object.keys(data).forEach(key => {
-                    const normalizedKey = key.toLowerCase().trim().replace(/\s+/g, '_');
-                    normalizedData[normalizedKey] = data[key].trim();
-                });
-                results.push(normalizedData);
-            })
-            .on('end', async () => {
-                try {
-                    console.log('CSV parsing completed. Processing', results.length, 'records');
-                    
-                    const processedUsers = [];
-                    
-                    for (const row of results) {
-                        const name = row.name || row.full_name || row.participant_name || row.your_name || row.student_name || '';
-                        const email = row.email || row.email_address || row.email_id || '';
-                        const phone = row.phone || row.mobile || row.contact || row.phone_number || '';
-                        const foodPref = (row.food_preference || row.food_choice || row.preference || row.veg_non_veg || '').toLowerCase();
-                        
-                        let food_preference = '';
-                        if (foodPref.includes('veg') && !foodPref.includes('non')) {
-                            food_preference = 'veg';
-                        } else if (foodPref.includes('non') || foodPref.includes('nonveg')) {
-                            food_preference = 'non-veg';
-                        } else {
-                            food_preference = 'veg';
-                        }
-
-                        if (name) {
-                            const token = uuidv4();
-                            const userData = {
-                                name,
-                                email,
-                                phone,
-                                food_preference,
-                                token,
-                                qr_code_path: `qr-codes/${token}.png`
-                            };
-
-                            const userId = await db.addUser(userData);
-                            processedUsers.push({ ...userData, id: userId });
-                        }
-                    }
-
-                    fs.unlinkSync(filePath);
+        const summary = req.file.summary;
+        const durationMs = Date.now() - startTime;
+        console.log(`CSV import completed: ${summary.rows} rows, ${summary.inserted} inserted, ${summary.updated} updated in ${durationMs}ms`);
+        jobs.finishJob(job, summary);
 
-                    res.json({
-                        message: 'CSV processed successfully',
-                        count: processedUsers.length,
-                        users: processedUsers
-                    });
-
-                } catch (error) {
-                    console.error('Error processing CSV:', error);
-                    res.status(500).json({ error: 'Error processing CSV data' });
-                }
-            });
+        res.json({
+            message: 'CSV processed successfully',
+            job_id: job.id,
+            count: summary.inserted + summary.updated,
+            ...summary,
+            duration_ms: durationMs
+        });
+    });
+});
 
-    } catch (error) {
-        console.error('Error uploading file:', error);
-        res.status(500).json({ error: 'Error uploading file' });
+app.get('/api/jobs/:id', (req, res) => {
+    const job = jobs.getJob(req.params.id);
+    if (!job) {
+        return res.status(404).json({ error: 'Job not found' });
     }
+    res.json(job);
 });
 
 app.post('/api/generate-qr-codes', async (req, res) => {
     try {
-        const users = await db.getAllUsers();
-        const qrCodeDir = path.join(__dirname, 'qr-codes');
-        
-        if (!fs.existsSync(qrCodeDir)) {
-            fs.mkdirSync(qrCodeDir, { recursive: true });
+        // A second click while a run is in progress just returns the running job
+        const running = jobs.findRunningJob('qr-generation');
+        if (running) {
+            return res.status(202).json({ message: 'QR code generation already running', job_id: running.id });
         }
 
-        const generatedCodes = [];
+        // Claimed before anything is awaited so two quick clicks cannot both start a run
+        const job = jobs.createJob('qr-generation', req.query.job_id);
+        jobs.updateJob(job, { total: 0, generated: 0, skipped: 0, failed: 0 });
 
-        for (const user of users) {
-            if (!user.is_scanned) {
-                const qrData = {
-                    token: user.token,
-                    name: user.name,
-                    type: 'food-token'
-                };
-
-                const qrCodePath = path.join(qrCodeDir, `${user.token}.png`);
-                
-                await QRCode.toFile(qrCodePath, JSON.stringify(qrData), {
-                    color: {
-                        dark: '#000000',
-                        light: '#FFFFFF'
-                    },
-                    width: 300
+        db.getAllUsers()
+            .then((users) => {
+                users = users.filter(user => !user.is_scanned);
+                jobs.updateJob(job, { total: users.length, generated: 0, skipped: 0, failed: 0 });
+                return generateQRCodes(users, (progress) => {
+                    jobs.updateJob(job, progress);
                 });
+            })
+            .then(async ({ progress: summary, references }) => {
+                await db.recordQRArtifacts(references);
+                console.log(`QR generation completed: ${summary.generated} generated, ${summary.skipped} unchanged, ${summary.failed} failed`);
+                jobs.finishJob(job, { ...summary, count: summary.generated + summary.skipped });
+            })
+            .catch((error) => {
+                console.error('Error generating QR codes:', error);
+                jobs.failJob(job, error);
+            });
 
-                generatedCodes.push({
-                    name: user.name,
-                    token: user.token,
-                    food_preference: user.food_preference,
-                    qr_path: `qr-codes/${user.token}.png`
-                });
-            }
-        }
-
-        res.json({
-            message: 'QR codes generated successfully',
-            count: generatedCodes.length,
-            codes: generatedCodes
+        res.status(202).json({
+            message: 'QR code generation started',
+            job_id: job.id
         });
 
     } catch (error) {
@@ -169,77 +233,185 @@ app.post('/api/generate-qr-codes', async (req, res) => {
     }
 });
 
-app.get('/api/download-qr-codes', (req, res) => {
-    const qrCodeDir = path.join(__dirname, 'qr-codes');
-    const archive = archiver('zip', { zlib: { level: 9 } });
-
-    res.attachment('qr-codes.zip');
-    archive.pipe(res);
+app.get('/api/download-qr-codes', async (req, res) => {
+    try {
+        // Every user's PNG from the QR store, named <ab>/<cd>/<token>.png as before;
+        // any not rendered yet are rendered before the archive is built
+        const users = await db.getAllUsers();
+        const entries = users.map(user => ({
+            name: qrRelativePath(user.token),
+            path: artifactPath(qrFingerprint(qrPayload(user)))
+        }));
+        const archive = await getCachedArchive(entries, 'qr-codes', async () => {
+            const { references } = await generateQRCodes(users);
+            await db.recordQRArtifacts(references);
+        });
 
-    archive.directory(qrCodeDir, false);
-    archive.finalize();
+        // sendFile handles Content-Length, Range and If-None-Match against this ETag
+        res.set('ETag', `"${archive.hash}"`);
+        res.attachment('qr-codes.zip');
+        res.sendFile(archive.path, (err) => {
+            if (err && !res.headersSent) {
+                console.error('Error sending QR code archive:', err);
+                res.status(500).json({ error: 'Error downloading QR codes' });
+            }
+        });
+    } catch (error) {
+        console.error('Error building QR code archive:', error);
+        res.status(500).json({ error: 'Error downloading QR codes' });
+    }
 });
 
-app.post('/api/scan', async (req, res) => {
+// Signed tokens with a bad MAC are rejected here without a database lookup
+async function findUserByToken(token) {
+    if (checkToken(token) === 'invalid') {
+        return null;
+    }
+    return db.getUserByToken(token);
+}
+
+// QR code PNG rendered on first request; pre-generating with /api/generate-qr-codes is optional.
+// Links carrying the current fingerprint (?v=, also the ETag) never change and
+// are cached for good; the bare URL is revalidated with If-None-Match.
+app.get('/api/qr/:token', async (req, res) => {
     try {
-        const { qrData } = req.body;
-        
-        if (!qrData) {
-            return res.status(400).json({ error: 'No QR data provided' });
+        const user = await findUserByToken(req.params.token);
+        if (!user) {
+            return res.status(404).json({ error: 'Token not found' });
         }
 
-        let user = null;
-        let isUSNEntry = false;
+        const fingerprint = qrFingerprint(qrPayload(user));
+        res.set('ETag', `"${fingerprint}"`);
+        res.set('Cache-Control', req.query.v === fingerprint
+            ? 'public, max-age=31536000, immutable'
+            : 'no-cache');
+        if (req.fresh) {
+            return res.status(304).end();
+        }
 
-        // First, try to parse as JSON (QR code format)
-        try {
-            const tokenData = JSON.parse(qrData);
-            user = await db.getUserByToken(tokenData.token);
-        } catch (e) {
-            // If JSON parsing fails, check if it's a USN or direct token
-            const cleanInput = qrData.trim().toUpperCase();
-            
+        const startTime = process.hrtime.bigint();
+        const qr = await renderQR(user);
+        const elapsedMs = Number(process.hrtime.bigint() - startTime) / 1e6;
+        if (qr.source === 'render') {
+            db.recordQRArtifacts([{ user_id: user.id, kind: 'png', key: qr.fingerprint }])
+                .catch(error => console.error('Error recording QR artifact:', error));
+        }
+        res.set('Server-Timing', `qr;desc="${qr.source}";dur=${elapsedMs.toFixed(2)}`);
+        res.type('png').send(qr.buffer);
+    } catch (error) {
+        console.error('Error rendering QR code:', error);
+        res.status(500).json({ error: 'Error rendering QR code' });
+    }
+});
+
+// Resolve scanned input (QR JSON payload, USN or raw token) to a user row
+async function findScanUser(qrData) {
+    let user = null;
+    let isUSNEntry = false;
+
+    // First, try to parse as JSON (QR code format)
+    try {
+        const tokenData = JSON.parse(qrData);
+        user = await findUserByToken(tokenData.token);
+    } catch (e) {
+        // If JSON parsing fails, check if it's a USN or direct token
+        const cleanInput = qrData.trim().toUpperCase();
+        
+        if (isSignedToken(qrData.trim())) {
+            user = await findUserByToken(qrData.trim());
+        } else if (/^[A-Z0-9]{6,15}$/.test(cleanInput)) {
             // Check if it looks like a USN (contains letters and numbers, typical USN pattern)
-            if (/^[A-Z0-9]{6,15}$/.test(cleanInput)) {
-                // Try USN lookup first
-                user = await db.getUserByUSN(cleanInput);
-                isUSNEntry = true;
-                
-                // If USN not found, try as direct token
-                if (!user) {
-                    user = await db.getUserByToken(qrData.trim());
-                    isUSNEntry = false;
-                }
-            } else {
-                // Try as direct token
+            // Try USN lookup first
+            user = await db.getUserByUSN(cleanInput);
+            isUSNEntry = true;
+            
+            // If USN not found, try as direct token
+            if (!user) {
                 user = await db.getUserByToken(qrData.trim());
+                isUSNEntry = false;
             }
+        } else {
+            // Try as direct token
+            user = await db.getUserByToken(qrData.trim());
         }
-        
-        if (!user) {
-            const errorMsg = isUSNEntry ? 'USN not found in database' : 'Invalid token';
-            return res.status(404).json({ error: errorMsg });
+    }
+
+    return { user, isUSNEntry };
+}
+
+// Event and meal slot ids: letters, digits, '.', '_' and '-'
+const EVENT_ID_PATTERN = /^[A-Za-z0-9._-]{1,64}$/;
+
+// Redemption is per (student, event, meal slot) when the request names an event
+// (event_id / meal_slot in the body or query) or ACTIVE_EVENT is set. Without
+// one, scans use the original single users.is_scanned flag.
+function scanContext(req, source = { ...req.query, ...req.body }) {
+    const eventId = source.event_id || process.env.ACTIVE_EVENT;
+    if (!eventId) {
+        return null;
+    }
+    return {
+        eventId: String(eventId),
+        mealSlot: String(source.meal_slot || process.env.ACTIVE_MEAL_SLOT || DEFAULT_MEAL_SLOT)
+    };
+}
+
+app.post('/api/events', async (req, res) => {
+    try {
+        const { event_id, name, class_name } = req.body;
+        const slots = Array.isArray(req.body.meal_slots) && req.body.meal_slots.length
+            ? req.body.meal_slots.map(String)
+            : [DEFAULT_MEAL_SLOT];
+
+        if (!EVENT_ID_PATTERN.test(event_id || '') || !slots.every(slot => EVENT_ID_PATTERN.test(slot))) {
+            return res.status(400).json({ error: 'event_id and meal_slots must be 1-64 letters, digits, ".", "_" or "-"' });
         }
 
-        if (user.is_scanned) {
-            return res.status(409).json({ 
-                error: 'Token already used',
-                scanned_at: user.scanned_at,
-                user: {
-                    name: user.name,
-                    food_preference: user.food_preference,
-                    usn: user.usn,
-                    class_name: user.class_name
-                }
-            });
+        const result = await db.createEvent({ id: event_id, name, slots, className: class_name || null });
+        res.json({ message: 'Event entitlements granted', ...result });
+    } catch (error) {
+        console.error('Error creating event:', error);
+        res.status(500).json({ error: 'Error creating event' });
+    }
+});
+
+app.get('/api/events', async (req, res) => {
+    try {
+        const events = new Map();
+        for (const row of await db.getEvents()) {
+            if (!events.has(row.event_id)) {
+                events.set(row.event_id, { event_id: row.event_id, name: row.name, created_at: row.created_at, meal_slots: [] });
+            }
+            if (row.meal_slot) {
+                events.get(row.event_id).meal_slots.push({ meal_slot: row.meal_slot, entitled: row.entitled, redeemed: row.redeemed });
+            }
         }
+        res.json({ events: [...events.values()] });
+    } catch (error) {
+        console.error('Error fetching events:', error);
+        res.status(500).json({ error: 'Error fetching events' });
+    }
+});
 
-        await db.markAsScanned(user.token);
-        await db.addScanHistory(user.id, req.ip);
+// Redeems the scanned user; resolves to the { status, body } to send, with
+// replayed set when scanRequest is the key the token was already redeemed with
+async function redeemScan(req, qrData, counter, scanRequest = null) {
+    const { user, isUSNEntry } = await findScanUser(qrData);
 
-        res.json({
+    if (!user) {
+        const errorMsg = isUSNEntry ? 'USN not found in database' : 'Invalid token';
+        return { status: 404, body: { error: errorMsg } };
+    }
+
+    const context = scanContext(req);
+    const redeemed = (scannedAt, replayed = false) => ({
+        status: 200,
+        replayed,
+        body: {
             success: true,
             message: isUSNEntry ? 'USN validated successfully' : 'Token scanned successfully',
+            event_id: context ? context.eventId : undefined,
+            meal_slot: context ? context.mealSlot : undefined,
             user: {
                 name: user.name,
                 food_preference: user.food_preference,
@@ -247,9 +419,98 @@ app.post('/api/scan', async (req, res) => {
                 phone: user.phone,
                 usn: user.usn,
                 class_name: user.class_name,
-                scanned_at: new Date().toISOString()
+                scanned_at: scannedAt
             }
-        });
+        }
+    });
+    const alreadyUsed = (scannedAt, redeemedBy) => {
+        // A retry of the request that redeemed the token gets its success back
+        if (scanRequest && redeemedBy === scanRequest) {
+            return redeemed(scannedAt, true);
+        }
+        return {
+            status: 409,
+            body: {
+                error: 'Token already used',
+                scanned_at: scannedAt,
+                user: {
+                    name: user.name,
+                    food_preference: user.food_preference,
+                    usn: user.usn,
+                    class_name: user.class_name
+                }
+            }
+        };
+    };
+
+    if (context) {
+        // One indexed update; the lookup only runs when it did not redeem
+        if (await db.redeemEntitlement(user.id, context.eventId, context.mealSlot, counter, null, scanRequest) === 0) {
+            const entitlement = await db.getEntitlement(user.id, context.eventId, context.mealSlot);
+            if (!entitlement) {
+                return {
+                    status: 403,
+                    body: {
+                        error: 'Not entitled to this meal',
+                        event_id: context.eventId,
+                        meal_slot: context.mealSlot,
+                        user: { name: user.name, usn: user.usn, class_name: user.class_name }
+                    }
+                };
+            }
+            return alreadyUsed(entitlement.redeemed_at, entitlement.scan_request);
+        }
+    } else {
+        if (user.is_scanned) {
+            return alreadyUsed(user.scanned_at, user.scan_request);
+        }
+
+        // Another counter (or replica) may have redeemed the token since it was read
+        if (await db.markAsScanned(user.token, scanRequest) === 0) {
+            const current = await db.getUserByToken(user.token);
+            return alreadyUsed(current ? current.scanned_at : null, current && current.scan_request);
+        }
+    }
+    await db.addScanHistory(user.id, counter);
+
+    return redeemed(new Date().toISOString());
+}
+
+// A retried or duplicated scan with the same Idempotency-Key gets the first
+// request's success back instead of a 409. Keys are scoped to the counter and
+// stored by the UPDATE that redeems the token, so every worker and replica
+// sees them without an extra write.
+const MAX_IDEMPOTENCY_KEY_LENGTH = 128;
+
+function countDuplicates(counter, counts) {
+    db.countDuplicateScans(counter, counts).catch(error => console.error('Error counting duplicate scans:', error));
+}
+
+app.post('/api/scan', async (req, res) => {
+    try {
+        const { qrData, counter_id, debounced } = req.body;
+        
+        if (!qrData) {
+            return res.status(400).json({ error: 'No QR data provided' });
+        }
+
+        const counter = String(counter_id || req.ip);
+        const idempotencyKey = req.get('Idempotency-Key');
+        if (idempotencyKey && idempotencyKey.length > MAX_IDEMPOTENCY_KEY_LENGTH) {
+            return res.status(400).json({ error: 'Idempotency-Key is too long' });
+        }
+        // Decodes the scanner suppressed since its last successful request
+        if (Number.isInteger(debounced) && debounced > 0) {
+            countDuplicates(counter, { debounced });
+        }
+
+        const scanRequest = idempotencyKey ? `${counter}:${idempotencyKey}` : null;
+        const result = await redeemScan(req, qrData, counter, scanRequest);
+        if (result.replayed) {
+            countDuplicates(counter, { replayed: 1 });
+            res.set('Idempotent-Replayed', 'true');
+        }
+        res.status(result.status).json(result.body);
 
     } catch (error) {
         console.error('Error scanning token:', error);
@@ -257,10 +518,230 @@ app.post('/api/scan', async (req, res) => {
     }
 });
 
+// Offline scanners queue redemptions and sync them through /api/scan/batch
+const MAX_BATCH_SCANS = 500;
+const CLOCK_SKEW_MS = 5 * 60 * 1000;
+
+// Scanners only receive token digests, so the snapshot cannot be used to forge QR codes
+function tokenDigest(token) {
+    return crypto.createHash('sha256').update(token).digest('hex').slice(0, 16);
+}
+
+// Same format as SQLite CURRENT_TIMESTAMP so client and server times compare as strings
+function toSQLiteTime(date) {
+    return date.toISOString().replace('T', ' ').slice(0, 19);
+}
+
+function normalizeClientTime(value, now) {
+    const time = Date.parse(value);
+    if (Number.isNaN(time) || time > now + CLOCK_SKEW_MS) {
+        return toSQLiteTime(new Date(now));
+    }
+    return toSQLiteTime(new Date(Math.min(time, now)));
+}
+
+app.get('/api/scan/snapshot', async (req, res) => {
+    try {
+        const context = scanContext(req);
+        const users = await db.getRosterSnapshot(context || {});
+
+        res.set('Cache-Control', 'no-cache');
+        sendJSON(req, res, {
+            event_id: context ? context.eventId : undefined,
+            meal_slot: context ? context.mealSlot : undefined,
+            digest: 'sha256-64',
+            fields: ['token_digest', 'usn', 'name', 'food_preference', 'class_name', 'is_scanned'],
+            roster: users.map(user => [
+                tokenDigest(user.token),
+                user.usn,
+                user.name,
+                user.food_preference,
+                user.class_name,
+                user.is_scanned ? 1 : 0
+            ])
+        });
+    } catch (error) {
+        console.error('Error building roster snapshot:', error);
+        res.status(500).json({ error: 'Error building roster snapshot' });
+    }
+});
+
+app.post('/api/scan/batch', async (req, res) => {
+    try {
+        const { counter_id, scans } = req.body;
+
+        if (!Array.isArray(scans) || scans.length === 0) {
+            return res.status(400).json({ error: 'No scans provided' });
+        }
+        if (scans.length > MAX_BATCH_SCANS) {
+            return res.status(413).json({ error: `At most ${MAX_BATCH_SCANS} scans per batch` });
+        }
+
+        const counter = String(counter_id || req.ip);
+        const now = Date.now();
+
+        // Apply in client-time order so the outcome does not depend on which counter syncs first
+        // Each queued scan may carry the event it was made for; otherwise the batch's
+        const batchContext = scanContext(req);
+        const entries = scans.map((scan, index) => ({
+            id: scan.id !== undefined ? scan.id : index,
+            qrData: typeof scan.qrData === 'string' ? scan.qrData : '',
+            scannedAt: normalizeClientTime(scan.scanned_at, now),
+            idempotencyKey: typeof scan.idempotency_key === 'string' && scan.idempotency_key.length <= MAX_IDEMPOTENCY_KEY_LENGTH
+                ? scan.idempotency_key
+                : null,
+            context: scan.event_id ? scanContext(req, scan) : batchContext
+        })).sort((a, b) => a.scannedAt.localeCompare(b.scannedAt) || String(a.id).localeCompare(String(b.id)));
+
+        const results = [];
+        const doubleRedemptions = [];
+
+        for (const entry of entries) {
+            const { user } = entry.qrData ? await findScanUser(entry.qrData) : { user: null };
+
+            if (!user) {
+                results.push({ id: entry.id, status: 'invalid' });
+                continue;
+            }
+
+            const summary = {
+                name: user.name,
+                usn: user.usn,
+                food_preference: user.food_preference,
+                class_name: user.class_name
+            };
+            // Queued after an online attempt that timed out but redeemed the token
+            if (entry.idempotencyKey) {
+                const redeemed = entry.context
+                    ? await db.getEntitlement(user.id, entry.context.eventId, entry.context.mealSlot)
+                    : user;
+                if (redeemed && redeemed.scan_request === `${counter}:${entry.idempotencyKey}`) {
+                    countDuplicates(counter, { replayed: 1 });
+                    results.push({ id: entry.id, status: 'already_synced', user: summary });
+                    continue;
+                }
+            }
+
+            const history = await db.getScanHistoryForUser(user.id);
+
+            // A retried batch re-sends scans that were already recorded
+            if (history.some(row => row.scanner_info === counter && row.scanned_at === entry.scannedAt)) {
+                results.push({ id: entry.id, status: 'already_synced', user: summary });
+                continue;
+            }
+
+            let changes;
+            let previous;
+            if (entry.context) {
+                const { eventId, mealSlot } = entry.context;
+                const entitlement = await db.getEntitlement(user.id, eventId, mealSlot);
+                if (!entitlement) {
+                    results.push({ id: entry.id, status: 'not_entitled', user: summary });
+                    continue;
+                }
+                changes = await db.redeemEntitlement(user.id, eventId, mealSlot, counter, entry.scannedAt);
+                previous = entitlement.redeemed_at || !changes
+                    ? { counter_id: entitlement.counter, scanned_at: entitlement.redeemed_at }
+                    : null;
+            } else {
+                changes = await db.redeemToken(user.token, entry.scannedAt);
+                previous = user.is_scanned || !changes
+                    ? { counter_id: history.length ? history[0].scanner_info : null, scanned_at: user.scanned_at }
+                    : null;
+            }
+
+            // The meal was already handed out at the counter, so every queued scan is recorded
+            await db.addScanHistory(user.id, counter, entry.scannedAt);
+
+            if (changes && !previous) {
+                results.push({ id: entry.id, status: 'redeemed', user: summary });
+                continue;
+            }
+
+            const winner = changes
+                ? { counter_id: counter, scanned_at: entry.scannedAt }
+                : previous;
+
+            results.push({ id: entry.id, status: changes ? 'redeemed' : 'duplicate', user: summary, first_scan: winner });
+            doubleRedemptions.push({
+                user: summary,
+                first_scan: winner,
+                redemptions: history
+                    .map(row => ({ counter_id: row.scanner_info, scanned_at: row.scanned_at }))
+                    .concat({ counter_id: counter, scanned_at: entry.scannedAt })
+            });
+            console.warn(`Double redemption for ${user.name} (${user.usn || user.token}) reported by counter ${counter}`);
+        }
+
+        res.json({
+            counter_id: counter,
+            processed: results.length,
+            redeemed: results.filter(r => r.status === 'redeemed').length,
+            duplicates: results.filter(r => r.status === 'duplicate').length,
+            invalid: results.filter(r => r.status === 'invalid').length,
+            not_entitled: results.filter(r => r.status === 'not_entitled').length,
+            results,
+            double_redemptions: doubleRedemptions
+        });
+
+    } catch (error) {
+        console.error('Error syncing scan batch:', error);
+        res.status(500).json({ error: 'Error processing scan batch' });
+    }
+});
+
+function encodeCursor(row) {
+    return Buffer.from(JSON.stringify([row.created_at, row.id])).toString('base64url');
+}
+
+function decodeCursor(cursor) {
+    try {
+        const [created_at, id] = JSON.parse(Buffer.from(cursor, 'base64url').toString());
+        return Number.isInteger(id) ? { created_at, id } : null;
+    } catch (e) {
+        return null;
+    }
+}
+
 app.get('/api/users', async (req, res) => {
     try {
-        const users = await db.getAllUsers();
-        res.json(users);
+        const { cursor, fields, q } = req.query;
+        const limit = Math.min(Math.max(parseInt(req.query.limit, 10) || 100, 1), 500);
+
+        const after = cursor ? decodeCursor(cursor) : null;
+        if (cursor && !after) {
+            return res.status(400).json({ error: 'Invalid cursor' });
+        }
+
+        const foodPreference = req.query.food_preference;
+        if (foodPreference && !['veg', 'non-veg'].includes(foodPreference)) {
+            return res.status(400).json({ error: 'food_preference must be veg or non-veg' });
+        }
+
+        let scanned;
+        if (req.query.scanned !== undefined && req.query.scanned !== '') {
+            scanned = ['1', 'true', 'yes'].includes(String(req.query.scanned).toLowerCase());
+        }
+
+        // Fetch one extra row to know whether another page follows
+        const rows = await db.getUsersPage({
+            columns: fields ? String(fields).split(',').map(f => f.trim()) : null,
+            className: req.query.class_name || null,
+            foodPreference: foodPreference || null,
+            scanned,
+            search: q ? String(q).trim() : null,
+            after,
+            limit: limit + 1
+        });
+
+        const hasMore = rows.length > limit;
+        const users = hasMore ? rows.slice(0, limit) : rows;
+
+        sendJSON(req, res, {
+            users,
+            count: users.length,
+            next_cursor: hasMore ? encodeCursor(users[users.length - 1]) : null
+        });
     } catch (error) {
         console.error('Error fetching users:', error);
         res.status(500).json({ error: 'Error fetching users' });
@@ -269,7 +750,10 @@ app.get('/api/users', async (req, res) => {
 
 app.get('/api/stats', async (req, res) => {
     try {
-        const stats = await db.getScanStats();
+        // ?event_id= (and optionally &meal_slot=) for one event's entitlements
+        const stats = await db.getScanStats(req.query.event_id
+            ? { eventId: String(req.query.event_id), mealSlot: req.query.meal_slot ? String(req.query.meal_slot) : null }
+            : {});
         res.json(stats);
     } catch (error) {
         console.error('Error fetching stats:', error);
@@ -277,17 +761,47 @@ app.get('/api/stats', async (req, res) => {
     }
 });
 
+// Per-minute throughput by counter, from the scan_history rollups
+app.get('/api/analytics/throughput', async (req, res) => {
+    try {
+        // Cheap: only folds in scans recorded since the last compaction
+        const throughId = await db.compactScanRollups();
+        const rows = await db.getScanRollups({
+            counter: req.query.counter,
+            from: req.query.from,
+            to: req.query.to
+        });
+
+        sendJSON(req, res, {
+            through_id: throughId,
+            ...summarizeThroughput(rows),
+            series: req.query.series === '0' ? undefined : rows
+        });
+    } catch (error) {
+        console.error('Error fetching throughput analytics:', error);
+        res.status(500).json({ error: 'Error fetching analytics' });
+    }
+});
+
+// Duplicate decodes per counter: suppressed by the scanner or answered from an idempotency key
+app.get('/api/analytics/duplicates', async (req, res) => {
+    try {
+        const counters = await db.getDuplicateScanCounts();
+        res.json({
+            debounced: counters.reduce((sum, row) => sum + row.debounced, 0),
+            replayed: counters.reduce((sum, row) => sum + row.replayed, 0),
+            counters
+        });
+    } catch (error) {
+        console.error('Error fetching duplicate scan counts:', error);
+        res.status(500).json({ error: 'Error fetching analytics' });
+    }
+});
+
 app.delete('/api/clear-data', async (req, res) => {
     try {
+        // Stored QR images are no longer referenced; `python qr_store.py gc` reclaims them
         await db.clearAllData();
-        
-        const qrCodeDir = path.join(__dirname, 'qr-codes');
-        if (fs.existsSync(qrCodeDir)) {
-            const files = fs.readdirSync(qrCodeDir);
-            for (const file of files) {
-                fs.unlinkSync(path.join(qrCodeDir, file));
-            }
-        }
 
         res.json({ message: 'All data cleared successfully' });
     } catch (error) {
@@ -296,14 +810,58 @@ app.delete('/api/clear-data', async (req, res) => {
     }
 });
 
-app.listen(PORT, () => {
+// One process compacts rollups in the background; with LEDGER_URL the ledger does it
+const ROLLUP_INTERVAL_MS = parseInt(process.env.ROLLUP_INTERVAL_MS, 10) || 60000;
+function startRollupCompaction() {
+    setInterval(() => {
+        db.compactScanRollups().catch(error => console.error('Error compacting scan rollups:', error));
+    }, ROLLUP_INTERVAL_MS).unref();
+}
+
+if (!process.env.LEDGER_URL) {
+    if (cluster.isWorker) {
+        // The primary picks one live worker, and picks again if that one exits
+        process.on('message', (message) => {
+            if (message && message.type === 'rollup-compactor') {
+                startRollupCompaction();
+            }
+        });
+        process.send({ type: 'rollup-ready' });
+    } else {
+        startRollupCompaction();
+    }
+}
+
+const server = app.listen(PORT, () => {
+    if (cluster.isWorker) {
+        console.log(`Worker ${process.pid} listening on port ${PORT}`);
+        return;
+    }
     console.log(`Food Token Scanner Server running on port ${PORT}`);
     console.log(`Admin Dashboard: http://localhost:${PORT}/admin`);
     console.log(`Scanner Interface: http://localhost:${PORT}/scanner`);
 });
 
-process.on('SIGINT', () => {
-    console.log('Shutting down server...');
-    db.close();
-    process.exit(0);
-});
+// Stop accepting connections, let in-flight scans finish, then close the database
+let shuttingDown = false;
+function shutdown(signal) {
+    if (shuttingDown) {
+        return;
+    }
+    shuttingDown = true;
+    console.log(`${signal} received, shutting down server...`);
+
+    server.close(() => {
+        db.close();
+        process.exit(0);
+    });
+    server.closeIdleConnections();
+
+    setTimeout(() => {
+        console.error('In-flight requests did not finish in time, forcing shutdown');
+        process.exit(1);
+    }, SHUTDOWN_TIMEOUT_MS).unref();
+}
+
+process.on('SIGINT', () => shutdown('SIGINT'));
+process.on('SIGTERM', () => shutdown('SIGTERM'));
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Online Database Snapshot
+Copies the live database to a consistent point-in-time snapshot with SQLite's
+online backup API, a few hundred pages at a time with a short pause between
+steps, so reports and email distribution runs can read the copy while the
+scanner keeps writing to the original.
+
+The database runs in WAL mode, so the copy pins one read snapshot for its
+whole duration: WAL readers never block writers, and scans committed during
+the copy neither stall it nor force it to start over.
+
+Next to each snapshot, <snapshot>.source.json records the size and mtime of
+the database and its WAL when the copy started. A snapshot is only reused
+while they are unchanged, so a run that follows an import never reads the
+roster from before it.
+
+Usage:
+    python snapshot_db.py                          # database/food_tokens.db -> database/food_tokens.snapshot.db
+    python snapshot_db.py --out reports/event.db   # somewhere else
+    python snapshot_db.py --pages 1024 --sleep-ms 0
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import profiling
+
+DB_PATH = 'database/food_tokens.db'
+
+# Pages copied per backup step (4 KB each) and the pause between steps
+SNAPSHOT_PAGES = 256
+SNAPSHOT_SLEEP_MS = 2
+
+# Reporting runs reuse a snapshot younger than this, if nothing was written since, instead of taking a new one
+SNAPSHOT_MAX_AGE = 300
+
+
+def snapshot_path(db_path=DB_PATH):
+    """database/food_tokens.db -> database/food_tokens.snapshot.db"""
+    return os.path.splitext(db_path)[0] + '.snapshot.db'
+
+
+def source_signature(db_path):
+    """[mtime_ns, size] of the database and its WAL (None when absent); a commit changes one of them"""
+    signature = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+            signature.append([stat.st_mtime_ns, stat.st_size])
+        except FileNotFoundError:
+            signature.append(None)
+    return signature
+
+
+def read_source_signature(out_path):
+    """Signature recorded with a snapshot, or None when it has none"""
+    try:
+        with open(out_path + '.source.json') as f:
+            return json.load(f)['source']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def take_snapshot(db_path=DB_PATH, out_path=None, pages=SNAPSHOT_PAGES, sleep_ms=SNAPSHOT_SLEEP_MS,
+                  progress=None):
+    """Copy db_path to out_path (default snapshot_path(db_path)); returns (out_path, pages, seconds).
+    progress(remaining, total) is called after every step."""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database not found: {db_path}")
+    out_path = out_path or snapshot_path(db_path)
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    # Built under a temporary name so a reader of the previous snapshot is never disturbed
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+
+    started = time.perf_counter()
+    copied = 0
+
+    def on_step(status, remaining, total):
+        nonlocal copied
+        copied = total
+        if progress:
+            progress(remaining, total)
+        # backup() itself only sleeps after a busy step; pause after every step so
+        # the copy never monopolizes the disk the scanner is committing to
+        if remaining and sleep_ms:
+            time.sleep(sleep_ms / 1000)
+
+    # Taken before the copy starts, so a write that lands during the copy makes it look stale
+    signature = source_signature(db_path)
+    source = sqlite3.connect(db_path, isolation_level=None, timeout=5)
+    try:
+        wal = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if wal:
+            # Without an open read transaction every step starts a new one and a
+            # write in between restarts the copy from page 1
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+        target = sqlite3.connect(tmp_path, isolation_level=None)
+        try:
+            source.backup(target, pages=pages, progress=on_step, sleep=sleep_ms / 1000)
+            # A snapshot is read-only: keep readers from creating -wal/-shm files next to it
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+
+        if wal:
+            source.execute('COMMIT')
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+
+    os.replace(tmp_path, out_path)
+    with open(tmp_path, 'w') as f:
+        json.dump({'source': signature}, f)
+    os.replace(tmp_path, out_path + '.source.json')
+    return out_path, copied, time.perf_counter() - started
+
+
+def snapshot_connection(db_path=DB_PATH, max_age=SNAPSHOT_MAX_AGE):
+    """Read-only connection to a snapshot of db_path no older than max_age seconds
+    and taken since the last write to db_path"""
+    out_path = snapshot_path(db_path)
+    try:
+        age = time.time() - os.path.getmtime(out_path)
+    except OSError:
+        age = None
+
+    if age is None or age > max_age or read_source_signature(out_path) != source_signature(db_path):
+        _, pages, seconds = take_snapshot(db_path, out_path)
+        print(f"📸 Snapshot of {db_path} taken ({pages} pages in {seconds:.2f}s)")
+    else:
+        print(f"📸 Reading snapshot of {db_path} from {age:.0f}s ago")
+
+    return sqlite3.connect(f"file:{os.path.abspath(out_path)}?mode=ro", uri=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the live database to a point-in-time snapshot")
+    parser.add_argument('--db', default=DB_PATH, help=f"database file (default {DB_PATH})")
+    parser.add_argument('--out', help=f"snapshot file (default {snapshot_path(DB_PATH)})")
+    parser.add_argument('--pages', type=int, default=SNAPSHOT_PAGES,
+                        help=f"pages copied per step (default {SNAPSHOT_PAGES}; -1 copies everything in one step)")
+    parser.add_argument('--sleep-ms', type=float, default=SNAPSHOT_SLEEP_MS,
+                        help=f"pause between steps in milliseconds (default {SNAPSHOT_SLEEP_MS})")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+
+    def report(remaining, total):
+        if total:
+            print(f"\r📸 {total - remaining}/{total} pages copied", end='', flush=True)
+
+    out_path, pages, seconds = take_snapshot(args.db, args.out, args.pages, args.sleep_ms, report)
+    print(f"\n✅ Snapshot written to {out_path} ({pages} pages, "
+          f"{os.path.getsize(out_path) / 1024 / 1024:.1f} MB in {seconds:.2f}s)")
+
+
+if __name__ == "__main__":
+    profiling.configure_from_argv()
+    with profiling.stage('snapshot'):
+        main()
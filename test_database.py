@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
-import sqlite3
 import json
 
+from snapshot_db import snapshot_connection
+
 def test_database_tokens():
     db_path = 'database/food_tokens.db'
     
     try:
-        conn = sqlite3.connect(db_path)
+        # Read a snapshot so the check never holds up a running scanner
+        conn = snapshot_connection(db_path)
         cursor = conn.cursor()
         
         # Get first 5 tokens from database
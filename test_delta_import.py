@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Delta Import Removal Test
+Imports a roster into a throwaway database, then imports an export without
+three of the students with --remove, and checks that only the one who never
+ate is removed: a student with is_scanned set and one who redeemed an event
+meal slot both keep their rows, entitlements and scan history.
+"""
+import csv
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from delta_import import delta_import
+
+COLUMNS = ['Enter Your Name', 'Enter Your College Mail ID', 'Enter Your USN', 'Class',
+           'What kind of food do you prefer']
+
+STUDENTS = [
+    ('Asha Rao', 'asha@sahyadri.edu.in', '4SF22CS001', 'CSE A', 'Veg'),
+    ('Bharath K', 'bharath@sahyadri.edu.in', '4SF22CS002', 'CSE A', 'Non-Veg'),
+    ('Chitra M', 'chitra@sahyadri.edu.in', '4SF22CS003', 'CSE B', 'Veg'),
+    ('Deepak S', 'deepak@sahyadri.edu.in', '4SF22CS004', 'CSE B', 'Non-Veg'),
+]
+
+# Same tables database.js creates for events
+EVENT_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS events (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS entitlements (
+        user_id INTEGER NOT NULL,
+        event_id TEXT NOT NULL,
+        meal_slot TEXT NOT NULL,
+        redeemed_at DATETIME,
+        counter TEXT,
+        PRIMARY KEY (user_id, event_id, meal_slot)
+    ) WITHOUT ROWID;
+'''
+
+
+def write_export(path, students):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(students)
+
+
+def test_remove_keeps_redeemed_entitlements():
+    workdir = tempfile.mkdtemp(prefix='food-token-delta-')
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        db_path = os.path.join('database', 'food_tokens.db')
+        write_export('roster.csv', STUDENTS)
+        delta_import('roster.csv', db_path, 'qr_codes_jpeg', send=False)
+
+        conn = sqlite3.connect(db_path)
+        conn.executescript(EVENT_SCHEMA)
+        ids = {usn: user_id for user_id, usn in conn.execute('SELECT id, usn FROM users')}
+        with conn:
+            conn.execute("INSERT INTO events (id, name) VALUES ('fest', 'Fest')")
+            conn.executemany("INSERT INTO entitlements (user_id, event_id, meal_slot) VALUES (?, 'fest', 'lunch')",
+                             [(user_id,) for user_id in ids.values()])
+            # Bharath ate at the event; Chitra was scanned without one
+            conn.execute("UPDATE entitlements SET redeemed_at = CURRENT_TIMESTAMP, counter = 'c1' WHERE user_id = ?",
+                         (ids['4SF22CS002'],))
+            conn.execute('UPDATE users SET is_scanned = 1, scanned_at = CURRENT_TIMESTAMP WHERE id = ?',
+                         (ids['4SF22CS003'],))
+            conn.executemany("INSERT INTO scan_history (user_id, scanner_info) VALUES (?, 'c1')",
+                             [(ids['4SF22CS002'],), (ids['4SF22CS003'],)])
+        conn.close()
+
+        # Only Asha is still in the export
+        write_export('late.csv', STUDENTS[:1])
+        summary = delta_import('late.csv', db_path, 'qr_codes_jpeg', remove=True, send=False)
+
+        conn = sqlite3.connect(db_path)
+        remaining = {usn for (usn,) in conn.execute('SELECT usn FROM users')}
+        entitlements = {user_id for (user_id,) in conn.execute(
+            'SELECT user_id FROM entitlements WHERE redeemed_at IS NOT NULL')}
+        history = {user_id for (user_id,) in conn.execute('SELECT user_id FROM scan_history')}
+        conn.close()
+
+        assert summary['not_in_export'] == 3, f"{summary['not_in_export']} students reported missing, expected 3"
+        assert summary['removed'] == 1, f"{summary['removed']} students removed, expected only Deepak"
+        assert remaining == {'4SF22CS001', '4SF22CS002', '4SF22CS003'}, f"Students left: {sorted(remaining)}"
+        assert entitlements == {ids['4SF22CS002']}, "The redeemed meal slot was lost"
+        assert history == {ids['4SF22CS002'], ids['4SF22CS003']}, "Scan history of a kept student was lost"
+
+        print("✅ Students who redeemed a meal slot or were scanned are kept by --remove")
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    try:
+        test_remove_keeps_redeemed_entitlements()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Replica Redemption Test
+Starts one ledger service and several server.js replicas against a throwaway
+database, then scans the same tokens concurrently through every replica and
+checks that each token is redeemed exactly once, and that a retry with the
+same Idempotency-Key on another replica gets the original success back.
+"""
+import http.client
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from load_test_scan import seed_roster
+
+LEDGER_PORT = 4900
+REPLICA_PORTS = [3901, 3902, 3903]
+STUDENTS = 200
+SCANS_PER_TOKEN = 6  # concurrent attempts per token, spread over the replicas
+
+
+def start_process(script, env):
+    return subprocess.Popen(
+        ['node', script],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, **env),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_for(port, path):
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', path)
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def scan(port, token, counter_id=None, idempotency_key=None):
+    """HTTP status of one scan, and whether it was answered as a replay"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body = json.dumps({'qrData': json.dumps({'token': token, 'type': 'food-token'}),
+                       'counter_id': counter_id or f"replica-{port}"})
+    headers = {'Content-Type': 'application/json'}
+    if idempotency_key:
+        headers['Idempotency-Key'] = idempotency_key
+    conn.request('POST', '/api/scan', body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status, response.getheader('Idempotent-Replayed') == 'true'
+
+
+def start_replicas(db_path):
+    """Ledger plus one server.js per replica port; returns the processes"""
+    processes = [start_process('ledger-server.js', {
+        'DB_PATH': db_path, 'LEDGER_PORT': str(LEDGER_PORT)
+    })]
+    wait_for(LEDGER_PORT, '/health')
+
+    for port in REPLICA_PORTS:
+        processes.append(start_process('server.js', {
+            'PORT': str(port), 'LEDGER_URL': f"http://127.0.0.1:{LEDGER_PORT}"
+        }))
+    for port in REPLICA_PORTS:
+        wait_for(port, '/api/stats')
+    return processes
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def test_no_double_redemption():
+    workdir = tempfile.mkdtemp(prefix='food-token-replicas-')
+    db_path = os.path.join(workdir, 'food_tokens.db')
+    students = seed_roster(db_path, STUDENTS, random.Random(7))
+    processes = []
+
+    try:
+        processes = start_replicas(db_path)
+
+        print(f"🧪 {STUDENTS} tokens x {SCANS_PER_TOKEN} concurrent scans over {len(REPLICA_PORTS)} replicas")
+
+        attempts = [(REPLICA_PORTS[i % len(REPLICA_PORTS)], student['token'])
+                    for student in students for i in range(SCANS_PER_TOKEN)]
+        random.Random(7).shuffle(attempts)
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = [status for status, _ in pool.map(lambda attempt: scan(*attempt), attempts)]
+
+        successes = {}
+        for (port, token), status in zip(attempts, statuses):
+            assert status in (200, 409), f"Unexpected HTTP {status} for {token}"
+            if status == 200:
+                successes[token] = successes.get(token, 0) + 1
+
+        doubles = {token: count for token, count in successes.items() if count > 1}
+        assert not doubles, f"Tokens redeemed more than once: {doubles}"
+        assert len(successes) == STUDENTS, f"Only {len(successes)}/{STUDENTS} tokens were redeemed"
+
+        conn = sqlite3.connect(db_path)
+        history = conn.execute(
+            'SELECT user_id, COUNT(*) FROM scan_history GROUP BY user_id HAVING COUNT(*) > 1'
+        ).fetchall()
+        scanned = conn.execute('SELECT COUNT(*) FROM users WHERE is_scanned = 1').fetchone()[0]
+        conn.close()
+
+        assert not history, f"Users with more than one scan_history row: {history}"
+        assert scanned == STUDENTS, f"{scanned}/{STUDENTS} users marked as scanned"
+
+        print(f"✅ Every token redeemed exactly once ({len(statuses) - STUDENTS} duplicates rejected)")
+    finally:
+        stop(processes)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def test_retry_on_another_replica():
+    workdir = tempfile.mkdtemp(prefix='food-token-replicas-')
+    db_path = os.path.join(workdir, 'food_tokens.db')
+    students = seed_roster(db_path, 3, random.Random(11))
+    processes = []
+
+    try:
+        processes = start_replicas(db_path)
+        first, retry, other = REPLICA_PORTS
+
+        for n, student in enumerate(students):
+            key = f"retry-{n}"
+            assert scan(first, student['token'], 'counter-1', key) == (200, False), "First scan was not redeemed"
+            # A dropped connection reconnects and usually lands on another replica
+            assert scan(retry, student['token'], 'counter-1', key) == (200, True), \
+                "Retry on another replica was not replayed"
+            assert scan(other, student['token'], 'counter-1', f"again-{n}")[0] == 409, \
+                "A new scan of a redeemed token was not rejected"
+            assert scan(other, student['token'], 'counter-2', key)[0] == 409, \
+                "Another counter's scan with the same key was replayed"
+
+        print("✅ Keyed retries are replayed on every replica and new scans are still rejected")
+    finally:
+        stop(processes)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    try:
+        test_no_double_redemption()
+        test_retry_on_another_replica()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,115 @@
+const crypto = require('crypto');
+const { v4: uuidv4 } = require('uuid');
+
+// Signed tokens look like ft1.<kid>.<id>.<mac>: a random id plus an HMAC-SHA256
+// (first 16 bytes, base64url) under the key named by kid. They can be rejected
+// without touching the database. token_signing.py implements the same format.
+const TOKEN_PREFIX = 'ft1';
+const ID_BYTES = 12;
+const MAC_BYTES = 16;
+const KID_PATTERN = /^[A-Za-z0-9_-]{1,16}$/;
+const SIGNED_PATTERN = /^ft1\.([A-Za-z0-9_-]{1,16})\.([A-Za-z0-9_-]{16})\.([A-Za-z0-9_-]{22})$/;
+
+// TOKEN_KEYS="k2:new-secret,k1:old-secret" - the first key signs new tokens,
+// every listed key verifies. Dropping a key revokes the tokens signed with it.
+function parseKeys(spec) {
+    const keys = new Map();
+    for (const part of (spec || '').split(',')) {
+        const separator = part.indexOf(':');
+        if (separator === -1) {
+            continue;
+        }
+        const kid = part.slice(0, separator).trim();
+        const secret = part.slice(separator + 1).trim();
+        if (!KID_PATTERN.test(kid) || !secret) {
+            throw new Error(`Invalid TOKEN_KEYS entry for key "${kid}"`);
+        }
+        keys.set(kid, Buffer.from(secret));
+    }
+    return keys;
+}
+
+const keys = parseKeys(process.env.TOKEN_KEYS);
+const signingKid = keys.size ? keys.keys().next().value : null;
+
+// TOKEN_EVENT="fest-2024" derives each id from the signing key, the event and
+// the student's USN, so re-imports and separate generator runs agree on tokens
+const eventId = (process.env.TOKEN_EVENT || '').trim() || null;
+if (eventId && !signingKid) {
+    throw new Error('TOKEN_EVENT needs TOKEN_KEYS: derived tokens are keyed by the signing secret');
+}
+
+function tokenMac(secret, kid, id) {
+    return crypto.createHmac('sha256', secret)
+        .update(`${TOKEN_PREFIX}.${kid}.${id}`)
+        .digest()
+        .subarray(0, MAC_BYTES);
+}
+
+function signToken(id, kid = signingKid) {
+    const secret = keys.get(kid);
+    if (!secret) {
+        throw new Error(`Unknown token key: ${kid}`);
+    }
+    return `${TOKEN_PREFIX}.${kid}.${id}.${tokenMac(secret, kid, id).toString('base64url')}`;
+}
+
+function deriveToken(usn, event = eventId, kid = signingKid) {
+    const secret = keys.get(kid);
+    const student = (usn || '').trim().toUpperCase();
+    if (!student || !event) {
+        throw new Error('A derived token needs both a USN and an event id');
+    }
+    if (!secret) {
+        throw new Error(`Unknown token key: ${kid}`);
+    }
+    const id = crypto.createHmac('sha256', secret)
+        .update(`${TOKEN_PREFIX}-derive\x1f${event}\x1f${student}`)
+        .digest()
+        .subarray(0, ID_BYTES)
+        .toString('base64url');
+    return signToken(id, kid);
+}
+
+// Derived token when TOKEN_EVENT is set, else signed when TOKEN_KEYS is set,
+// otherwise a legacy UUID
+function newToken(usn) {
+    if (eventId) {
+        return deriveToken(usn);
+    }
+    if (!signingKid) {
+        return uuidv4();
+    }
+    return signToken(crypto.randomBytes(ID_BYTES).toString('base64url'));
+}
+
+function isSignedToken(token) {
+    return typeof token === 'string' && token.startsWith(`${TOKEN_PREFIX}.`);
+}
+
+// 'valid' for a correctly signed token, 'legacy' for anything in the old
+// format (which still needs a lookup), 'invalid' for a forged or damaged one
+function checkToken(token) {
+    if (!isSignedToken(token)) {
+        return 'legacy';
+    }
+    const match = SIGNED_PATTERN.exec(token);
+    const secret = match && keys.get(match[1]);
+    if (!secret) {
+        return 'invalid';
+    }
+    const expected = tokenMac(secret, match[1], match[2]);
+    const actual = Buffer.from(match[3], 'base64url');
+    return actual.length === expected.length && crypto.timingSafeEqual(actual, expected)
+        ? 'valid'
+        : 'invalid';
+}
+
+module.exports = {
+    checkToken,
+    deriveToken,
+    isSignedToken,
+    newToken,
+    parseKeys,
+    signToken
+};
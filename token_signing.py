@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Signed food tokens, shared with token-signing.js.
+
+A signed token looks like ft1.<kid>.<id>.<mac>: a random id plus the first
+16 bytes of HMAC-SHA256 under the key named by kid, both base64url. The
+server rejects a forged or mistyped token without a database lookup.
+
+Keys come from TOKEN_KEYS="k2:new-secret,k1:old-secret". The first key signs
+new tokens and every listed key verifies. Without TOKEN_KEYS new tokens are
+plain UUIDs, and UUID tokens are always accepted.
+
+With TOKEN_EVENT="fest-2024" as well, the id is derived from the signing key,
+the event id and the student's USN instead of being random. The same student
+always gets the same token for an event, so slices of the roster can be
+generated on separate machines and a lost token can be re-derived:
+
+    python token_signing.py --event fest-2024 4SF21CS001
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import uuid
+
+TOKEN_PREFIX = 'ft1'
+ID_BYTES = 12
+MAC_BYTES = 16
+KID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,16}$')
+SIGNED_PATTERN = re.compile(r'^ft1\.([A-Za-z0-9_-]{1,16})\.([A-Za-z0-9_-]{16})\.([A-Za-z0-9_-]{22})$')
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def parse_keys(spec):
+    keys = {}
+    for part in (spec or '').split(','):
+        if ':' not in part:
+            continue
+        kid, secret = (piece.strip() for piece in part.split(':', 1))
+        if not KID_PATTERN.match(kid) or not secret:
+            raise ValueError(f'Invalid TOKEN_KEYS entry for key "{kid}"')
+        keys[kid] = secret.encode()
+    return keys
+
+
+KEYS = parse_keys(os.environ.get('TOKEN_KEYS'))
+SIGNING_KID = next(iter(KEYS), None)
+EVENT_ID = os.environ.get('TOKEN_EVENT', '').strip() or None
+if EVENT_ID and not KEYS:
+    raise ValueError("TOKEN_EVENT needs TOKEN_KEYS: derived tokens are keyed by the signing secret")
+
+
+def token_mac(secret, kid, token_id):
+    return hmac.new(secret, f"{TOKEN_PREFIX}.{kid}.{token_id}".encode(), hashlib.sha256).digest()[:MAC_BYTES]
+
+
+def sign_token(token_id, kid=None, keys=None):
+    keys = KEYS if keys is None else keys
+    kid = kid or next(iter(keys), None)
+    if kid not in keys:
+        raise ValueError(f"Unknown token key: {kid}")
+    return f"{TOKEN_PREFIX}.{kid}.{token_id}.{b64url(token_mac(keys[kid], kid, token_id))}"
+
+
+def derive_token(usn, event_id=None, kid=None, keys=None):
+    """Deterministic signed token for a student (by USN) at an event"""
+    keys = KEYS if keys is None else keys
+    event_id = event_id or EVENT_ID
+    kid = kid or next(iter(keys), None)
+    usn = (usn or '').strip().upper()
+    if not usn or not event_id:
+        raise ValueError("A derived token needs both a USN and an event id")
+    if kid not in keys:
+        raise ValueError(f"Unknown token key: {kid}")
+    message = f"{TOKEN_PREFIX}-derive\x1f{event_id}\x1f{usn}".encode()
+    token_id = b64url(hmac.new(keys[kid], message, hashlib.sha256).digest()[:ID_BYTES])
+    return sign_token(token_id, kid, keys)
+
+
+def new_token(usn=None):
+    """Derived token when TOKEN_EVENT is set, else signed when TOKEN_KEYS is set, else a legacy UUID"""
+    if EVENT_ID:
+        return derive_token(usn)
+    if not SIGNING_KID:
+        return str(uuid.uuid4())
+    return sign_token(b64url(secrets.token_bytes(ID_BYTES)), SIGNING_KID)
+
+
+def check_token(token, keys=None):
+    """'valid', 'legacy' (old format, needs a lookup) or 'invalid'"""
+    keys = KEYS if keys is None else keys
+    if not token.startswith(f"{TOKEN_PREFIX}."):
+        return 'legacy'
+    match = SIGNED_PATTERN.match(token)
+    secret = match and keys.get(match.group(1))
+    if not secret:
+        return 'invalid'
+    expected = b64url(token_mac(secret, match.group(1), match.group(2)))
+    return 'valid' if hmac.compare_digest(expected, match.group(3)) else 'invalid'
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-derive the token for students by USN")
+    parser.add_argument('usns', nargs='+', metavar='USN')
+    parser.add_argument('--event', default=EVENT_ID, required=not EVENT_ID, help="event id (default $TOKEN_EVENT)")
+    parser.add_argument('--kid', help="key that signed the event's tokens (default: current signing key)")
+    args = parser.parse_args()
+
+    for usn in args.usns:
+        print(f"{usn.strip().upper()}\t{derive_token(usn, args.event, args.kid)}")
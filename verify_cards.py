@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+QR Card Verification
+Decodes every generated card in the QR store and checks that it carries the
+token stored for that student in the database, so a bad card is found before
+the student reaches the counter. Cards can also be checked as a phone camera
+might see them (--scale 0.4 --blur 1.5). Decoding runs on every core and only
+new or changed cards are checked again; results are kept in
+database/card-verification.json. Students whose card has not been rendered
+yet (server imports render on first use) are counted and skipped.
+
+Needs OpenCV: pip install opencv-python
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from itertools import product
+from multiprocessing import Pool
+
+import profiling
+import qr_store
+
+DB_PATH = 'database/food_tokens.db'
+STATE_PATH = 'database/card-verification.json'
+
+
+def load_cards(db_path, store_dir=qr_store.STORE_DIR):
+    """([(path, token, name)] for every student with a stored card, number without one).
+    The card is the one recorded in qr_artifacts, else qr_code_path, else the server's PNG."""
+    conn = sqlite3.connect(db_path)
+    try:
+        has_artifacts = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'qr_artifacts'").fetchone()
+        if has_artifacts:
+            rows = conn.execute('''
+                SELECT u.token, u.name, u.qr_code_path, card.artifact_key, png.artifact_key FROM users u
+                LEFT JOIN qr_artifacts card ON card.user_id = u.id AND card.kind = 'card'
+                LEFT JOIN qr_artifacts png ON png.user_id = u.id AND png.kind = 'png'
+                ORDER BY u.id
+            ''').fetchall()
+        else:
+            rows = conn.execute('SELECT token, name, qr_code_path, NULL, NULL FROM users ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+    cards = []
+    unrendered = 0
+    for token, name, qr_code_path, card_key, png_key in rows:
+        path = (card_key and qr_store.artifact_path(card_key, '.jpg', store_dir)
+                or qr_code_path
+                or png_key and qr_store.artifact_path(png_key, '.png', store_dir))
+        if path:
+            cards.append((path, token, name))
+        else:
+            unrendered += 1
+    return cards, unrendered
+
+
+def payload_token(text):
+    """Token from a decoded payload: generate_qr_with_db.py writes 'token', generate_qr_with_emails.py 'id'"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text.strip()
+    if isinstance(data, dict):
+        return str(data.get('token') or data.get('id') or '')
+    return str(data)
+
+
+def condition_label(scale, blur):
+    if scale == 1 and not blur:
+        return 'original'
+    parts = []
+    if scale != 1:
+        parts.append(f"x{scale:g}")
+    if blur:
+        parts.append(f"blur {blur:g}")
+    return ' '.join(parts)
+
+
+def init_worker():
+    import cv2
+    # One decoder per process; the pool already spreads cards across cores
+    cv2.setNumThreads(1)
+    global detectors
+    # The classic detector misses some clean codes that phone scanners read, so a
+    # miss is retried with the ArUco-based detector where this OpenCV has it
+    detectors = [cv2.QRCodeDetector()]
+    if hasattr(cv2, 'QRCodeDetectorAruco'):
+        detectors.append(cv2.QRCodeDetectorAruco())
+
+
+def verify_card(job):
+    """Worker: decode one card under every condition; returns (path, results)"""
+    import cv2
+
+    path, token, conditions = job
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE) if os.path.isfile(path) else None
+    if image is None:
+        return path, [(condition_label(*condition), False, 'unreadable or missing file', 0.0)
+                      for condition in conditions]
+
+    results = []
+    for scale, blur in conditions:
+        view = image
+        if scale != 1:
+            view = cv2.resize(view, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if blur:
+            view = cv2.GaussianBlur(view, (0, 0), blur)
+
+        started = time.perf_counter()
+        for detector in detectors:
+            text, points, _ = detector.detectAndDecode(view)
+            if text:
+                break
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if not text:
+            error = 'no QR code found' if points is None else 'QR code found but not decoded'
+            results.append((condition_label(scale, blur), False, error, elapsed_ms))
+        elif payload_token(text) != token:
+            results.append((condition_label(scale, blur), False, f"decodes to {payload_token(text)[:48]}", elapsed_ms))
+        else:
+            results.append((condition_label(scale, blur), True, '', elapsed_ms))
+    return path, results
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_state(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_path, state):
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def verify_cards(db_path=DB_PATH, store_dir=qr_store.STORE_DIR, scales=(), blurs=(), workers=None,
+                 full=False, state_path=STATE_PATH, csv_path=None, slowest=5):
+    """Returns the list of failed cards, or None when OpenCV is not installed"""
+    try:
+        import cv2  # noqa: F401
+    except ImportError:
+        print("⚠️ OpenCV is not installed (pip install opencv-python); skipping card verification")
+        return None
+
+    conditions = sorted(set(product([1.0] + list(scales), [0.0] + list(blurs))))
+    conditions_key = ' | '.join(condition_label(*condition) for condition in conditions)
+
+    cards, unrendered = load_cards(db_path, store_dir)
+    state = {} if full else load_state(state_path)
+    if state.get('conditions') != conditions_key:
+        state = {}
+    checked = state.get('cards', {})
+
+    # Cards that passed last time and have not changed since are not decoded again
+    pending = []
+    for path, token, name in cards:
+        previous = checked.get(path)
+        if (previous and previous['ok'] and previous['token'] == token
+                and previous['signature'] == file_signature(path)):
+            continue
+        pending.append((path, token, name))
+
+    print(f"🔍 Verifying {len(pending)} of {len(cards)} cards ({len(cards) - len(pending)} unchanged since last pass)")
+    print(f"   Conditions: {conditions_key}")
+    if unrendered:
+        print(f"   Skipping {unrendered} students whose card has not been rendered yet")
+
+    started = time.perf_counter()
+    tokens = {path: token for path, token, _ in pending}
+    timings = []
+    rows = []
+    with Pool(workers, initializer=init_worker) as pool:
+        jobs = ((path, token, conditions) for path, token, _ in pending)
+        for done, (path, results) in enumerate(pool.imap_unordered(verify_card, jobs, chunksize=8), 1):
+            ok = all(passed for _, passed, _, _ in results)
+            checked[path] = {
+                'token': tokens[path],
+                'signature': file_signature(path),
+                'ok': ok,
+                'errors': [f"{label}: {error}" for label, passed, error, _ in results if not passed],
+            }
+            card_ms = sum(ms for _, _, _, ms in results)
+            timings.append((card_ms, path))
+            rows.extend((path, tokens[path], label, int(passed), f"{ms:.2f}", error)
+                        for label, passed, error, ms in results)
+            if done % 500 == 0:
+                print(f"⏳ Verified {done}/{len(pending)} cards...")
+    elapsed = time.perf_counter() - started
+
+    # Forget cards whose student no longer exists
+    live = {path for path, _, _ in cards}
+    state = {'conditions': conditions_key, 'cards': {path: entry for path, entry in checked.items() if path in live}}
+    save_state(state_path, state)
+
+    if csv_path:
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['path', 'token', 'condition', 'ok', 'decode_ms', 'error'])
+            writer.writerows(rows)
+        print(f"📄 Per-card decode times written to {csv_path}")
+
+    failures = [(path, name, checked[path]['errors']) for path, _, name in cards if not checked[path]['ok']]
+
+    print(f"\n📊 CARD VERIFICATION")
+    print("=" * 60)
+    print(f"✅ {len(cards) - len(failures)}/{len(cards)} cards decode to the right token")
+    if timings:
+        decode_ms = sorted(ms for ms, _ in timings)
+        print(f"⏱️ Decoded {len(timings)} cards in {elapsed:.1f}s; per card "
+              f"mean {sum(decode_ms) / len(decode_ms):.1f} ms, "
+              f"p95 {decode_ms[int(0.95 * (len(decode_ms) - 1))]:.1f} ms, max {decode_ms[-1]:.1f} ms")
+        for ms, path in sorted(timings, reverse=True)[:slowest]:
+            print(f"   🐢 {ms:7.1f} ms  {path}")
+    for path, name, errors in failures:
+        print(f"❌ {name}: {path}")
+        for error in errors:
+            print(f"   - {error}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every QR card decodes to its student's token")
+    parser.add_argument('--db', default=DB_PATH, help=f"database file (default {DB_PATH})")
+    parser.add_argument('--store', default=qr_store.STORE_DIR,
+                        help=f"QR store directory (default {qr_store.STORE_DIR}/)")
+    parser.add_argument('--scale', type=float, action='append', default=[],
+                        help="also decode at this fraction of full size, e.g. 0.4 (repeatable)")
+    parser.add_argument('--blur', type=float, action='append', default=[],
+                        help="also decode after a Gaussian blur with this sigma in pixels (repeatable)")
+    parser.add_argument('--workers', type=int, default=None, help="decoding processes (default: all cores)")
+    parser.add_argument('--full', action='store_true', help="decode every card, not just new or changed ones")
+    parser.add_argument('--csv', dest='csv_path', help="write per-card, per-condition decode times to this CSV")
+    parser.add_argument('--slowest', type=int, default=5, help="slowest cards to list (default 5)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+    if any(not 0 < scale <= 1 for scale in args.scale):
+        print("❌ --scale must be between 0 and 1")
+        sys.exit(1)
+
+    failures = verify_cards(args.db, args.store, args.scale, args.blur, args.workers,
+                            args.full, csv_path=args.csv_path, slowest=args.slowest)
+    if failures is None or failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.configure_from_argv()
+    with profiling.stage('verify'):
+        main()